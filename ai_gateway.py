@@ -0,0 +1,260 @@
+# LHTL/ai_gateway.py
+"""
+Resilience layer around the OpenAI client.
+
+* ``build_openai_client`` - client with explicit connect/read timeouts and a sized
+                            HTTP connection pool (the SDK's own retries are disabled)
+* ``TokenBucket``         - requests-per-minute limiter shared by all gunicorn workers
+                            (state in a small file guarded by an fcntl lock)
+* ``CircuitBreaker``      - after repeated upstream failures, fails fast for a cool-down
+                            period instead of tying up workers on a sick upstream
+* ``AIGateway.call``      - runs one API call through all of the above, retrying
+                            429 / 5xx / connection errors with jittered exponential
+                            backoff that honours ``Retry-After``
+
+Callers catch ``AIUnavailableError`` (circuit open, rate budget exhausted, transient
+errors outlasting the retries) and answer 503 with ``retry_after`` seconds.
+
+The OpenAI SDK is imported only when a client is built: it is by far the slowest
+import of the app and most requests never need it.
+"""
+
+import json
+import logging
+import time
+import random
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+try:
+    import fcntl # POSIX only; without it the token bucket is per-process
+except ImportError: # pragma: no cover - Windows dev machines
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class AIUnavailableError(Exception):
+    """The AI upstream can't be called right now; retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(AIUnavailableError):
+    """Raised while the circuit breaker is open."""
+
+
+class RateBudgetExceededError(AIUnavailableError):
+    """Raised when no rate-limit token became available within the wait limit."""
+
+
+class UpstreamRetriesExhaustedError(AIUnavailableError):
+    """Raised when a transient upstream error (429 / 5xx / timeout) persisted through all retries."""
+
+
+def build_openai_client(api_key: str, base_url: str | None = None, connect_timeout: float = 5.0,
+                        read_timeout: float = 60.0, pool_size: int = 10) -> 'openai.OpenAI':
+    """OpenAI client with explicit timeouts and connection pool; retries are left to AIGateway."""
+    import httpx
+    import openai
+
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+    http_client = openai.DefaultHttpxClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+    )
+    return openai.OpenAI(api_key=api_key, base_url=base_url or None, timeout=timeout, max_retries=0,
+                         http_client=http_client)
+
+
+# --- Cross-worker token bucket ---
+class TokenBucket:
+    """
+    ``rate_per_minute`` tokens per minute with bursts up to ``capacity``, shared through
+    ``state_path`` by every process on the host. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, state_path: Path, rate_per_minute: float, capacity: float | None = None):
+        self.state_path = Path(state_path)
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 10.0) # Default burst: 6 seconds' worth
+        self._thread_lock = threading.Lock()
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked_state(self):
+        with self._thread_lock, open(self.state_path, 'a+', encoding='utf-8') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or '{}')
+                except json.JSONDecodeError:
+                    state = {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _try_take(self) -> float:
+        """Takes a token if one is available; otherwise returns the seconds until one is."""
+        with self._locked_state() as state:
+            now = time.time()
+            tokens = state.get("tokens", self.capacity)
+            elapsed = max(0.0, now - state.get("updated", now))
+            tokens = min(self.capacity, tokens + elapsed * self.rate_per_second)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate_per_second
+            state.update(tokens=tokens - 1 if wait == 0.0 else tokens, updated=now)
+            return wait
+
+    def acquire(self, max_wait: float) -> bool:
+        """Blocks until a token is taken (True) or ``max_wait`` seconds would be exceeded (False)."""
+        if self.rate_per_second <= 0:
+            return True
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait = self._try_take()
+            if wait == 0.0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls for
+    ``reset_timeout`` seconds; then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call must not go upstream."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError("AI upstream circuit is open.", max(1.0, remaining))
+            self._trial_in_flight = True # Half-open: this call decides
+
+    def abandon_trial(self):
+        """The half-open trial call never reached the upstream; let the next one try."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    log.warning(f"AI circuit breaker opened after {self._failures} consecutive failures.")
+                self._opened_at = time.monotonic() # (Re)start the cool-down
+
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() >= self._opened_at + self.reset_timeout else "open"
+
+
+# --- Retries ---
+def is_retryable(error: Exception) -> bool:
+    import openai # Already loaded: the error came from a client call
+
+    if isinstance(error, openai.APIConnectionError): # Includes APITimeoutError
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Server-requested delay from `retry-after-ms` / `Retry-After` (seconds or HTTP date)."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AIGateway:
+    """Runs API calls through the rate limiter, the circuit breaker and the retry policy."""
+
+    def __init__(self, rate_limiter: TokenBucket, breaker: CircuitBreaker, max_retries: int = 2,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, max_rate_wait: float = 10.0):
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_rate_wait = max_rate_wait
+
+    def _backoff(self, attempt: int, error: Exception) -> float | None:
+        """Delay before the next attempt, or None if waiting isn't worth it."""
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            return requested if requested <= self.backoff_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)) # Full jitter
+
+    def call(self, func, **kwargs):
+        """Calls ``func(**kwargs)`` (an OpenAI SDK method) with limiting, breaking and retries."""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.before_call()
+            if not self.rate_limiter.acquire(self.max_rate_wait):
+                self.breaker.abandon_trial()
+                raise RateBudgetExceededError("AI request budget exhausted.", self.max_rate_wait)
+            try:
+                result = func(**kwargs)
+            except Exception as e:
+                if not is_retryable(e) or getattr(e, 'status_code', None) == 429:
+                    # The upstream answered (bad request / rate limited): not a health problem
+                    self.breaker.record_success()
+                    if not is_retryable(e):
+                        raise
+                else:
+                    self.breaker.record_failure()
+                delay = self._backoff(attempt, e)
+                if attempt == self.max_retries or delay is None:
+                    retry_after = retry_after_seconds(e) or self.backoff_max
+                    raise UpstreamRetriesExhaustedError(f"AI upstream error after {attempt + 1} attempts: {e}",
+                                                        retry_after) from e
+                log.warning(f"AI call failed ({type(e).__name__}: {e}); retry {attempt + 1}/{self.max_retries} "
+                            f"in {delay:.1f}s.")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
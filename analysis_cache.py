@@ -0,0 +1,131 @@
+# LHTL/analysis_cache.py
+"""
+Content-addressed cache for AI analysis results.
+
+Keys are SHA-256 digests over everything that influences the model output
+(image bytes, texts, model name, prompts, sampling parameters), so a cached
+result is only reused when a fresh call would have been asked the exact same
+thing. Two tiers:
+
+* memory - a bounded per-process LRU (OrderedDict), sub-millisecond hits
+* disk   - one small JSON file per key under ``cache_dir``, shared by all
+           gunicorn workers and surviving restarts
+"""
+
+import os
+import json
+import logging
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+def make_cache_key(*parts) -> str:
+    """Hashes the given parts (str / bytes / numbers / None) into a hex cache key."""
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        else:
+            data = ('' if part is None else str(part)).encode('utf-8')
+        # Length-prefix every part so ("ab", "c") and ("a", "bc") hash differently
+        hasher.update(len(data).to_bytes(8, 'big'))
+        hasher.update(data)
+    return hasher.hexdigest()
+
+
+def file_digest(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class AnalysisCache:
+    """Two-tier (memory LRU + disk) cache of analysis results (JSON-serializable dicts)."""
+
+    def __init__(self, cache_dir: Path, max_memory_entries: int = 256):
+        self.cache_dir = Path(cache_dir)
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json" # Fan out to keep directories small
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False) # Evict least recently used
+
+    def get(self, key: str, count: bool = True) -> dict | None:
+        """Returns the cached value for key, or None on a miss. count=False: not in stats() (polling)."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += count
+                return value
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            value = None
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"Ignoring unreadable analysis cache entry {key[:12]}: {e}")
+            value = None
+        if value is None:
+            with self._lock:
+                self.misses += count
+            return None
+        with self._lock:
+            self.disk_hits += count
+        self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        """Stores value in both tiers. Disk writes are atomic (temp file + rename)."""
+        self._remember(key, value)
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=path.name + '.', dir=path.parent)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The memory tier still serves this worker; other workers will recompute
+            log.warning(f"Could not write analysis cache entry {key[:12]}: {e}")
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+            return
+        with self._lock:
+            self.stores += 1
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "memory_entries": len(self._memory),
+                "memory_capacity": self.max_memory_entries,
+            }
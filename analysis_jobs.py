@@ -0,0 +1,138 @@
+# LHTL/analysis_jobs.py
+"""
+Bounded background job queue for AI analyses.
+
+Jobs run on a per-process thread pool with a fixed concurrency limit. Admission
+is capped (running + queued <= max_workers + max_queue_depth); beyond that
+``submit`` raises ``QueueFullError`` so the endpoint can answer 429 instead of
+piling up work. Job state is written to one JSON file per job, so a status
+request can be answered by any gunicorn worker, not only the one running it.
+"""
+
+import os
+import json
+import logging
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from works_store import utc_now_iso
+
+log = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity (backpressure)."""
+
+
+class AnalysisJobQueue:
+    """Thread-pool job runner with bounded admission and file-backed job state."""
+
+    def __init__(self, jobs_dir: Path, max_workers: int = 2, max_queue_depth: int = 8, job_ttl_seconds: int = 3600):
+        self.jobs_dir = Path(jobs_dir)
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.job_ttl_seconds = job_ttl_seconds
+        self._capacity = max_workers + max_queue_depth
+        self._pending = 0 # Running + queued jobs in this process
+        self._pending_lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+
+    def _get_executor(self):
+        # Created lazily (and re-created after a fork) so preloaded apps don't share a dead pool
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-job')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _write(self, job: dict):
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=job["id"] + '.', dir=self.jobs_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, self._job_path(job["id"]))
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def get(self, job_id: str) -> dict | None:
+        """Returns the job record, or None for unknown / expired / malformed ids."""
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        try:
+            with open(self._job_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def pending_count(self) -> int:
+        """Jobs currently running or queued in this process."""
+        with self._pending_lock:
+            return self._pending
+
+    def _release_slot(self):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def submit(self, kind: str, func, *args) -> dict:
+        """
+        Queues func(*args) -> (result_dict, status_code) as a new job and returns its record.
+        Raises QueueFullError when running + queued jobs are at capacity.
+        """
+        with self._pending_lock:
+            if self._pending >= self._capacity:
+                raise QueueFullError(f"Analysis queue is full ({self.max_workers} running, {self.max_queue_depth} queued).")
+            self._pending += 1
+        job = {"id": str(uuid.uuid4()), "kind": kind, "status": "queued", "createdAt": utc_now_iso()}
+        try:
+            self._write(job)
+            self._get_executor().submit(self._run, dict(job), func, args)
+        except Exception:
+            self._release_slot()
+            raise
+        self._purge_expired()
+        return job
+
+    def _run(self, job, func, args):
+        try:
+            job.update(status="running", startedAt=utc_now_iso())
+            self._write(job)
+            started = time.perf_counter()
+            try:
+                result, status_code = func(*args)
+                job.update(status="succeeded" if status_code < 400 else "failed", result=result, statusCode=status_code)
+            except Exception as e:
+                log.error(f"Analysis job {job['id']} crashed: {e}")
+                job.update(status="failed", statusCode=500,
+                           result={"success": False, "error": "分析工作執行失敗。"})
+            job.update(finishedAt=utc_now_iso(), durationMs=round((time.perf_counter() - started) * 1000))
+            self._write(job)
+            log.info(f"Analysis job {job['id']} {job['status']} in {job['durationMs']} ms.")
+        finally:
+            self._release_slot()
+
+    def _purge_expired(self):
+        """Deletes job files older than the TTL (at most once a minute)."""
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        for path in self.jobs_dir.glob('*.json'):
+            try:
+                if now - path.stat().st_mtime > self.job_ttl_seconds:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                pass
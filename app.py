@@ -1,26 +1,120 @@
 # LHTL/app.py
 
+import time
+_import_started = time.perf_counter() # Start-up time (imports included) is logged and reported by /healthz
 import os
 import json
+import math
 import uuid
-import tempfile
 import io
 import base64 # Needed for encoding audio data
-import shutil
+import gzip
+import hashlib
+import functools
+import hmac
+import mimetypes
+import re
+import stat
+import logging
+import threading
+import click
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory, abort, Response # Added Response
+from urllib.parse import quote
+from flask import (Flask, request, jsonify, send_from_directory, send_file, abort, redirect, Response,
+                   stream_with_context, g)
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from dotenv import load_dotenv
-from openai import OpenAI
-from PIL import Image, UnidentifiedImageError
+try:
+    import brotli # Optional: enables 'br' response compression
+except ImportError:
+    brotli = None
+from renditions import generate_renditions, build_srcset, downscale_to_jpeg
+from analysis_cache import AnalysisCache, make_cache_key, file_digest
+from audio_cache import AudioCache
+from speech_pipeline import SpeechPipeline, SpeechSegmenter, split_speech_segments
+from blob_store import BlobStore
+from batch_analysis import run_batch
+from ai_gateway import AIGateway, AIUnavailableError, CircuitBreaker, TokenBucket, build_openai_client
+from analysis_jobs import AnalysisJobQueue, QueueFullError
+from single_flight import SingleFlight
+from upload_sessions import UploadSessionStore, UploadSessionNotFound, UploadConflict, UploadTooLarge
+from works_store import open_works_store, migrate_legacy_json, utc_now_iso
+from storage import S3Storage, open_storage
+from static_assets import build_static_assets, encoded_path, render_page
+from search_index import SearchIndex
+from gallery_archive import iter_gallery_zip, read_gallery_archive, image_member
+from observability import (setup_logging, span, record_span, server_timing_header, observe_request, count_cache,
+                           count_usage, count_chat_usage, metrics_available, render_metrics)
 
 # --- 設定 ---
 BASE_DIR = Path(__file__).resolve().parent
-UPLOAD_FOLDER = BASE_DIR / 'uploads'
-# AUDIO_CACHE_FOLDER no longer needed
+UPLOAD_FOLDER = BASE_DIR / 'uploads' # Local storage backend only
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower() # 'local' (UPLOAD_FOLDER) or 's3' (shared by all instances)
+S3_BUCKET = os.getenv('S3_BUCKET')
+S3_PREFIX = os.getenv('S3_PREFIX', '') # Key prefix, e.g. 'lhtl/' (uploads/ and works/ go below it)
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL') # MinIO / R2 / ...; unset = AWS
+S3_REGION = os.getenv('S3_REGION')
+S3_PUBLIC_URL = os.getenv('S3_PUBLIC_URL') # Base URL of a public bucket / CDN; unset = presigned URLs
+S3_URL_EXPIRES_SECONDS = int(os.getenv('S3_URL_EXPIRES_SECONDS', 3600)) # Lifetime of presigned image URLs
+UPLOAD_FOLDER_STR = str(UPLOAD_FOLDER)
+UPLOAD_SERVE_MODE = os.getenv('UPLOAD_SERVE_MODE', 'flask').lower() # 'flask', 'x-accel' (nginx) or 'x-sendfile'
+UPLOAD_ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/protected-uploads/') # nginx `internal` location mapped to UPLOAD_FOLDER
+UPLOAD_CACHE_MAX_AGE = 365 * 24 * 3600 # Upload URLs are immutable: cache for a year
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-DATA_FILE = BASE_DIR / 'works_data.json'
+UPLOAD_BLOB_SUBDIR = 'blobs' # Content-addressed images: uploads/blobs/ab/cd/<sha256>.<ext>
+UPLOAD_BLOB_INDEX = BASE_DIR / 'blobs.sqlite3' # Reference counts of the stored images
+IMAGE_FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'} # Detected format -> stored extension
+SEARCH_INDEX_FILE = BASE_DIR / 'search.sqlite3' # Full-text index of author / habits / reflection (FTS5)
+SEARCH_SHARED_RECONCILE_SECONDS = 300 # S3 storage: how often search picks up works other instances added
+CACHE_FOLDER = BASE_DIR / 'cache' # Shared (cross-worker) on-disk caches
+DATA_FILE = BASE_DIR / 'works_data.json' # Legacy whole-file store, migrated into the works store on startup
+# 'sqlite' (WAL), 'jsonl' (append-only log) or 's3' (objects next to the uploads; default with STORAGE_BACKEND=s3)
+WORKS_STORE_BACKEND = os.getenv('WORKS_STORE_BACKEND', 's3' if STORAGE_BACKEND == 's3' else 'sqlite')
 MAX_UPLOAD_SIZE_MB = 16 # Max upload size in Megabytes
+UPLOAD_SESSION_SUBDIR = '.sessions' # Resumable uploads in progress (hidden: never served by /uploads)
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600)) # Abandoned sessions are deleted after this
+WORKS_PAGE_DEFAULT_LIMIT = 24 # /works page size when ?limit= is given without a value
+WORKS_PAGE_MAX_LIMIT = 200
+ANALYSIS_MODEL = "gpt-4.1-mini-2025-04-14" # Vision-capable chat model
+ANALYSIS_MAX_TOKENS = 1500 # Increased slightly for potentially detailed analysis
+ANALYSIS_TEMPERATURE = 0.6 # Slightly lower temperature for more focused analysis
+TTS_MODEL = "tts-1" # or tts-1-hd
+TTS_VOICE = "alloy" # alloy, echo, fable, onyx, nova, shimmer
+ANALYSIS_CACHE_MEMORY_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MEMORY_ENTRIES', 256)) # Per-worker LRU size
+AUDIO_CACHE_MAX_MB = int(os.getenv('AUDIO_CACHE_MAX_MB', 500)) # On-disk TTS cache size bound (LRU eviction)
+TTS_STREAM_CHUNK_BYTES = 16 * 1024 # Forward TTS audio to the client in chunks of this size
+TTS_SEGMENT_WORKERS = int(os.getenv('TTS_SEGMENT_WORKERS', 3)) # Concurrent paragraph TTS calls per worker
+TTS_SEGMENT_MIN_CHARS = 40 # Shorter paragraphs (headings) are merged into the next one
+TTS_SEGMENT_MAX_CHARS = 400 # Longer paragraphs are split at a sentence boundary
+TTS_SEGMENT_TIMEOUT_SECONDS = 60 # Max wait per segment once the text is complete
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', 2)) # Concurrent background analyses per worker
+ANALYSIS_JOB_QUEUE_DEPTH = int(os.getenv('ANALYSIS_JOB_QUEUE_DEPTH', 8)) # Extra jobs allowed to wait before 429
+ANALYSIS_JOB_TTL_SECONDS = 3600 # Finished job records are kept this long
+ANALYSIS_JOB_RETRY_AFTER_SECONDS = 10
+EXPORT_TOKEN = os.getenv('EXPORT_TOKEN') # Bearer token for GET /export; unset = endpoint disabled
+COALESCE_WAIT_SECONDS = float(os.getenv('COALESCE_WAIT_SECONDS', 120)) # Max wait for an identical in-flight analysis / TTS
+AI_CONNECT_TIMEOUT_SECONDS = float(os.getenv('AI_CONNECT_TIMEOUT_SECONDS', 5))
+AI_READ_TIMEOUT_SECONDS = float(os.getenv('AI_READ_TIMEOUT_SECONDS', 60)) # Max gap between bytes from the upstream
+AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', 10)) # Kept-alive upstream connections per worker
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 2)) # Retries of 429 / 5xx / connection errors
+AI_RATE_LIMIT_RPM = float(os.getenv('AI_RATE_LIMIT_RPM', 500)) # Upstream requests/min across all workers (0 = off)
+AI_RATE_LIMIT_MAX_WAIT_SECONDS = 10 # Longer than this and the request is answered 503 instead
+AI_BREAKER_FAILURE_THRESHOLD = 5 # Consecutive upstream failures that open the circuit
+AI_BREAKER_RESET_SECONDS = 30 # Fail fast (503) this long before trying the upstream again
+ANALYSIS_BATCH_CONCURRENCY = 4 # `flask analyze-all` defaults
+ANALYSIS_BATCH_RPM = 60
+MODEL_IMAGE_MAX_SIZE = 1024 # Longest edge sent to the vision model ("auto" detail doesn't use more)
+COMPRESS_MIN_BYTES = 1024 # Smaller responses aren't worth compressing
+RENDITION_WORKERS = int(os.getenv('RENDITION_WORKERS', 2)) # Background threads generating thumbnails per worker
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+STATIC_FOLDER = BASE_DIR / 'static'
+STATIC_BUILD_FOLDER = CACHE_FOLDER / 'assets' # Fingerprinted + precompressed copies of static/, served at /assets/
+INDEX_PAGE = BASE_DIR / 'index.html'
+
+mimetypes.add_type('image/webp', '.webp') # Not in every platform's mime table
 
 # --- 初始化 Flask App & AI Client ---
 app = Flask(__name__, static_folder='static', static_url_path='/static')
@@ -28,16 +122,40 @@ CORS(app) # Allow all origins for simplicity, restrict in production
 app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE_MB * 1024 * 1024 # Set max request size
 
 load_dotenv()
+setup_logging(os.getenv('LOG_LEVEL', 'INFO')) # DEBUG shows per-request details
+log = logging.getLogger(__name__)
+
 API_KEY = os.getenv("OPENAI_API_KEY")
+if not API_KEY:
+    log.warning("OPENAI_API_KEY not found in .env file. AI features will be disabled.")
+
+# The client is built on first use: importing the OpenAI SDK is the slowest part of start-up,
+# and a worker woken up by a page view or health check shouldn't pay for it
 ai_client = None
-if API_KEY:
-    try:
-        ai_client = OpenAI(api_key=API_KEY)
-        print("INFO: OpenAI Client Configured.")
-    except Exception as e:
-        print(f"ERROR: OpenAI Client Config Failed: {e}")
-else:
-    print("WARNING: OPENAI_API_KEY not found in .env file. AI features will be disabled.")
+_ai_client_lock = threading.Lock()
+
+def get_ai_client():
+    """Returns the OpenAI client (created on first call), or None if AI is not configured."""
+    global ai_client
+    if ai_client is None and API_KEY:
+        with _ai_client_lock:
+            if ai_client is None:
+                try:
+                    # OPENAI_BASE_URL points the app (or a batch run) at any OpenAI-compatible server, e.g. a local fake
+                    ai_client = build_openai_client(API_KEY, base_url=os.getenv("OPENAI_BASE_URL"),
+                                                    connect_timeout=AI_CONNECT_TIMEOUT_SECONDS,
+                                                    read_timeout=AI_READ_TIMEOUT_SECONDS, pool_size=AI_HTTP_POOL_SIZE)
+                    log.info("OpenAI Client Configured.")
+                except Exception as e:
+                    log.error(f"OpenAI Client Config Failed: {e}")
+    return ai_client
+
+# Every upstream call goes through ai_gateway.call(): shared rate limit, retries, circuit breaker
+ai_gateway = AIGateway(
+    TokenBucket(CACHE_FOLDER / 'ai_rate_limit.json', AI_RATE_LIMIT_RPM),
+    CircuitBreaker(AI_BREAKER_FAILURE_THRESHOLD, AI_BREAKER_RESET_SECONDS),
+    max_retries=AI_MAX_RETRIES, max_rate_wait=AI_RATE_LIMIT_MAX_WAIT_SECONDS
+)
 
 
 # --- 輔助函數 ---
@@ -46,75 +164,19 @@ def allowed_file(filename):
     return filename and '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def load_works_data():
-    """Loads work data from the JSON file."""
-    if not DATA_FILE.exists():
-        print(f"INFO: Data file {DATA_FILE} not found, returning empty list.")
-        return []
-    try:
-        # Ensure file is not empty before loading
-        if DATA_FILE.stat().st_size == 0:
-            print(f"WARNING: {DATA_FILE} is empty. Returning empty list.")
-            # Optionally create an empty list file here if desired
-            # with open(DATA_FILE, 'w', encoding='utf-8') as f: json.dump([], f)
-            return []
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        # Basic validation: ensure it's a list
-        if not isinstance(data, list):
-             print(f"ERROR: Data in {DATA_FILE} is not a list. Returning empty list.")
-             # Consider backing up the corrupted file
-             return []
-        return data
-    except json.JSONDecodeError as e:
-        print(f"ERROR loading {DATA_FILE}: JSON Decode Error - {e}. Returning empty list.", flush=True)
-        return []
-    except Exception as e:
-        print(f"ERROR loading {DATA_FILE}: {e}", flush=True)
-        return []
-
-def save_works_data(data):
-    """Saves work data to the JSON file atomically."""
-    temp_filepath_obj = None # Use Path object
-    try:
-        # Use tempfile in the same directory for atomic replace
-        # This creates the file securely and returns a file descriptor and path string
-        fd, temp_filepath_str = tempfile.mkstemp(suffix='.tmp', prefix=DATA_FILE.name + '.', dir=BASE_DIR)
-        temp_filepath_obj = Path(temp_filepath_str) # Convert to Path object
-
-        # Write data to the temporary file using the file descriptor
-        with os.fdopen(fd, 'w', encoding='utf-8') as temp_f:
-            json.dump(data, temp_f, ensure_ascii=False, indent=4) # Use indent for readability
-
-        # Replace the original file atomically using shutil.move
-        # This is generally safer than os.replace across different systems/filesystems
-        shutil.move(str(temp_filepath_obj), DATA_FILE)
-        print(f"INFO: Data saved successfully to {DATA_FILE}")
-        return True
-    except Exception as e:
-        print(f"ERROR saving {DATA_FILE}: {e}", flush=True)
-        # Clean up temp file if it exists and replacement failed
-        if temp_filepath_obj and temp_filepath_obj.exists():
-            try:
-                temp_filepath_obj.unlink(missing_ok=True)
-                print(f"INFO: Cleaned up temporary file {temp_filepath_obj}")
-            except OSError as unlink_err:
-                 print(f"ERROR: Could not remove temporary file {temp_filepath_obj}: {unlink_err}")
-        return False
-    finally:
-         # Ensure temp_filepath is cleaned up if it still exists for some unexpected reason
-        if temp_filepath_obj and temp_filepath_obj.exists():
-            try:
-                temp_filepath_obj.unlink(missing_ok=True)
-            except OSError:
-                pass # Ignore errors during final cleanup attempt
-
-def encode_image_to_base64(image_path: Path) -> str | None:
-    """Encodes an image file to a base64 Data URL."""
+def encode_image_to_base64(image_path: Path, max_size: int | None = None, strict: bool = False) -> str | None:
+    """
+    Encodes an image file to a base64 Data URL.
+    With max_size, the image is first downscaled/recompressed to a JPEG no larger than
+    max_size px on its longest edge (what the vision model actually looks at).
+    With strict, a file Pillow can't verify returns None instead of being sent as-is.
+    """
     if not image_path.is_file():
-        print(f"ERROR: encode_image: File not found: {image_path}")
+        log.error(f"encode_image: File not found: {image_path}")
         return None
     try:
+        from PIL import Image, UnidentifiedImageError # Imported on first use: keeps worker start-up fast
+
         # Determine MIME type reliably using Pillow format if available
         mime_type = None
         try:
@@ -125,9 +187,14 @@ def encode_image_to_base64(image_path: Path) -> str | None:
                       mime_map = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "WEBP": "image/webp"}
                       mime_type = mime_map.get(img_format.upper())
         except UnidentifiedImageError:
-             print(f"WARN: encode_image: Pillow couldn't identify {image_path.name}. Falling back to extension.")
+             if strict:
+                 return None
+             log.warning(f"encode_image: Pillow couldn't identify {image_path.name}. Falling back to extension.")
         except Exception as pillow_err:
-             print(f"WARN: encode_image: Pillow error verifying {image_path.name}: {pillow_err}. Falling back to extension.")
+             if strict:
+                 log.warning(f"encode_image: Pillow error verifying {image_path.name}: {pillow_err}.")
+                 return None
+             log.warning(f"encode_image: Pillow error verifying {image_path.name}: {pillow_err}. Falling back to extension.")
 
 
         # Fallback to file extension if Pillow format is unavailable or failed
@@ -136,12 +203,16 @@ def encode_image_to_base64(image_path: Path) -> str | None:
              mime_map_ext = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
              mime_type = mime_map_ext.get(ext)
              if not mime_type:
-                  print(f"ERROR: encode_image: Unknown file extension '{ext}' for {image_path.name}. Cannot determine MIME type.")
+                  log.error(f"encode_image: Unknown file extension '{ext}' for {image_path.name}. Cannot determine MIME type.")
                   return None # Cannot proceed without MIME type
 
-        # Read binary data and encode
-        with open(image_path, "rb") as f:
-            binary_data = f.read()
+        # Read binary data (downscaled if requested) and encode
+        if max_size:
+            binary_data = downscale_to_jpeg(image_path, max_size)
+            mime_type = "image/jpeg"
+        else:
+            with open(image_path, "rb") as f:
+                binary_data = f.read()
         if not binary_data:
             raise ValueError("Read 0 bytes from image file.")
 
@@ -149,49 +220,234 @@ def encode_image_to_base64(image_path: Path) -> str | None:
         if not base64_string:
             raise ValueError("Generated empty base64 string.")
 
-        print(f"DEBUG: Encoded {image_path.name} (MIME: {mime_type}). Base64 length: {len(base64_string)}")
+        log.debug(f"Encoded {image_path.name} (MIME: {mime_type}). Base64 length: {len(base64_string)}")
         return f"data:{mime_type};base64,{base64_string}"
 
     except FileNotFoundError: # Should be caught by is_file() earlier, but good practice
-         print(f"ERROR: encode_image: File disappeared before reading: {image_path}")
+         log.error(f"encode_image: File disappeared before reading: {image_path}")
          return None
     except Exception as e:
-        print(f"ERROR: encode_image failed for {image_path.name}: {e}")
+        log.error(f"encode_image failed for {image_path.name}: {e}")
         return None
 
 
 # --- App Startup Initialization ---
 def initialize_directories_and_files():
     """Creates necessary directories and initializes the data file."""
-    folders = [UPLOAD_FOLDER] # Only need upload folder
+    folders = [storage.local_root] # Uploads (or their local copies, with S3 storage)
     for folder in folders:
         try:
             folder.mkdir(parents=True, exist_ok=True)
-            print(f"INFO: Directory '{folder}' is ready.")
+            log.info(f"Directory '{folder}' is ready.")
         except OSError as e:
-            print(f"CRITICAL ERROR: Cannot create directory '{folder}': {e}. Uploads will fail.")
+            log.critical(f"Cannot create directory '{folder}': {e}. Uploads will fail.")
             # Consider exiting if uploads are critical: exit(1)
 
-    # Initialize data file
+    # Migrate the legacy works_data.json (if any) into the works store
     try:
-        if not DATA_FILE.exists():
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                f.write('[]') # Write empty JSON list
-            print(f"INFO: Initialized empty data file: {DATA_FILE}")
-        else:
-            # Attempt to load data on startup to validate format
-            initial_data = load_works_data()
-            print(f"INFO: Data file {DATA_FILE} exists, loaded {len(initial_data)} records.")
+        migrate_legacy_json(works_store, DATA_FILE)
+        log.info(f"Works store '{works_store.name}' ready.") # No count(): the JSON-lines backend would read the whole log
     except Exception as e:
-        print(f"ERROR: Data file check/initialization failed: {e}")
-
+        log.error(f"Works store check/migration failed: {e}")
+
+storage = open_storage(STORAGE_BACKEND, UPLOAD_FOLDER, CACHE_FOLDER, bucket=S3_BUCKET, prefix=S3_PREFIX,
+                       endpoint_url=S3_ENDPOINT_URL, region=S3_REGION, url_expires_seconds=S3_URL_EXPIRES_SECONDS,
+                       public_base_url=S3_PUBLIC_URL)
+works_store = open_works_store(WORKS_STORE_BACKEND, BASE_DIR, object_storage=S3Storage(
+    storage.client_factory, S3_BUCKET, S3_PREFIX + 'works/') if storage.shared else None)
+blob_store = BlobStore(storage, UPLOAD_BLOB_INDEX, subdir=UPLOAD_BLOB_SUBDIR)
+# Next to blobs/.incoming, so finalizing links the received file instead of copying it
+upload_sessions = UploadSessionStore(storage.local_root / UPLOAD_SESSION_SUBDIR, ttl_seconds=UPLOAD_SESSION_TTL_SECONDS)
+search_index = SearchIndex(SEARCH_INDEX_FILE)
+analysis_cache = AnalysisCache(CACHE_FOLDER / 'analysis', max_memory_entries=ANALYSIS_CACHE_MEMORY_ENTRIES)
+analysis_jobs = AnalysisJobQueue(CACHE_FOLDER / 'jobs', max_workers=ANALYSIS_JOB_WORKERS,
+                                 max_queue_depth=ANALYSIS_JOB_QUEUE_DEPTH, job_ttl_seconds=ANALYSIS_JOB_TTL_SECONDS)
+audio_cache = AudioCache(CACHE_FOLDER / 'audio', max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024)
+upstream_flights = SingleFlight(CACHE_FOLDER / 'flights', wait_timeout=COALESCE_WAIT_SECONDS) # Identical analyses / TTS run once
 initialize_directories_and_files()
 
+# --- Image Renditions (background) ---
+rendition_executor = ThreadPoolExecutor(max_workers=RENDITION_WORKERS, thread_name_prefix='renditions')
+
+def generate_work_renditions(work_id, scorecard_filename, comic_filename):
+    """Generates thumbnail/modal/model renditions for a work and records them on the entry."""
+    renditions = {}
+    for key, filename in (("scorecard", scorecard_filename), ("comic", comic_filename)):
+        try:
+            storage.local_path(filename) # Fetches the original first when it lives in S3
+            renditions[key] = generate_renditions(storage.local_root, filename)
+            for rendition in renditions[key].values():
+                storage.publish(rendition["filename"])
+        except Exception as e:
+            # Originals are still served; the work just falls back to full-size images
+            log.error(f"Rendition generation failed for {filename} (work {work_id}): {e}")
+    if renditions:
+        works_store.update_work(work_id, {"renditions": renditions})
+        log.info(f"Stored renditions for work {work_id}: {', '.join(renditions)}")
+    return renditions
+
+@app.cli.command('renditions')
+def backfill_renditions_command():
+    """Generates missing renditions for existing works (flask --app app renditions)."""
+    missing = [w for w in works_store.list_works()
+               if isinstance(w, dict) and w.get("id") and not w.get("renditions")]
+    print(f"INFO: {len(missing)} works without renditions.")
+    for work in missing:
+        generate_work_renditions(work["id"], work.get("scorecardFilename"), work.get("comicFilename"))
+
+
+# --- Works List Cache (per worker) ---
+# The processed /works list (newest first) is rebuilt only when the works store generation
+# changes, so uploads handled by other workers are picked up on the next request.
+_works_cache_lock = threading.Lock()
+_works_cache = {"generation": None, "works": [], "index_by_id": {}, "body": b"[]", "etag": None, "encoded": {}}
+
+WORK_PUBLIC_FIELDS = ("id", "author", "currentHabits", "reflection", "createdAt",
+                      "scorecardImageUrl", "comicImageUrl", "scorecardThumbUrl", "comicThumbUrl",
+                      "scorecardSrcset", "comicSrcset")
+
+def process_work_entry(work_entry):
+    """Validates a stored work entry and converts it to the public API shape (or None if invalid)."""
+    required_keys = ["id", "author", "currentHabits", "reflection", "scorecardFilename", "comicFilename"]
+    if not isinstance(work_entry, dict) or not all(key in work_entry for key in required_keys):
+        log.warning(f"Skipped invalid or incomplete work data structure: {work_entry}")
+        return None
+    # Ensure filenames are present and non-empty strings
+    s_filename = work_entry.get("scorecardFilename")
+    c_filename = work_entry.get("comicFilename")
+    if not (s_filename and isinstance(s_filename, str) and c_filename and isinstance(c_filename, str)):
+        log.warning(f"Skipped work entry due to missing or invalid filenames: ID {work_entry.get('id', 'N/A')}")
+        return None
+    renditions = work_entry.get("renditions") or {}
+    s_renditions = renditions.get("scorecard") or {}
+    c_renditions = renditions.get("comic") or {}
+    return {
+        "id": work_entry["id"],
+        "author": work_entry["author"],
+        "currentHabits": work_entry["currentHabits"],
+        "reflection": work_entry["reflection"],
+        "createdAt": work_entry.get("createdAt"),
+        "scorecardImageUrl": f"/uploads/{s_filename}", # Construct URL (original)
+        "comicImageUrl": f"/uploads/{c_filename}",     # Construct URL (original)
+        # Thumbnails fall back to the original until the background renditions exist
+        "scorecardThumbUrl": f"/uploads/{s_renditions['thumb']['filename']}" if 'thumb' in s_renditions else f"/uploads/{s_filename}",
+        "comicThumbUrl": f"/uploads/{c_renditions['thumb']['filename']}" if 'thumb' in c_renditions else f"/uploads/{c_filename}",
+        "scorecardSrcset": build_srcset(s_renditions),
+        "comicSrcset": build_srcset(c_renditions)
+    }
+
+def get_works_cache():
+    """Returns the cached works list (processed works, serialized body, ETag), rebuilding it if stale."""
+    global _works_cache
+    generation = works_store.generation()
+    cache = _works_cache
+    if cache["generation"] == generation:
+        count_cache('works', 'hit')
+        return cache
+    with _works_cache_lock:
+        if _works_cache["generation"] == generation: # Another thread rebuilt it meanwhile
+            count_cache('works', 'hit')
+            return _works_cache
+        count_cache('works', 'miss')
+        processed_works = [w for w in map(process_work_entry, works_store.list_works()) if w]
+        processed_works.reverse() # Newest first
+        body = json.dumps(processed_works, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        new_cache = {
+            "generation": generation,
+            "works": processed_works,
+            "index_by_id": {w["id"]: i for i, w in enumerate(processed_works)}, # For cursor lookups
+            "body": body,
+            "etag": hashlib.sha256(body).hexdigest()[:32], # Strong ETag: derived from the exact bytes sent
+            "encoded": {} # Lazily filled: content-encoding -> compressed body
+        }
+        _works_cache = new_cache # Swap the reference; readers never see a half-built cache
+        log.info(f"Rebuilt works cache ({len(processed_works)} works, generation {generation}).")
+        return new_cache
+
+
+# --- Request Timing & Metrics ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def add_server_timing(response):
+    """Sends the request's timing spans as `Server-Timing` and records the request metrics.
+
+    Registered before compress_response, so it runs after it and the total includes compression.
+    Streamed responses (SSE) only report what happened before the first byte; their later
+    phases still end up in the phase histogram.
+    """
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    response.headers['Server-Timing'] = server_timing_header(elapsed)
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched' # Route template: bounded label values
+    observe_request(request.method, endpoint, response.status_code, elapsed)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of all workers (request latency, phases, upstream usage, caches)."""
+    if not metrics_available():
+        return jsonify({"success": False, "error": "Metrics 未啟用 (prometheus_client 未安裝)"}), 503
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+# --- Response Compression ---
+def choose_content_encoding():
+    """Picks the best content-encoding the client accepts ('br', 'gzip' or None)."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def choose_precompressed_encoding(available):
+    """Picks the best of the already-compressed variants the client accepts (or None)."""
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding]:
+            return encoding
+    return None
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    """Compresses data with the given content-encoding."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=5) # Good ratio while staying fast enough per request
+    return gzip.compress(data, compresslevel=6)
+
+@app.after_request
+def compress_response(response):
+    """Compresses textual responses on the fly when the client supports it."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_content_encoding()
+    response.vary.add('Accept-Encoding')
+    if not encoding:
+        return response
+    with span('compress'):
+        response.set_data(compress_bytes(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, is_weak = response.get_etag()
+    if etag: # Compressed bytes differ, so the strong ETag must differ too
+        response.set_etag(f"{etag}-{encoding}", weak=is_weak)
+    return response
+
+
 # --- Error Handlers ---
 @app.errorhandler(404)
 def not_found_error(error):
     # Log the error or path if needed
-    # print(f"DEBUG: 404 Not Found for path: {request.path}")
+    # log.debug(f"404 Not Found for path: {request.path}")
     return jsonify({"success": False, "error": "資源不存在 (Not Found)"}), 404
 
 @app.errorhandler(405)
@@ -201,7 +457,7 @@ def method_not_allowed_error(error):
 @app.errorhandler(500)
 def internal_error(error):
     # Log the actual error trace here for debugging
-    print(f"CRITICAL: Internal Server Error: {error}", flush=True)
+    log.critical(f"Internal Server Error: {error}")
     # Potentially log traceback: import traceback; traceback.print_exc()
     return jsonify({"success": False, "error": "伺服器內部錯誤 (Internal Server Error)"}), 500
 
@@ -222,16 +478,18 @@ def upload_work():
     # if content_length and content_length > app.config['MAX_CONTENT_LENGTH']:
     #     abort(413) # Payload Too Large
 
+    with span('parse'): # Reads and parses the whole multipart body
+        form_data = request.form
+        file_data = request.files
+
     # Validate form fields
     required_fields = ['author-name', 'current-habits', 'reflection']
-    form_data = request.form
     missing_fields = [f for f in required_fields if not form_data.get(f,'').strip()]
     if missing_fields:
         return jsonify({"success": False, "error": f"缺少欄位: {', '.join(missing_fields)}"}), 400
 
     # Validate file uploads
     required_files = ['scorecard-image', 'comic-image']
-    file_data = request.files
     missing_files = [f for f in required_files if f not in file_data or not file_data[f].filename]
     if missing_files:
         return jsonify({"success": False, "error": f"缺少檔案: {', '.join(missing_files)}"}), 400
@@ -243,60 +501,81 @@ def upload_work():
     if not allowed_file(scorecard_file.filename) or not allowed_file(comic_file.filename):
         return jsonify({"success": False, "error": "檔案格式不符 (僅接受 PNG, JPG, GIF)"}), 400
 
-    # --- Basic Image Validation (using Pillow) ---
-    try:
-        # Verify both images without loading fully into memory
-        with Image.open(scorecard_file) as img: img.verify()
-        scorecard_file.seek(0) # Reset file pointer after verify
-        with Image.open(comic_file) as img: img.verify()
-        comic_file.seek(0) # Reset file pointer after verify
-        print("INFO: Uploaded image files verified successfully.")
-    except UnidentifiedImageError:
-        print(f"ERROR: Upload validation failed - Unidentified image format.")
-        return jsonify({"success": False, "error": "無法辨識的圖片檔案格式或檔案已損壞。"}), 400
-    except Exception as img_err:
-         # Log other Pillow errors but potentially allow upload (e.g., metadata errors)
-         print(f"WARNING: Image verification encountered an issue: {img_err}")
-    # --- End Image Validation ---
-
-    saved_files_info = {} # To track saved files for potential cleanup on error
+    return store_uploaded_work(
+        {"scorecard": lambda: blob_store.ingest(scorecard_file.stream),
+         "comic": lambda: blob_store.ingest(comic_file.stream)},
+        form_data.get('author-name','').strip(), form_data.get('current-habits','').strip(),
+        form_data.get('reflection','').strip())
+
+
+def store_uploaded_work(image_sources: dict, author: str, habits: str, reflection: str):
+    """
+    Verifies and stores the images of a new work, then adds the work (shared by /upload and
+    the finalize step of resumable uploads). ``image_sources`` maps "scorecard" / "comic" to a
+    function returning the image as a hashed PendingBlob. Returns the JSON response.
+    """
+    # --- Store Images (content-addressed) ---
+    # Each file is read once: streamed to a temp file while hashed, verified from that
+    # file, then committed under its SHA-256 (identical images are stored only once).
+    from PIL import Image, UnidentifiedImageError
+
+    pending_blobs = {} # Hashed temp files, not committed yet
+    saved_filenames = {} # To release stored images if a later step fails
     try:
-        # Save scorecard image
-        s_ext = scorecard_file.filename.rsplit('.', 1)[1].lower()
-        s_unique_id = uuid.uuid4()
-        s_filename = f"{s_unique_id}_scorecard.{s_ext}"
-        s_filepath = UPLOAD_FOLDER / s_filename
-        scorecard_file.save(s_filepath)
-        saved_files_info['scorecard'] = {'filename': s_filename, 'filepath': s_filepath}
-        print(f"INFO: Saved scorecard image: {s_filename}")
-
-        # Save comic image
-        c_ext = comic_file.filename.rsplit('.', 1)[1].lower()
-        c_unique_id = uuid.uuid4() # Generate separate UUID if needed
-        c_filename = f"{c_unique_id}_comic.{c_ext}"
-        c_filepath = UPLOAD_FOLDER / c_filename
-        comic_file.save(c_filepath)
-        saved_files_info['comic'] = {'filename': c_filename, 'filepath': c_filepath}
-        print(f"INFO: Saved comic image: {c_filename}")
-
-        # Load existing data, append new entry
-        works_data = load_works_data()
+        extensions = {}
+        for key in ("scorecard", "comic"):
+            with span('hash_save'):
+                pending_blobs[key] = image_sources[key]()
+            try:
+                with span('verify'), Image.open(pending_blobs[key].temp_path) as img: # Verify without decoding the whole image
+                    image_format = img.format
+                    img.verify()
+            except UnidentifiedImageError:
+                log.error(f"Upload validation failed - Unidentified image format ({key}).")
+                return jsonify({"success": False, "error": "無法辨識的圖片檔案格式或檔案已損壞。"}), 400
+            except Exception as img_err:
+                # Log other Pillow errors but allow the upload (e.g., metadata errors)
+                log.warning(f"Image verification encountered an issue: {img_err}")
+            extensions[key] = IMAGE_FORMAT_EXTENSIONS.get(image_format)
+            if not extensions[key]:
+                return jsonify({"success": False, "error": "檔案格式不符 (僅接受 PNG, JPG, GIF)"}), 400
+        log.info("Uploaded image files verified successfully.")
+
+        for key in ("scorecard", "comic"):
+            with span('commit'):
+                relative_path, created = blob_store.commit(pending_blobs.pop(key), extensions[key])
+            saved_filenames[key] = f"{UPLOAD_BLOB_SUBDIR}/{relative_path}"
+            log.info(f"{'Saved' if created else 'Deduplicated'} {key} image: {saved_filenames[key]}")
+        s_filename, c_filename = saved_filenames["scorecard"], saved_filenames["comic"]
+
+        # Append the new entry (O(1), no rewrite of existing works)
         new_work_id = str(uuid.uuid4())
         new_work_entry = {
             "id": new_work_id,
-            "author": form_data.get('author-name','').strip(),
-            "currentHabits": form_data.get('current-habits','').strip(),
-            "reflection": form_data.get('reflection','').strip(),
+            "author": author,
+            "currentHabits": habits,
+            "reflection": reflection,
             "scorecardFilename": s_filename,
-            "comicFilename": c_filename
-            # Consider adding timestamp: "timestamp": datetime.now().isoformat() (import datetime)
+            "comicFilename": c_filename,
+            "createdAt": utc_now_iso()
         }
-        works_data.append(new_work_entry)
-
-        # Save updated data back to file
-        if not save_works_data(works_data):
+        try:
+            with span('store'):
+                works_store.add_work(new_work_entry)
+        except Exception as store_err:
+            log.error(f"Saving work {new_work_id} to the works store failed: {store_err}")
             raise IOError("儲存作品資料檔時發生錯誤。") # More specific error
 
+        try:
+            with span('index'):
+                search_index.index_work(new_work_entry) # Searchable right away, no rebuild
+        except Exception as index_err:
+            # Not fatal: picked up by the next full reconcile (worker start, `flask reindex-search`)
+            log.warning(f"Indexing work {new_work_id} for search failed: {index_err}")
+
+        # Thumbnails etc. are generated in the background; /works falls back to originals meanwhile
+        rendition_executor.submit(generate_work_renditions, new_work_id, s_filename, c_filename)
+
         # Success response
         return jsonify({
             "success": True,
@@ -305,16 +584,14 @@ def upload_work():
         }), 201
 
     except Exception as e:
-        print(f"ERROR: Upload processing failed: {e}", flush=True)
-        # Clean up any files that were saved before the error occurred
-        for key in saved_files_info:
-             filepath = saved_files_info[key].get('filepath')
-             if filepath and filepath.exists():
-                try:
-                    filepath.unlink(missing_ok=True)
-                    print(f"INFO: Cleaned up partially saved file: {filepath.name}")
-                except OSError as del_err:
-                    print(f"WARN: Could not delete partially saved file on error: {filepath.name} - {del_err}")
+        log.error(f"Upload processing failed: {e}")
+        # Drop this upload's references (shared images stay for the works that use them)
+        for filename in saved_filenames.values():
+            try:
+                if blob_store.release(filename.split('/', 1)[1]):
+                    log.info(f"Cleaned up saved file: {filename}")
+            except Exception as del_err:
+                log.warning(f"Could not release saved file on error: {filename} - {del_err}")
 
         # Determine appropriate error message and status code
         error_message = "伺服器處理上傳時發生錯誤。"
@@ -325,116 +602,503 @@ def upload_work():
 
         return jsonify({"success": False, "error": error_message}), status_code
 
+    finally:
+        for pending in pending_blobs.values(): # Rejected or interrupted before commit
+            blob_store.discard(pending)
+
+
+# --- Resumable Uploads ---
+# For large images on unreliable (mobile) connections: the images are sent in chunks that
+# are appended straight to disk, and an interrupted upload continues where it stopped:
+#   POST   /upload/sessions                      create (text fields + image sizes)
+#   PUT    /upload/sessions/<id>/<image>         append a chunk at Upload-Offset
+#   GET    /upload/sessions/<id>                 bytes received so far
+#   POST   /upload/sessions/<id>/finalize        verify the images and add the work
+#   DELETE /upload/sessions/<id>                 abort
+# Sessions live on this instance's disk: with several instances behind a load balancer,
+# route a session's requests to one instance (or put UPLOAD_FOLDER on a shared volume).
+
+def upload_session_status(record):
+    return {"success": True, "session_id": record["id"], "offsets": record["offsets"], "sizes": record["sizes"],
+            "complete": record["complete"], "work_id": record["workId"]}
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    """
+    Starts a resumable upload.
+    JSON { author, habits, reflection, scorecard_size, comic_size } (sizes in bytes) ->
+    201 { session_id, upload_urls: {scorecard, comic}, expires_in }.
+    """
+    data = request.get_json(silent=True) or {}
+    fields = {key: str(data.get(key) or '').strip() for key in ('author', 'habits', 'reflection')}
+    missing_fields = [key for key, value in fields.items() if not value]
+    if missing_fields:
+        return jsonify({"success": False, "error": f"缺少欄位: {', '.join(missing_fields)}"}), 400
 
-@app.route('/works', methods=['GET'])
-def get_works():
-    """Retrieves the list of works with image URLs."""
-    works_data = load_works_data()
-    processed_works = []
-    required_keys = ["id", "author", "currentHabits", "reflection", "scorecardFilename", "comicFilename"]
+    sizes = {}
+    for part in upload_sessions.parts:
+        try:
+            sizes[part] = int(data.get(f"{part}_size"))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": f"缺少或無效的檔案大小: {part}_size"}), 400
+        if sizes[part] <= 0:
+            return jsonify({"success": False, "error": f"缺少或無效的檔案大小: {part}_size"}), 400
+        if sizes[part] > MAX_UPLOAD_SIZE_MB * 1024 * 1024:
+            abort(413)
+
+    record = upload_sessions.create(fields, sizes)
+    log.info(f"Upload session {record['id']} started ({sum(sizes.values())} bytes announced).")
+    return jsonify({
+        "success": True,
+        "session_id": record["id"],
+        "upload_urls": {part: f"/upload/sessions/{record['id']}/{part}" for part in upload_sessions.parts},
+        "expires_in": UPLOAD_SESSION_TTL_SECONDS
+    }), 201
+
+@app.route('/upload/sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """Bytes received per image: after an interruption, each image continues at its offset."""
+    try:
+        record = upload_sessions.get(session_id)
+    except UploadSessionNotFound:
+        return jsonify({"success": False, "error": "找不到上傳工作階段 (可能已過期)。"}), 404
+    response = jsonify(upload_session_status(record))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/upload/sessions/<session_id>/<part>', methods=['PUT'])
+def upload_session_chunk(session_id, part):
+    """Appends the raw request body to an image; the Upload-Offset header must equal the bytes received so far."""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({"success": False, "error": "缺少或無效的 Upload-Offset 標頭。"}), 400
+    try:
+        with span('append'):
+            new_offset = upload_sessions.append(session_id, part, offset, request.stream)
+    except UploadSessionNotFound:
+        return jsonify({"success": False, "error": "找不到上傳工作階段 (可能已過期)。"}), 404
+    except UploadConflict as e:
+        log.info(f"Upload session {session_id} ({part}): {e}")
+        return jsonify({"success": False, "error": "上傳位移不符或此檔案正在上傳中，請查詢進度後再繼續。",
+                        "offset": e.offset}), 409
+    except UploadTooLarge:
+        return jsonify({"success": False, "error": "檔案大於建立上傳工作階段時宣告的大小。"}), 413
+    response = jsonify({"success": True, "offset": new_offset})
+    response.headers['Upload-Offset'] = str(new_offset)
+    return response
+
+@app.route('/upload/sessions/<session_id>/finalize', methods=['POST'])
+def finalize_upload_session(session_id):
+    """
+    Verifies the received images and adds the work (same response as /upload). Safe to
+    retry: a finalized session answers with the work it created.
+    """
+    try:
+        with upload_sessions.finalizing(session_id) as record:
+            if record["workId"]:
+                return jsonify({"success": True, "message": "分享成功！", "work_id": record["workId"]}), 200
+            if not record["complete"]:
+                return jsonify({**upload_session_status(record), "success": False, "error": "圖片尚未上傳完成。"}), 409
+            fields = record["fields"]
+            # The received files are linked into the blob store, not copied again
+            response, status_code = store_uploaded_work(
+                {part: (lambda path=upload_sessions.part_path(session_id, part): blob_store.adopt(path))
+                 for part in upload_sessions.parts},
+                fields["author"], fields["habits"], fields["reflection"])
+            if status_code == 201:
+                upload_sessions.mark_finalized(session_id, response.get_json()["work_id"])
+                log.info(f"Upload session {session_id} finalized.")
+            elif status_code == 400: # The images are invalid: resending won't help
+                upload_sessions.delete(session_id)
+            return response, status_code
+    except UploadSessionNotFound:
+        return jsonify({"success": False, "error": "找不到上傳工作階段 (可能已過期)。"}), 404
+    except UploadConflict:
+        return jsonify({"success": False, "error": "此上傳正在處理中，請稍後查詢結果。"}), 409
+
+@app.route('/upload/sessions/<session_id>', methods=['DELETE'])
+def delete_upload_session(session_id):
+    """Aborts a resumable upload and deletes what was received."""
+    try:
+        upload_sessions.delete(session_id)
+    except UploadSessionNotFound:
+        return jsonify({"success": False, "error": "找不到上傳工作階段 (可能已過期)。"}), 404
+    return jsonify({"success": True})
+
+@app.cli.command('purge-upload-sessions')
+def purge_upload_sessions_command():
+    """Deletes abandoned resumable uploads now (also done while serving, at most once a minute)."""
+    purged = upload_sessions.purge_expired(force=True)
+    print(f"INFO: Purged {purged} upload sessions idle for more than {UPLOAD_SESSION_TTL_SECONDS} s.")
 
-    for work_entry in works_data:
-        # Validate each entry
-        if isinstance(work_entry, dict) and all(key in work_entry for key in required_keys):
-            # Ensure filenames are present and non-empty strings
-            s_filename = work_entry.get("scorecardFilename")
-            c_filename = work_entry.get("comicFilename")
-            if s_filename and isinstance(s_filename, str) and c_filename and isinstance(c_filename, str):
-                 processed_works.append({
-                    "id": work_entry["id"],
-                    "author": work_entry["author"],
-                    "currentHabits": work_entry["currentHabits"],
-                    "reflection": work_entry["reflection"],
-                    "scorecardImageUrl": f"/uploads/{s_filename}", # Construct URL
-                    "comicImageUrl": f"/uploads/{c_filename}"     # Construct URL
-                })
-            else:
-                 print(f"WARN: Skipped work entry due to missing or invalid filenames: ID {work_entry.get('id', 'N/A')}", flush=True)
-        else:
-            print(f"WARN: Skipped invalid or incomplete work data structure: {work_entry}", flush=True)
 
-    # Return the processed list, even if empty
-    return jsonify(processed_works)
+@app.route('/works', methods=['GET'])
+def get_works():
+    """
+    Retrieves works (newest first) with image URLs, served from the per-worker cache.
 
+    Without query parameters the full list is returned as a JSON array (legacy shape).
+    With ?limit=, ?cursor= and/or ?fields= a page object is returned instead:
+    { works: [...], nextCursor: "..." | null, total: n }.
+    """
+    cache = get_works_cache()
+    if not any(key in request.args for key in ('limit', 'cursor', 'fields')):
+        return _full_works_response(cache)
 
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    """Securely serves files from the UPLOAD_FOLDER."""
+    # --- Parse paging parameters ---
     try:
-        # Secure path resolution
-        # normalize joins paths and resolves '..' etc. safely within root
-        # resolve makes it absolute, ensuring it's under UPLOAD_FOLDER
-        upload_dir = UPLOAD_FOLDER.resolve()
-        safe_path = upload_dir.joinpath(filename).resolve()
-
-        # Check if the resolved path is still within the upload directory and is a file
-        if not safe_path.is_file() or not str(safe_path).startswith(str(upload_dir)):
-            print(f"WARN: Denied access to non-existent or escaped path: {filename} (Resolved: {safe_path})")
-            abort(404)
-
-        # Use Flask's send_from_directory for proper headers (cache control, etc.)
-        # print(f"DEBUG: Serving file: {filename} from {UPLOAD_FOLDER}")
-        return send_from_directory(UPLOAD_FOLDER, filename) # filename relative to UPLOAD_FOLDER
-
-    except FileNotFoundError: # Should be caught by is_file(), but as fallback
-        print(f"WARN: File not found in uploads directory (send_from_directory): {filename}")
-        abort(404)
-    except Exception as e:
-        print(f"ERROR: Unexpected error serving uploaded file {filename}: {e}")
-        abort(500) # Internal Server Error
+        limit = int(request.args.get('limit') or WORKS_PAGE_DEFAULT_LIMIT)
+    except ValueError:
+        return jsonify({"success": False, "error": "limit 參數必須為整數。"}), 400
+    limit = max(1, min(limit, WORKS_PAGE_MAX_LIMIT))
+
+    fields = None
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        unknown_fields = [f for f in fields if f not in WORK_PUBLIC_FIELDS]
+        if unknown_fields:
+            return jsonify({"success": False, "error": f"未知的欄位: {', '.join(unknown_fields)}"}), 400
+        if "id" not in fields:
+            fields.insert(0, "id") # Always needed by clients to reference a work
+
+    start_index = 0
+    cursor = request.args.get('cursor')
+    if cursor:
+        last_seen_id = decode_works_cursor(cursor)
+        if last_seen_id not in cache["index_by_id"]:
+            return jsonify({"success": False, "error": "無效的分頁游標 (cursor)。"}), 400
+        start_index = cache["index_by_id"][last_seen_id] + 1
+
+    # Page ETag: cheap to derive, so revalidation needs no serialization at all
+    page_etag = hashlib.sha256(f"{cache['etag']}|{start_index}|{limit}|{fields}".encode('utf-8')).hexdigest()[:32]
+    matched_etag = matching_etag_variant(page_etag)
+    if matched_etag:
+        response = Response(status=304)
+        response.set_etag(matched_etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    page = cache["works"][start_index:start_index + limit]
+    if fields:
+        page = [{f: w[f] for f in fields} for w in page]
+    has_more = start_index + limit < len(cache["works"])
+    response = jsonify({
+        "works": page,
+        "nextCursor": encode_works_cursor(page[-1]["id"]) if page and has_more else None,
+        "total": len(cache["works"])
+    })
+    response.set_etag(page_etag) # Suffixed with the encoding by compress_response if compressed
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/works/search', methods=['GET'])
+def search_works():
+    """
+    Full-text search over author, current habits and reflection (see search_index.py).
+    ?q=<text>[&limit=n][&offset=n] -> { works: [...], total: n, nextOffset: n | null }, best match first.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"success": False, "error": "請輸入搜尋關鍵字 (q)。"}), 400
+    try:
+        limit = int(request.args.get('limit') or WORKS_PAGE_DEFAULT_LIMIT)
+        offset = int(request.args.get('offset') or 0)
+    except ValueError:
+        return jsonify({"success": False, "error": "limit / offset 參數必須為整數。"}), 400
+    limit = max(1, min(limit, WORKS_PAGE_MAX_LIMIT))
+    offset = max(0, offset)
+
+    cache = get_works_cache()
+    search_etag = hashlib.sha256(f"{cache['etag']}|{query}|{limit}|{offset}".encode('utf-8')).hexdigest()[:32]
+    matched_etag = matching_etag_variant(search_etag)
+    if matched_etag:
+        response = Response(status=304)
+        response.set_etag(matched_etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    with span('search_sync'): # Once per worker (and periodically with shared storage), see below
+        reconcile_search_index(cache)
+    with span('search'):
+        work_ids, total = search_index.search(query, limit, offset)
+    works = [cache["works"][cache["index_by_id"][work_id]] for work_id in work_ids if work_id in cache["index_by_id"]]
+    response = jsonify({
+        "works": works,
+        "total": total,
+        "nextOffset": offset + limit if offset + limit < total else None
+    })
+    response.set_etag(search_etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+_search_reconciled_at = None # monotonic() of this worker's last full reconcile
+
+def reconcile_search_index(cache):
+    """
+    Full reconcile of the search index with the works list (a scan of every work, see
+    SearchIndex.sync). Uploads and imports index their own works, so a worker only does
+    this before its first search (migrations, works added while it was down) and, with
+    shared storage, every SEARCH_SHARED_RECONCILE_SECONDS for other instances' uploads.
+    """
+    global _search_reconciled_at
+    now = time.monotonic()
+    if _search_reconciled_at is not None and (
+            not storage.shared or now - _search_reconciled_at < SEARCH_SHARED_RECONCILE_SECONDS):
+        return
+    search_index.sync(reversed(cache["works"]), cache["generation"])
+    _search_reconciled_at = now
+
+@app.cli.command('reindex-search')
+def reindex_search_command():
+    """Reconciles the search index with every work in the works store (flask --app app reindex-search)."""
+    cache = get_works_cache()
+    changed = search_index.sync(reversed(cache["works"]), cache["generation"], force=True)
+    print(f"INFO: Search index checked: {len(cache['works'])} works, {changed} (re)indexed or removed.")
+
+
+def _full_works_response(cache):
+    """Full works list response with pre-built (and pre-compressed) body."""
+    encoding = choose_content_encoding()
+    etag = f"{cache['etag']}-{encoding}" if encoding else cache["etag"]
+
+    # Repeat polls: answer from the cached ETag without building or parsing anything
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = cache["body"]
+        if encoding:
+            if encoding not in cache["encoded"]:
+                cache["encoded"][encoding] = compress_bytes(body, encoding)
+            body = cache["encoded"][encoding]
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate, but 304s are cheap
+    return response
+
+
+def matching_etag_variant(base_etag):
+    """Returns the ETag (plain or '-br'/'-gzip' variant) the client revalidates with, if it matches."""
+    for candidate in (base_etag, f"{base_etag}-br", f"{base_etag}-gzip"):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+def encode_works_cursor(work_id):
+    """Opaque pagination cursor: the id of the last work on the previous page."""
+    return base64.urlsafe_b64encode(work_id.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_works_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except Exception:
+        return None
 
 
-@app.route('/analyze', methods=['POST'])
-def analyze_current_work_revised():
+@app.route('/works/<work_id>', methods=['GET'])
+def get_work(work_id):
+    """Retrieves a single work (used by the modal when the grid only fetched a projection)."""
+    cache = get_works_cache()
+    index = cache["index_by_id"].get(work_id)
+    if index is None:
+        return jsonify({"success": False, "error": "找不到指定的作品。"}), 404
+    work_etag = hashlib.sha256(f"{cache['etag']}|{work_id}".encode('utf-8')).hexdigest()[:32]
+    matched_etag = matching_etag_variant(work_etag)
+    if matched_etag:
+        response = Response(status=304)
+        response.set_etag(matched_etag)
+        return response
+    response = jsonify(cache["works"][index])
+    response.set_etag(work_etag)
+    return response
+
+
+# --- Gallery Export / Import ---
+def open_stored_image(filename):
+    return open(storage.local_path(filename), 'rb')
+
+@app.route('/export', methods=['GET'])
+def export_gallery():
     """
-    Performs AI analysis on data provided in the request body (images + text).
-    Optionally generates TTS audio and includes it Base64 encoded in the JSON response.
+    Streams a ZIP backup of the gallery: works metadata + every referenced original image
+    (see gallery_archive.py). Built on the fly from one works snapshot, in bounded memory.
+    Needs `Authorization: Bearer <EXPORT_TOKEN>`; disabled while EXPORT_TOKEN is unset.
+    Large exports run for minutes: serve with --threads (gthread) or a long --timeout.
     """
-    print(f"DEBUG: Received revised analysis request at /analyze.")
-    if not ai_client:
-        print("ERROR: AI client not configured. Cannot perform analysis.")
-        return jsonify({"success": False, "error": "AI 服務目前無法使用。"}), 503 # Service Unavailable
+    if not EXPORT_TOKEN:
+        abort(404)
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode('utf-8'), EXPORT_TOKEN.encode('utf-8')):
+        return jsonify({"success": False, "error": "未授權的匯出請求。"}), 401
+    works = works_store.list_works() # Images are immutable and content-addressed: this snapshot stays consistent
+    log.info(f"Exporting {len(works)} works.")
+    response = Response(stream_with_context(iter_gallery_zip(works, open_stored_image)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f"attachment; filename=lhtl-gallery-{time.strftime('%Y%m%d-%H%M%S')}.zip"
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.cli.command('export-gallery')
+@click.argument('output', type=click.Path(dir_okay=False, path_type=Path))
+def export_gallery_command(output):
+    """Writes the same ZIP as GET /export to OUTPUT (flask --app app export-gallery backup.zip)."""
+    stats = {}
+    with open(output, 'wb') as f:
+        for chunk in iter_gallery_zip(works_store.list_works(), open_stored_image, stats=stats):
+            f.write(chunk)
+    print(f"INFO: Exported {stats['works']} works and {stats['images']} images to {output} "
+          f"({stats['missingImages']} missing images skipped).")
+
+def import_gallery_archive(archive_path):
+    """
+    Imports an export archive: images go into the blob store (deduplicated, renamed to
+    their content hash), then all new works are inserted in one works store batch.
+    Returns (inserted work entries, number skipped). Works whose id exists are skipped
+    (also when it is inserted elsewhere during the import); the images stored for skipped
+    works, or for all of them if the import fails, are released again.
+    """
+    from PIL import Image
 
-    # Ensure request is JSON
-    if not request.is_json:
-         return jsonify({"success": False, "error": "請求格式錯誤 (需要 JSON)。"}), 415 # Unsupported Media Type
+    existing = {w["id"] for w in works_store.list_works()}
+    entries, committed, skipped = [], [], 0
+    with zipfile.ZipFile(archive_path) as zf:
+        manifest, works = read_gallery_archive(zf)
+        log.info(f"Importing archive from {manifest.get('createdAt')} ({manifest.get('works')} works).")
+        try:
+            for work in works:
+                if work["id"] in existing:
+                    skipped += 1
+                    continue
+                filenames = {}
+                for key in ("scorecardFilename", "comicFilename"):
+                    with zf.open(image_member(work[key])) as src:
+                        pending = blob_store.ingest(src)
+                    try:
+                        with Image.open(pending.temp_path) as img: # Same check as /upload: truncated / corrupt files fail
+                            extension = IMAGE_FORMAT_EXTENSIONS.get(img.format)
+                            img.verify()
+                    except Exception as img_err:
+                        log.warning(f"Import: {work[key]} failed verification: {img_err}")
+                        extension = None
+                    if not extension:
+                        blob_store.discard(pending)
+                        break
+                    relative_path, _ = blob_store.commit(pending, extension)
+                    committed.append(relative_path)
+                    filenames[key] = f"{UPLOAD_BLOB_SUBDIR}/{relative_path}"
+                else:
+                    work.pop("renditions", None)
+                    entries.append({**work, **filenames})
+                    existing.add(work["id"]) # Only now: a later valid copy of a rejected work is still imported
+                    continue
+                log.warning(f"Import: skipping work {work['id']}: {work[key]} is not a valid PNG, JPG or GIF image")
+                skipped += 1
+                for filename in filenames.values():
+                    blob_store.release(filename.split('/', 1)[1])
+                del committed[len(committed) - len(filenames):]
+            inserted_ids = set(works_store.import_works(entries)) # One transaction (SQLite), however many works
+        except BaseException:
+            for relative_path in committed:
+                blob_store.release(relative_path)
+            raise
+    inserted = [work for work in entries if work["id"] in inserted_ids]
+    try:
+        search_index.index_works(inserted) # Searchable right away, no reconcile needed
+    except Exception as index_err:
+        log.warning(f"Indexing imported works for search failed: {index_err}")
+    for work in entries:
+        if work["id"] not in inserted_ids: # Added concurrently since the `existing` snapshot
+            for key in ("scorecardFilename", "comicFilename"):
+                blob_store.release(work[key].split('/', 1)[1])
+    return inserted, skipped + len(entries) - len(inserted)
+
+@app.cli.command('import-gallery')
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option('--skip-renditions', is_flag=True, help="Don't generate thumbnails now (`flask renditions` does it later).")
+def import_gallery_command(archive, skip_renditions):
+    """Imports works and images from an export ZIP (flask --app app import-gallery backup.zip)."""
+    try:
+        inserted, skipped = import_gallery_archive(archive)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise click.ClickException(str(e))
+    print(f"INFO: Imported {len(inserted)} works ({skipped} skipped: already present or invalid).")
+    if not skip_renditions:
+        print(f"INFO: Generating renditions for {len(inserted)} works...")
+        for work in inserted:
+            generate_work_renditions(work["id"], work["scorecardFilename"], work["comicFilename"])
 
-    data = request.get_json()
-    if not data:
-        return jsonify({"success": False, "error": "請求資料缺失或格式錯誤。"}), 400
 
-    # --- Extract and Validate Input Data ---
-    scorecard_base64 = data.get('scorecard_base64')
-    comic_base64 = data.get('comic_base64')
-    author = data.get('author', '學生').strip()
-    habits = data.get('habits', '').strip()
-    reflection = data.get('reflection', '').strip()
-    generate_audio = data.get('generate_audio', True) # Default to true
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    """
+    Serves files from the UPLOAD_FOLDER with long-lived immutable caching.
 
-    if not scorecard_base64 or not comic_base64:
-        return jsonify({"success": False, "error": "圖片 Base64 資料缺失。"}), 400
+    Upload filenames are content hashes (or unique legacy names), so the content behind
+    a URL never changes: responses carry `Cache-Control: immutable` and a strong ETag, support
+    If-None-Match / Range, and can hand the byte transfer to a fronting proxy
+    (UPLOAD_SERVE_MODE = 'x-accel' for nginx, 'x-sendfile' for Apache/lighttpd).
+    With S3 storage the browser is redirected to the object (presigned / public URL) instead.
+    """
+    # safe_join rejects absolute paths and '..' segments without touching the disk
+    safe_path = safe_join(UPLOAD_FOLDER_STR, filename)
+    # Hidden segments are never served (in-progress uploads live in blobs/.incoming)
+    if safe_path is None or any(part.startswith('.') for part in filename.split('/')):
+        log.warning(f"Denied access to escaped path: {filename}")
+        abort(404)
+    if storage.shared:
+        # No round trip to the store: the URL is signed locally and S3 answers 404 itself
+        response = redirect(storage.read_url(filename), 302)
+        response.headers['Cache-Control'] = f"public, max-age={storage.read_url_max_age}"
+        return response
+    try:
+        st = os.stat(safe_path) # Single syscall instead of resolve() + is_file()
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    etag = hashlib.sha1(f"{filename}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+    cache_control = f"public, max-age={UPLOAD_CACHE_MAX_AGE}, immutable"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif UPLOAD_SERVE_MODE in ('x-accel', 'x-sendfile'):
+        # The proxy streams the bytes (and handles Range); the worker only sends headers
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        if UPLOAD_SERVE_MODE == 'x-accel':
+            response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + quote(filename)
+        else:
+            response.headers['X-Sendfile'] = safe_path
+    else:
+        # send_file handles Range / If-Range / If-Modified-Since when conditional=True
+        response = send_file(safe_path, conditional=True, etag=etag, last_modified=st.st_mtime,
+                             max_age=UPLOAD_CACHE_MAX_AGE)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
 
-    # Basic Base64 Data URL validation
-    if not scorecard_base64.startswith('data:image/') or not comic_base64.startswith('data:image/'):
-        print(f"WARN: Invalid Base64 prefix received. Scorecard starts: {scorecard_base64[:30]}, Comic starts: {comic_base64[:30]}")
-        return jsonify({"success": False, "error": "圖片資料格式錯誤 (非 Base64 Data URL)。"}), 400
 
-    # --- Prepare Prompts ---
-    # Refined prompts for better analysis focus
-    system_prompt = "你是一位友善、專業、有洞察力的學習助教。請務必使用**繁體中文**進行回覆。你的目標是根據學生提供的文字和圖片，進行全面分析，並給予具體、鼓勵性的回饋。請使用 Markdown 格式。"
+# --- AI Analysis ---
+# Refined prompts for better analysis focus
+ANALYSIS_SYSTEM_PROMPT = "你是一位友善、專業、有洞察力的學習助教。請務必使用**繁體中文**進行回覆。你的目標是根據學生提供的文字和圖片，進行全面分析，並給予具體、鼓勵性的回饋。請使用 Markdown 格式。"
 
-    user_prompt_text = f"""
+ANALYSIS_USER_PROMPT_TEMPLATE = """
 請分析以下來自「{author}」同學的習慣養成紀錄：
 
 一、學生自述：
 
 * **目前的習慣描述：**
     ```
-    {habits if habits else "(學生未提供文字描述)"}
+    {habits}
     ```
 * **反思與展望：**
     ```
-    {reflection if reflection else "(學生未提供文字反思)"}
+    {reflection}
     ```
 
 二、學生作品圖片：
@@ -451,112 +1115,844 @@ def analyze_current_work_revised():
 **請以簡潔有力、清晰的 Markdown 格式呈現你的分析報告。**
 """
 
+def build_analysis_messages(author, habits, reflection, scorecard_data_url, comic_data_url):
+    """Builds the chat messages payload (system prompt + text + both images)."""
+    user_prompt_text = ANALYSIS_USER_PROMPT_TEMPLATE.format(
+        author=author,
+        habits=habits if habits else "(學生未提供文字描述)",
+        reflection=reflection if reflection else "(學生未提供文字反思)"
+    )
+    return [
+         {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+         {"role": "user", "content": [
+             {"type": "text", "text": user_prompt_text},
+             # Use "auto" detail for balancing cost/quality, or "high" if detail is crucial
+             {"type": "image_url", "image_url": {"url": scorecard_data_url, "detail": "auto"}},
+             {"type": "image_url", "image_url": {"url": comic_data_url, "detail": "auto"}}
+         ]}
+    ]
+
+def analysis_cache_key(author, habits, reflection, image_digests):
+    """Cache key over everything that determines the analysis output."""
+    return make_cache_key(
+        "analysis-v1", ANALYSIS_MODEL, ANALYSIS_TEMPERATURE, ANALYSIS_MAX_TOKENS,
+        ANALYSIS_SYSTEM_PROMPT, ANALYSIS_USER_PROMPT_TEMPLATE,
+        author, habits, reflection, *image_digests
+    )
+
+def lookup_cached_analysis(cache_key):
+    """analysis_cache.get(), timed and counted as a hit / miss."""
+    with span('cache'):
+        cached_result = analysis_cache.get(cache_key)
+    count_cache('analysis', 'hit' if cached_result else 'miss')
+    return cached_result
+
+def join_analysis_flight(cache_key):
+    """
+    After a cache miss: waits for an identical analysis already running (in any worker).
+    Returns (its result, None), or (None, lease) if this request runs it and must release the lease.
+    """
+    with span('coalesce'):
+        result, lease = upstream_flights.acquire(cache_key, lambda: analysis_cache.get(cache_key, count=False))
+    if result:
+        count_cache('analysis', 'coalesced')
+    return result, lease
+
+def run_analysis(author, habits, reflection, image_digests, load_images, generate_audio=True, inline_audio=False):
+    """
+    Runs the chat (vision) analysis and, optionally, TTS - or returns the cached result.
+
+    image_digests identify the image contents for the cache key; load_images() is only
+    called on a cache miss and returns (scorecard_data_url, comic_data_url).
+    Audio is not synthesized here: the response points at /audio/<analysis_id>.mp3, which
+    streams (and caches) the speech on first request. inline_audio=True restores the old
+    behaviour of embedding the MP3 as base64 for older clients.
+    Returns (response_data, status_code) where response_data has the /analyze JSON shape:
+    { success, analysis, analysis_id, [audio_url], [audio_data_base64], [audio_error], [error], [cached] }
+    Concurrent identical misses are coalesced: one request calls the model, the others get its result.
+    """
+    cache_key = analysis_cache_key(author, habits, reflection, image_digests)
+    cached_result = lookup_cached_analysis(cache_key)
+    lease = None
+    if not cached_result:
+        cached_result, lease = join_analysis_flight(cache_key)
+    try:
+        return _run_analysis(cache_key, cached_result, lease, author, habits, reflection, load_images,
+                             generate_audio, inline_audio)
+    finally:
+        if lease:
+            lease.release()
+
+def _run_analysis(cache_key, cached_result, lease, author, habits, reflection, load_images,
+                  generate_audio, inline_audio):
     analysis_result_text = None
     response_data = {"success": False} # Prepare response dict
 
-    # --- Call OpenAI Chat API (with Vision) ---
-    try:
-        # Choose appropriate model (gpt-4o is generally good for vision and cost)
-        model_to_use = "gpt-4.1-mini-2025-04-14"
-        print(f"DEBUG: Sending Chat request to OpenAI model: {model_to_use}...")
-
-        messages_payload = [
-             {"role": "system", "content": system_prompt},
-             {"role": "user", "content": [
-                 {"type": "text", "text": user_prompt_text},
-                 # Use "auto" detail for balancing cost/quality, or "high" if detail is crucial
-                 {"type": "image_url", "image_url": {"url": scorecard_base64, "detail": "auto"}},
-                 {"type": "image_url", "image_url": {"url": comic_base64, "detail": "auto"}}
-             ]}
-        ]
-
-        # Make the API call
-        chat_response = ai_client.chat.completions.create(
-            model=model_to_use,
-            messages=messages_payload,
-            max_tokens=1500, # Increased slightly for potentially detailed analysis
-            temperature=0.6 # Slightly lower temperature for more focused analysis
-            )
+    if cached_result:
+        log.debug(f"Analysis cache hit ({cache_key[:12]}).")
+        analysis_result_text = cached_result["analysis"]
+        response_data.update(success=True, analysis=analysis_result_text, cached=True)
+    else:
+        try:
+            with span('images'):
+                scorecard_data_url, comic_data_url = load_images()
+        except Exception as e:
+            log.error(f"Loading images for analysis failed: {e}")
+            response_data["error"] = "無法讀取作品圖片，無法分析。"
+            return response_data, 500
 
-        # Validate response structure
-        if not chat_response.choices or not chat_response.choices[0].message or not chat_response.choices[0].message.content:
-             # Log the raw response if possible for debugging
-             print(f"ERROR: Invalid chat response structure. Response: {chat_response}")
-             raise Exception("從 AI 收到的回應結構無效。")
+        # --- Call OpenAI Chat API (with Vision) ---
+        try:
+            log.debug(f"Sending Chat request to OpenAI model: {ANALYSIS_MODEL}...")
+            messages_payload = build_analysis_messages(author, habits, reflection, scorecard_data_url, comic_data_url)
+
+            # Make the API call
+            with span('chat'):
+                chat_response = ai_gateway.call(
+                    get_ai_client().chat.completions.create,
+                    model=ANALYSIS_MODEL,
+                    messages=messages_payload,
+                    max_tokens=ANALYSIS_MAX_TOKENS,
+                    temperature=ANALYSIS_TEMPERATURE
+                    )
+            count_chat_usage(ANALYSIS_MODEL, getattr(chat_response, 'usage', None))
+
+            # Validate response structure
+            if not chat_response.choices or not chat_response.choices[0].message or not chat_response.choices[0].message.content:
+                 # Log the raw response if possible for debugging
+                 log.error(f"Invalid chat response structure. Response: {chat_response}")
+                 raise Exception("從 AI 收到的回應結構無效。")
+
+            analysis_result_text = chat_response.choices[0].message.content.strip()
+
+            # Basic check for meaningful content (e.g., more than a few words)
+            if not analysis_result_text or len(analysis_result_text) < 10:
+                 log.warning(f"OpenAI returned very short or empty analysis content: '{analysis_result_text}'")
+                 # Treat as success but maybe indicate potential issue? Or raise error?
+                 # For now, let it pass but log it.
+                 # raise Exception("AI 回傳的分析內容過短或空白。") # Option to make it an error
+
+            response_data["success"] = True
+            response_data["analysis"] = analysis_result_text
+            log.debug(f"Received analysis text (length: {len(analysis_result_text)}).")
+            analysis_cache.set(cache_key, {"analysis": analysis_result_text, "model": ANALYSIS_MODEL, "createdAt": utc_now_iso()})
+            if lease:
+                lease.release() # Waiting duplicates can answer now, before our audio work
+
+        except AIUnavailableError as e:
+            log.warning(f"Analysis rejected, AI upstream unavailable: {e}")
+            response_data.update(error=AI_UNAVAILABLE_MESSAGE, retry_after=math.ceil(e.retry_after))
+            return response_data, 503
+        except Exception as e:
+            log.error(f"OpenAI Chat API call failed: {e}")
+            response_data["error"] = chat_error_message(e)
+            return response_data, 500
 
-        analysis_result_text = chat_response.choices[0].message.content.strip()
+    response_data["analysis_id"] = cache_key
+    attach_analysis_audio(response_data, cache_key, analysis_result_text, generate_audio, inline_audio)
+    return response_data, 200
 
-        # Basic check for meaningful content (e.g., more than a few words)
-        if not analysis_result_text or len(analysis_result_text) < 10:
-             print(f"WARN: OpenAI returned very short or empty analysis content: '{analysis_result_text}'")
-             # Treat as success but maybe indicate potential issue? Or raise error?
-             # For now, let it pass but log it.
-             # raise Exception("AI 回傳的分析內容過短或空白。") # Option to make it an error
 
-        response_data["success"] = True
-        response_data["analysis"] = analysis_result_text
-        print(f"DEBUG: Received analysis text (length: {len(analysis_result_text)}).")
+def run_analysis_stream(author, habits, reflection, image_digests, load_images, generate_audio=True, inline_audio=False):
+    """
+    Streaming variant of run_analysis(): a generator of (event, payload) pairs.
+
+    start -> { analysis_id, cached }
+    token -> { text }                 (one per model delta; a single token for cache hits)
+    audio -> { index, url } | { index, error }
+                                      (one per speech segment, in order; only with generate_audio)
+    done  -> same dict as the non-streaming /analyze JSON response, plus audio_segments (count)
+    error -> { success: false, error } (terminal)
+
+    With generate_audio, each paragraph is sent to TTS as soon as the model has finished
+    writing it, so the first audio segment is ready long before the whole text is.
+    A duplicate of an analysis that is already streaming elsewhere waits for it and is
+    then answered like a cache hit.
+    """
+    cache_key = analysis_cache_key(author, habits, reflection, image_digests)
+    cached_result = lookup_cached_analysis(cache_key)
+    lease = speech = None
+    try: # Everything after acquiring the lease runs inside try: a disconnect must release it
+        if not cached_result:
+            cached_result, lease = join_analysis_flight(cache_key)
+        yield "start", {"analysis_id": cache_key, "cached": bool(cached_result)}
+        speech = SpeechPipeline(tts_segment_executor, synthesize_speech_segment) if generate_audio else None
+        yield from _run_analysis_stream(cache_key, cached_result, lease, speech, author, habits, reflection,
+                                        load_images, generate_audio, inline_audio)
+    finally:
+        if speech:
+            speech.cancel() # Client disconnected: don't synthesize segments nobody will hear
+        if lease:
+            lease.release()
+
+def _run_analysis_stream(cache_key, cached_result, lease, speech, author, habits, reflection,
+                         load_images, generate_audio, inline_audio):
+    segmenter = SpeechSegmenter(TTS_SEGMENT_MIN_CHARS, TTS_SEGMENT_MAX_CHARS)
+
+    if cached_result:
+        log.debug(f"Analysis cache hit ({cache_key[:12]}).")
+        analysis_result_text = cached_result["analysis"]
+        yield "token", {"text": analysis_result_text}
+        if speech:
+            for segment in split_speech_segments(analysis_result_text, TTS_SEGMENT_MIN_CHARS, TTS_SEGMENT_MAX_CHARS):
+                speech.submit(segment)
+    else:
+        try:
+            with span('images'):
+                scorecard_data_url, comic_data_url = load_images()
+        except Exception as e:
+            log.error(f"Loading images for analysis failed: {e}")
+            yield "error", {"success": False, "error": "無法讀取作品圖片，無法分析。"}
+            return
 
-    except Exception as e:
-        print(f"ERROR: OpenAI Chat API call failed: {e}", flush=True)
-        # Provide more context if it's an APIError from OpenAI client
-        error_message = "AI 文字分析時發生錯誤。"
-        if hasattr(e, 'status_code'): # Check if it looks like an API error
-             error_message += f" (狀態碼: {e.status_code})"
-        # Consider logging e for detailed traceback
-        response_data["error"] = error_message
-        return jsonify(response_data), 500 # Return error JSON
-
-    # --- Generate Audio IF analysis succeeded AND requested ---
-    if response_data["success"] and generate_audio:
         try:
-            # Choose TTS model and voice
-            tts_model = "tts-1" # or tts-1-hd
-            tts_voice = "alloy" # alloy, echo, fable, onyx, nova, shimmer
-
-            print(f"DEBUG: Sending TTS request (model: {tts_model}, voice: {tts_voice})...")
-            tts_response = ai_client.audio.speech.create(
-                model=tts_model,
-                voice=tts_voice,
-                input=analysis_result_text, # Use the generated analysis text
-                response_format="mp3" # Common format, good balance
+            log.debug(f"Sending streaming Chat request to OpenAI model: {ANALYSIS_MODEL}...")
+            chat_started = time.perf_counter()
+            chat_stream = ai_gateway.call(
+                get_ai_client().chat.completions.create,
+                model=ANALYSIS_MODEL,
+                messages=build_analysis_messages(author, habits, reflection, scorecard_data_url, comic_data_url),
+                max_tokens=ANALYSIS_MAX_TOKENS,
+                temperature=ANALYSIS_TEMPERATURE,
+                stream=True,
+                stream_options={"include_usage": True} # Token usage arrives in a final, choice-less chunk
             )
-            # Read the audio content directly into memory (more efficient than streaming to file)
-            audio_bytes = tts_response.content # .content holds the raw bytes
-            if not audio_bytes:
-                raise ValueError("TTS API returned empty audio content.")
-
+            text_parts = []
+            for chunk in chat_stream:
+                if getattr(chunk, 'usage', None):
+                    count_chat_usage(ANALYSIS_MODEL, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not text_parts:
+                        record_span('chat_first_token', time.perf_counter() - chat_started)
+                    text_parts.append(delta)
+                    yield "token", {"text": delta}
+                    if speech:
+                        for segment in segmenter.feed(delta):
+                            speech.submit(segment)
+                        yield from speech_segment_events(speech.ready())
+
+            record_span('chat', time.perf_counter() - chat_started)
+            analysis_result_text = "".join(text_parts).strip()
+            if not analysis_result_text:
+                raise Exception("從 AI 收到的回應內容為空白。")
+            log.debug(f"Streamed analysis text (length: {len(analysis_result_text)}).")
+            analysis_cache.set(cache_key, {"analysis": analysis_result_text, "model": ANALYSIS_MODEL, "createdAt": utc_now_iso()})
+            if lease:
+                lease.release()
+        except AIUnavailableError as e:
+            log.warning(f"Analysis rejected, AI upstream unavailable: {e}")
+            yield "error", {"success": False, "error": AI_UNAVAILABLE_MESSAGE, "retry_after": math.ceil(e.retry_after)}
+            return
+        except Exception as e:
+            log.error(f"OpenAI streaming Chat API call failed: {e}")
+            yield "error", {"success": False, "error": chat_error_message(e)}
+            return
+        if speech:
+            for segment in segmenter.flush():
+                speech.submit(segment)
+
+    response_data = {"success": True, "analysis": analysis_result_text, "analysis_id": cache_key}
+    if cached_result:
+        response_data["cached"] = True
+    if speech:
+        response_data["audio_segments"] = yield from speech_segment_events(speech.drain(TTS_SEGMENT_TIMEOUT_SECONDS))
+    attach_analysis_audio(response_data, cache_key, analysis_result_text, generate_audio, inline_audio)
+    yield "done", response_data
+
+def speech_segment_events(results):
+    """Turns SpeechPipeline results into SSE `audio` events; returns how many were emitted."""
+    count = 0
+    for index, segment_key, error in results:
+        count += 1
+        if error:
+            log.error(f"TTS for speech segment {index} failed: {error!r}")
+            yield "audio", {"index": index, "error": "此段語音合成失敗。"}
+        else:
+            yield "audio", {"index": index, "url": f"/audio/segments/{segment_key}.mp3"}
+    return count
+
+
+AI_UNAVAILABLE_MESSAGE = "AI 服務暫時忙碌中，請稍後再試。"
+
+def chat_error_message(e):
+    """User-facing message for a failed chat call."""
+    # Provide more context if it's an APIError from OpenAI client
+    error_message = "AI 文字分析時發生錯誤。"
+    if hasattr(e, 'status_code'): # Check if it looks like an API error
+         error_message += f" (狀態碼: {e.status_code})"
+    return error_message
+
+def attach_analysis_audio(response_data, analysis_id, analysis_text, generate_audio, inline_audio):
+    """Adds audio_url (and, for legacy clients, inline base64 audio) to a successful analysis response."""
+    if not (response_data.get("success") and generate_audio):
+        return
+    response_data["audio_url"] = f"/audio/{analysis_id}.mp3"
+    if inline_audio:
+        try:
+            audio_bytes = synthesize_analysis_audio(analysis_id, analysis_text)
             # Encode audio bytes as Base64 string for JSON transport
-            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-            response_data["audio_data_base64"] = audio_base64 # Add to JSON response
-            print(f"DEBUG: Included Base64 audio in response (MP3 bytes: {len(audio_bytes)}, Base64 length: {len(audio_base64)}).")
-
+            response_data["audio_data_base64"] = base64.b64encode(audio_bytes).decode('utf-8')
+            log.debug(f"Included Base64 audio in response (MP3 bytes: {len(audio_bytes)}).")
         except Exception as e:
-            print(f"ERROR: OpenAI TTS API call failed: {e}", flush=True)
+            log.error(f"OpenAI TTS API call failed: {e}")
             # Don't fail the whole request if only TTS fails. Add error info to the response.
             response_data["audio_error"] = "語音合成失敗，但文字分析已完成。"
-            # Do not add the audio_data_base64 key if TTS failed
 
-    # --- Return the final JSON response ---
-    # Structure: { success: true/false, analysis: "...", [audio_data_base64: "..."], [audio_error: "..."], [error: "..."] }
-    print(f"DEBUG: Returning analysis response. Keys: {list(response_data.keys())}")
-    return jsonify(response_data)
+def wants_event_stream():
+    """True if the client asked for a Server-Sent Events response (Accept header or ?stream=1)."""
+    return (request.args.get('stream', '').lower() in ('1', 'true')
+            or 'text/event-stream' in request.headers.get('Accept', ''))
+
+def format_sse(event, payload):
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def analysis_response(analysis_args):
+    """Runs an analysis and returns either a JSON response or an SSE stream, as the client asked."""
+    if wants_event_stream():
+        def generate():
+            yield ": analysis started\n\n" # Flush headers + first byte immediately
+            for event, payload in run_analysis_stream(*analysis_args):
+                yield format_sse(event, payload)
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no' # Tell nginx not to buffer the stream
+        return response
+
+    response_data, status_code = run_analysis(*analysis_args)
+    # Structure: { success: true/false, analysis: "...", analysis_id: "...", [audio_url: "..."], [audio_data_base64: "..."], [audio_error: "..."], [error: "..."], [retry_after: s] }
+    log.debug(f"Returning analysis response. Keys: {list(response_data.keys())}")
+    response = jsonify(response_data)
+    if "retry_after" in response_data:
+        response.headers['Retry-After'] = str(response_data["retry_after"])
+    return response, status_code
+
+
+# --- Analysis Audio (TTS) ---
+def tts_cache_key(analysis_id):
+    """Audio cache key: the analysis plus the TTS settings that shape the audio."""
+    return make_cache_key("tts-v1", TTS_MODEL, TTS_VOICE, analysis_id)
+
+def join_audio_flight(audio_key):
+    """join_analysis_flight() for TTS: returns (cached path, None) or (None, lease)."""
+    with span('coalesce'):
+        cached_path, lease = upstream_flights.acquire(audio_key, lambda: audio_cache.get_path(audio_key))
+    if cached_path:
+        count_cache('audio', 'coalesced')
+    return cached_path, lease
+
+def synthesize_to_audio_cache(audio_key, text):
+    """Returns the cached MP3 path for audio_key, calling TTS for text if it isn't cached yet."""
+    cached_path = audio_cache.get_path(audio_key)
+    count_cache('audio', 'hit' if cached_path else 'miss')
+    if cached_path:
+        return cached_path
+    cached_path, lease = join_audio_flight(audio_key)
+    if cached_path:
+        return cached_path
+    try:
+        return _synthesize_to_audio_cache(audio_key, text)
+    finally:
+        lease.release()
+
+def _synthesize_to_audio_cache(audio_key, text):
+    log.debug(f"Sending TTS request (model: {TTS_MODEL}, voice: {TTS_VOICE}, chars: {len(text)})...")
+    with span('tts'):
+        tts_response = ai_gateway.call(
+            get_ai_client().audio.speech.create,
+            model=TTS_MODEL,
+            voice=TTS_VOICE,
+            input=text, # Use the generated analysis text
+            response_format="mp3" # Common format, good balance
+        )
+    count_usage(TTS_MODEL, 'tts_characters', len(text))
+    audio_bytes = tts_response.content # .content holds the raw bytes
+    if not audio_bytes:
+        raise ValueError("TTS API returned empty audio content.")
+    return audio_cache.store(audio_key, audio_bytes)
+
+def synthesize_analysis_audio(analysis_id, text):
+    """Returns the MP3 bytes for an analysis, from the audio cache or a fresh TTS call."""
+    return synthesize_to_audio_cache(tts_cache_key(analysis_id), text).read_bytes()
+
+# Paragraph TTS for streamed analyses (bounded: segments beyond this wait in the pool's queue)
+tts_segment_executor = ThreadPoolExecutor(max_workers=TTS_SEGMENT_WORKERS, thread_name_prefix='tts-segments')
+
+def tts_segment_key(text):
+    """Audio cache key of one speech segment (content-addressed, so repeats are free)."""
+    return make_cache_key("tts-segment-v1", TTS_MODEL, TTS_VOICE, text)
+
+def synthesize_speech_segment(text):
+    """Synthesizes one speech segment into the audio cache and returns its key."""
+    segment_key = tts_segment_key(text)
+    synthesize_to_audio_cache(segment_key, text)
+    return segment_key
+
+
+def open_tts_stream(**kwargs):
+    """Starts a streamed TTS response; returns (context manager, entered response)."""
+    # Enter the streaming response here so upstream errors still produce a proper status
+    tts_stream = get_ai_client().audio.speech.with_streaming_response.create(**kwargs)
+    return tts_stream, tts_stream.__enter__()
+
+def audio_file_etag(path):
+    """
+    Strong ETag of a cached audio file, from its content: audio synthesized again after an
+    eviction has different bytes, so Range / If-Range never mix two files. Hashed once per
+    worker and file (a re-synthesized file is a new inode; mtime changes on every LRU hit).
+    """
+    st = os.stat(path)
+    return _audio_content_etag(str(path), st.st_ino, st.st_size)
 
+@functools.lru_cache(maxsize=1024)
+def _audio_content_etag(path, inode, size):
+    return file_digest(path)[:32]
+
+@app.route('/audio/<analysis_id>.mp3', methods=['GET'])
+def analysis_audio(analysis_id):
+    """
+    Serves the spoken version of an analysis.
+    Cached audio is sent as an immutable file (conditional + Range requests supported);
+    otherwise TTS output is streamed to the client as it arrives and cached on completion.
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', analysis_id):
+        abort(404)
+    audio_key = tts_cache_key(analysis_id)
+    cache_control = f"public, max-age={UPLOAD_CACHE_MAX_AGE}, immutable" # Audio for an analysis never changes
+
+    if (cached_path := audio_cache.get_path(audio_key)):
+        count_cache('audio', 'hit')
+        response = send_file(cached_path, mimetype='audio/mpeg', conditional=True,
+                             etag=audio_file_etag(cached_path), max_age=UPLOAD_CACHE_MAX_AGE)
+    else:
+        if not get_ai_client():
+            return jsonify({"success": False, "error": "AI 服務目前無法使用。"}), 503
+        cached_result = analysis_cache.get(analysis_id)
+        if not cached_result:
+            return jsonify({"success": False, "error": "找不到對應的分析結果。"}), 404
+
+        count_cache('audio', 'miss')
+        cached_path, lease = join_audio_flight(audio_key)
+        if cached_path: # An identical request (in any worker) synthesized it while we waited
+            response = send_file(cached_path, mimetype='audio/mpeg', conditional=True,
+                                 etag=audio_file_etag(cached_path), max_age=UPLOAD_CACHE_MAX_AGE)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        log.debug(f"Streaming TTS for analysis {analysis_id[:12]} (model: {TTS_MODEL}, voice: {TTS_VOICE})...")
+        try:
+            with span('tts_first_byte'): # Until the upstream answered; the audio itself is streamed after
+                tts_stream, tts_response = ai_gateway.call(
+                    open_tts_stream,
+                    model=TTS_MODEL,
+                    voice=TTS_VOICE,
+                    input=cached_result["analysis"],
+                    response_format="mp3"
+                )
+            count_usage(TTS_MODEL, 'tts_characters', len(cached_result["analysis"]))
+        except AIUnavailableError as e:
+            lease.release()
+            response = jsonify({"success": False, "error": AI_UNAVAILABLE_MESSAGE})
+            response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+            return response, 503
+        except Exception as e:
+            lease.release()
+            log.error(f"OpenAI TTS API call failed: {e}")
+            return jsonify({"success": False, "error": "語音合成失敗，請稍後再試。"}), 502
+
+        upstream_closed = False
+        def close_upstream():
+            # Idempotent: runs when the body is done and again from call_on_close
+            nonlocal upstream_closed
+            if upstream_closed:
+                return
+            upstream_closed = True
+            try:
+                tts_stream.__exit__(None, None, None) # Returns the upstream connection to the pool
+            finally:
+                lease.release() # Cached now (or failed): waiting duplicates proceed
+
+        def generate():
+            try:
+                yield from audio_cache.stream_and_store(audio_key, tts_response.iter_bytes(TTS_STREAM_CHUNK_BYTES))
+            except Exception as e:
+                # Headers are already sent; the client sees a truncated stream, nothing is cached
+                log.error(f"TTS stream for analysis {analysis_id[:12]} failed: {e}")
+            finally:
+                close_upstream()
+
+        # No ETag: the bytes aren't known yet (and re-synthesized audio differs from an evicted copy)
+        response = Response(stream_with_context(generate()), mimetype='audio/mpeg')
+        response.call_on_close(close_upstream) # Also when the body is never iterated
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+@app.route('/audio/segments/<segment_key>.mp3', methods=['GET'])
+def analysis_audio_segment(segment_key):
+    """Serves one paragraph of a streamed analysis' speech (announced by an SSE `audio` event)."""
+    if not re.fullmatch(r'[0-9a-f]{64}', segment_key):
+        abort(404)
+    cached_path = audio_cache.get_path(segment_key)
+    if not cached_path:
+        abort(404) # Evicted: the client falls back to the full /audio/<analysis_id>.mp3
+    response = send_file(cached_path, mimetype='audio/mpeg', conditional=True, etag=audio_file_etag(cached_path),
+                         max_age=UPLOAD_CACHE_MAX_AGE)
+    response.headers['Cache-Control'] = f"public, max-age={UPLOAD_CACHE_MAX_AGE}, immutable"
+    return response
+
+
+def stored_image_digest(filename):
+    """SHA-256 of a stored image: content-addressed blobs carry it in their name (no read, no S3 download)."""
+    if filename.startswith(UPLOAD_BLOB_SUBDIR + '/'):
+        return Path(filename).name.split('.', 1)[0]
+    return file_digest(storage.local_path(filename)) # Legacy uuid-named uploads
+
+
+def load_work_image_for_model(original_filename, renditions):
+    """
+    Returns a data URL of a stored work image at the vision model's input resolution.
+    Uses the pre-generated 'model' rendition when available, else downscales the original.
+    """
+    model_rendition = (renditions or {}).get("model")
+    if model_rendition:
+        try:
+            # Already JPEG at model size; strict: a corrupt rendition falls back to the original
+            data_url = encode_image_to_base64(storage.local_path(model_rendition["filename"]), strict=True)
+        except FileNotFoundError:
+            data_url = None
+        if data_url:
+            return data_url
+        log.warning(f"Model rendition of {original_filename} is missing or unreadable; using the original.")
+    try:
+        original_path = storage.local_path(original_filename)
+    except FileNotFoundError:
+        log.error(f"Stored image not found: {original_filename}")
+        return None
+    return encode_image_to_base64(original_path, max_size=MODEL_IMAGE_MAX_SIZE)
+
+
+def work_analysis_args(work, generate_audio=True, inline_audio=False):
+    """
+    Builds the run_analysis() arguments for a stored work.
+    Raises OSError/KeyError/TypeError if the work's images can't be read.
+    """
+    renditions = work.get("renditions") or {}
+    # The model sees the original downscaled to MODEL_IMAGE_MAX_SIZE, so key on both
+    with span('digest'):
+        image_digests = [f"{stored_image_digest(work[key])}@{MODEL_IMAGE_MAX_SIZE}"
+                         for key in ("scorecardFilename", "comicFilename")]
+
+    def load_images():
+        scorecard_data_url = load_work_image_for_model(work.get("scorecardFilename"), renditions.get("scorecard"))
+        comic_data_url = load_work_image_for_model(work.get("comicFilename"), renditions.get("comic"))
+        if not scorecard_data_url or not comic_data_url:
+            raise IOError("Image encoding failed.")
+        return scorecard_data_url, comic_data_url
+
+    return (
+        (work.get("author") or '學生').strip(),
+        (work.get("currentHabits") or '').strip(),
+        (work.get("reflection") or '').strip(),
+        image_digests, load_images, generate_audio, inline_audio
+    )
+
+
+@app.route('/works/<work_id>/analyze', methods=['POST'])
+def analyze_stored_work(work_id):
+    """
+    Performs AI analysis on a stored work. Images are loaded and downscaled server-side,
+    so the client only sends the work id (and optional { generate_audio: bool }).
+    Send `Accept: text/event-stream` (or ?stream=1) to receive tokens as they are generated.
+    """
+    log.debug(f"Received analysis request for stored work {work_id}.")
+    if not get_ai_client():
+        log.error("AI client not configured. Cannot perform analysis.")
+        return jsonify({"success": False, "error": "AI 服務目前無法使用。"}), 503 # Service Unavailable
+
+    work = works_store.get_work(work_id)
+    if not work:
+        return jsonify({"success": False, "error": "找不到指定的作品。"}), 404
+
+    data = request.get_json(silent=True) or {}
+    generate_audio = data.get('generate_audio', True) # Default to true
+    inline_audio = data.get('inline_audio', False) # Legacy: embed base64 MP3 instead of audio_url
+
+    try:
+        analysis_args = work_analysis_args(work, generate_audio, inline_audio)
+    except (OSError, KeyError, TypeError) as e:
+        log.error(f"Cannot read images of work {work_id}: {e}")
+        return jsonify({"success": False, "error": "無法讀取作品圖片，無法分析。"}), 500
+
+    return analysis_response(analysis_args)
+
+
+@app.route('/analyze/jobs', methods=['POST'])
+def submit_analysis_job():
+    """
+    Queues an analysis of a stored work ({ work_id, [generate_audio] }) on the bounded
+    background pool. Returns 202 with the job id; poll GET /analyze/jobs/<id> for the result.
+    Returns 429 (with Retry-After) when the queue is full.
+    """
+    if not get_ai_client():
+        return jsonify({"success": False, "error": "AI 服務目前無法使用。"}), 503
+
+    data = request.get_json(silent=True) or {}
+    work_id = data.get('work_id')
+    work = works_store.get_work(work_id) if isinstance(work_id, str) else None
+    if not work:
+        return jsonify({"success": False, "error": "找不到指定的作品。"}), 404
+
+    try:
+        analysis_args = work_analysis_args(work, data.get('generate_audio', True))
+    except (OSError, KeyError, TypeError) as e:
+        log.error(f"Cannot read images of work {work_id}: {e}")
+        return jsonify({"success": False, "error": "無法讀取作品圖片，無法分析。"}), 500
+
+    try:
+        job = analysis_jobs.submit("analyze-work", run_analysis, *analysis_args)
+    except QueueFullError as e:
+        log.warning(f"Rejected analysis job for work {work_id}: {e}")
+        response = jsonify({"success": False, "error": "目前分析請求過多，請稍後再試。"})
+        response.headers['Retry-After'] = str(ANALYSIS_JOB_RETRY_AFTER_SECONDS)
+        return response, 429
+
+    status_url = f"/analyze/jobs/{job['id']}"
+    response = jsonify({"success": True, "job_id": job["id"], "status": job["status"], "status_url": status_url})
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+@app.route('/analyze/jobs/<job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    """Returns an analysis job's status (queued / running / succeeded / failed) and, when done, its result."""
+    job = analysis_jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "找不到指定的分析工作。"}), 404
+    response = jsonify({"success": True, "job": job})
+    if job["status"] in ("queued", "running"):
+        response.headers['Retry-After'] = '1' # Polling hint
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/analyze', methods=['POST'])
+def analyze_current_work_revised():
+    """
+    Performs AI analysis on data provided in the request body (images + text).
+    Optionally returns an audio_url for the spoken analysis (or inline Base64 audio).
+    Prefer POST /works/<id>/analyze for stored works (no image upload needed).
+    Send `Accept: text/event-stream` (or ?stream=1) to receive tokens as they are generated.
+    """
+    log.debug(f"Received revised analysis request at /analyze.")
+    if not get_ai_client():
+        log.error("AI client not configured. Cannot perform analysis.")
+        return jsonify({"success": False, "error": "AI 服務目前無法使用。"}), 503 # Service Unavailable
+
+    # Ensure request is JSON
+    if not request.is_json:
+         return jsonify({"success": False, "error": "請求格式錯誤 (需要 JSON)。"}), 415 # Unsupported Media Type
+
+    with span('parse'): # Both images arrive as Base64 in the JSON body
+        data = request.get_json()
+    if not data:
+        return jsonify({"success": False, "error": "請求資料缺失或格式錯誤。"}), 400
+
+    # --- Extract and Validate Input Data ---
+    scorecard_base64 = data.get('scorecard_base64')
+    comic_base64 = data.get('comic_base64')
+    author = data.get('author', '學生').strip()
+    habits = data.get('habits', '').strip()
+    reflection = data.get('reflection', '').strip()
+    generate_audio = data.get('generate_audio', True) # Default to true
+    inline_audio = data.get('inline_audio', False) # Legacy: embed base64 MP3 instead of audio_url
+
+    if not scorecard_base64 or not comic_base64:
+        return jsonify({"success": False, "error": "圖片 Base64 資料缺失。"}), 400
+
+    # Basic Base64 Data URL validation
+    if not scorecard_base64.startswith('data:image/') or not comic_base64.startswith('data:image/'):
+        log.warning(f"Invalid Base64 prefix received. Scorecard starts: {scorecard_base64[:30]}, Comic starts: {comic_base64[:30]}")
+        return jsonify({"success": False, "error": "圖片資料格式錯誤 (非 Base64 Data URL)。"}), 400
+
+    with span('digest'):
+        image_digests = [hashlib.sha256(url.encode('utf-8')).hexdigest() for url in (scorecard_base64, comic_base64)]
+    # --- Return the final JSON response (or SSE stream) ---
+    return analysis_response((author, habits, reflection, image_digests,
+                              lambda: (scorecard_base64, comic_base64), generate_audio, inline_audio))
+
+
+@app.route('/analyze/cache/stats', methods=['GET'])
+def analysis_cache_stats():
+    """Hit/miss counters of this worker's analysis cache."""
+    return jsonify({"success": True, "pid": os.getpid(), **analysis_cache.stats()})
+
+
+@app.cli.command('analyze-all')
+@click.option('--concurrency', default=ANALYSIS_BATCH_CONCURRENCY, show_default=True, help='Analyses running at once.')
+@click.option('--rpm', default=ANALYSIS_BATCH_RPM, show_default=True, type=float, help='Max API requests per minute (0 = unlimited).')
+@click.option('--checkpoint', type=click.Path(dir_okay=False, path_type=Path), default=None,
+              help='Progress file (default: one per model/prompt version under cache/batch/).')
+@click.option('--restart', is_flag=True, help='Ignore (and truncate) existing progress.')
+def analyze_all_command(concurrency, rpm, checkpoint, restart):
+    """
+    (Re)analyzes every work with the current model and prompts (flask --app app analyze-all).
+    Results are stored on each work entry under "analysis" and in the analysis cache;
+    re-running after an interruption resumes from the checkpoint.
+    """
+    if not get_ai_client():
+        raise click.ClickException("OPENAI_API_KEY is not configured.")
+    # A new model / prompt version gets its own checkpoint, so a changed prompt re-runs everything
+    version = make_cache_key(ANALYSIS_MODEL, ANALYSIS_TEMPERATURE, ANALYSIS_MAX_TOKENS,
+                             ANALYSIS_SYSTEM_PROMPT, ANALYSIS_USER_PROMPT_TEMPLATE)[:12]
+    checkpoint = checkpoint or CACHE_FOLDER / 'batch' / f"analyze-{version}.jsonl"
+    if restart and checkpoint.exists():
+        checkpoint.unlink()
+
+    def analyze(work, limiter):
+        analysis_args = list(work_analysis_args(work, generate_audio=False))
+        load_images = analysis_args[4]
+        def throttled_load_images(): # Only called on a cache miss, right before the chat request
+            limiter.acquire()
+            return load_images()
+        analysis_args[4] = throttled_load_images
+        result, _ = run_analysis(*analysis_args)
+        if not result.get("success"):
+            return False, result.get("error", "analysis failed")
+        works_store.update_work(work["id"], {"analysis": {
+            "id": result["analysis_id"], "text": result["analysis"], "model": ANALYSIS_MODEL, "analyzedAt": utc_now_iso()
+        }})
+        return True, "cached" if result.get("cached") else "analyzed"
+
+    works = [w for w in works_store.list_works() if isinstance(w, dict) and w.get("id")]
+    stats = run_batch(works, analyze, checkpoint, concurrency=concurrency, per_minute=rpm)
+    latency = stats["latency_ms"]
+    print(f"INFO: Batch analysis finished: {stats['succeeded']} succeeded, {stats['failed']} failed, "
+          f"{stats['skipped']} skipped (checkpoint {checkpoint}).")
+    print(f"INFO: {stats['wall_seconds']} s wall time, {stats['works_per_minute']} works/min; "
+          f"latency p50 {latency['p50']} ms, p90 {latency['p90']} ms, p99 {latency['p99']} ms, max {latency['max']} ms.")
+
+
+# --- Static Assets & Index Page ---
+# static/ is fingerprinted and precompressed on first use (see static_assets.py);
+# index.html, with its asset URLs rewritten, is kept in memory with its own ETag.
+_static_state = None # {"manifest", "by_path", "index_page"}
+_static_state_lock = threading.Lock()
+
+def load_static_assets():
+    """Builds the asset manifest and renders index.html; falls back to the plain files if the build fails."""
+    try:
+        manifest = build_static_assets(STATIC_FOLDER, STATIC_BUILD_FOLDER)
+    except Exception as e:
+        log.error(f"Static asset build failed, serving unversioned /static files: {e}")
+        manifest = {}
+    try:
+        page = render_page(INDEX_PAGE, manifest)
+    except OSError as e:
+        log.critical(f"index.html could not be loaded: {e}")
+        page = None
+    return {"manifest": manifest, "by_path": {asset["path"]: asset for asset in manifest.values()}, "index_page": page}
+
+def static_files_changed(state):
+    page = state["index_page"]
+    return (page is None or INDEX_PAGE.stat().st_mtime_ns != page["mtime_ns"]
+            or any(p.stat().st_mtime_ns > page["mtime_ns"] for p in STATIC_FOLDER.rglob('*')))
+
+def get_static_assets():
+    """The static asset state, built on first use; in debug mode rebuilt when index.html or static/ changes."""
+    global _static_state
+    state = _static_state
+    if state is None or (app.debug and static_files_changed(state)):
+        with _static_state_lock:
+            if _static_state is state: # Not rebuilt by another thread meanwhile
+                _static_state = load_static_assets()
+            state = _static_state
+    return state
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprints and precompresses static/ ahead of time (flask --app app build-assets)."""
+    manifest = build_static_assets(STATIC_FOLDER, STATIC_BUILD_FOLDER)
+    print(f"INFO: {len(manifest)} static assets ready in {STATIC_BUILD_FOLDER}.")
+
+@app.route('/assets/<path:filename>')
+def static_asset(filename):
+    """Serves a fingerprinted asset (precompressed variant if accepted) with immutable caching."""
+    asset = get_static_assets()["by_path"].get(filename)
+    if not asset:
+        abort(404)
+    encoding = choose_precompressed_encoding(asset["encodings"])
+    etag = f"{asset['etag']}-{encoding}" if encoding else asset["etag"]
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = send_file(encoded_path(STATIC_BUILD_FOLDER, asset, encoding), mimetype=asset["mimetype"],
+                             conditional=True, etag=etag, max_age=UPLOAD_CACHE_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = f"public, max-age={UPLOAD_CACHE_MAX_AGE}, immutable" # URL changes with content
+    return response
 
 @app.route('/')
 def index():
-    """Serves the main index.html file."""
+    """Serves the main page from memory (asset URLs fingerprinted, precompressed, ETag-validated)."""
+    page = get_static_assets()["index_page"]
+    if page is None:
+         # Provide a minimal fallback or clear error
+         return "<h1>錯誤: 找不到主頁面檔案 (index.html)。</h1>", 404
+    encoding = choose_precompressed_encoding(page["encoded"])
+    etag = f"{page['etag']}-{encoding}" if encoding else page["etag"]
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(page["encoded"][encoding] if encoding else page["body"], mimetype='text/html')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate: a deploy changes the asset URLs inside
+    return response
+
+
+# --- Health & Start-up ---
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Cheap readiness probe for the host and keep-alive pings (no HTML, no AI client)."""
     try:
-        index_path = BASE_DIR / 'index.html'
-        if not index_path.is_file():
-             print("CRITICAL ERROR: index.html not found in application directory.")
-             # Provide a minimal fallback or clear error
-             return "<h1>錯誤: 找不到主頁面檔案 (index.html)。</h1>", 404
-        # Use send_from_directory for proper content type and caching headers
-        return send_from_directory(BASE_DIR, 'index.html')
+        works_store.generation() # One tiny query / stat: the data store is reachable
     except Exception as e:
-        print(f"ERROR: Failed to serve index.html: {e}")
-        abort(500) # Internal Server Error
+        log.error(f"Health check failed: {e}")
+        return jsonify({"success": False, "status": "unavailable", "error": "資料儲存目前無法使用。"}), 503
+    return jsonify({
+        "success": True,
+        "status": "ok",
+        "startup_ms": STARTUP_MS,
+        "uptime_seconds": round(time.monotonic() - _loaded_at),
+        "pid": os.getpid()
+    })
+
+def warm_up():
+    """
+    Does the work that is otherwise deferred to the first request: the OpenAI SDK / Pillow
+    imports and the static asset build. gunicorn.conf.py calls this in the master when
+    --preload is on, so every forked worker starts with it already done.
+    """
+    started = time.perf_counter()
+    if API_KEY:
+        import openai # noqa: F401 - the import is the slow part; each worker still creates its own client
+    import PIL.Image # noqa: F401
+    get_static_assets()
+    log.info(f"Warm-up done in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+STARTUP_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+_loaded_at = time.monotonic()
+log.info(f"App loaded in {STARTUP_MS} ms (pid {os.getpid()}).")
 
 
 if __name__ == '__main__':
@@ -569,7 +1965,7 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
 
     if is_production:
-         print(f"INFO: Detected production environment. (Flask debug mode OFF)")
+         log.info(f"Detected production environment. (Flask debug mode OFF)")
          # In production, Gunicorn/Waitress should be used externally to run the app.
          # This block might not even be reached if run via gunicorn app:app
          # If running directly (e.g., python app.py) in prod (not recommended),
@@ -577,17 +1973,17 @@ if __name__ == '__main__':
          # Example using Waitress if installed:
          # try:
          #     from waitress import serve
-         #     print(f"INFO: Starting Waitress server on port {port}...")
+         #     log.info(f"Starting Waitress server on port {port}...")
          #     serve(app, host='0.0.0.0', port=port)
          # except ImportError:
-         #     print("WARN: Waitress not installed. Falling back to Flask dev server (NOT recommended for production).")
+         #     log.warning("Waitress not installed. Falling back to Flask dev server (NOT recommended for production).")
          #     app.run(debug=False, host='0.0.0.0', port=port)
-         print("INFO: Production environment detected. Please use a WSGI server like Gunicorn or Waitress to run this application.")
-         print("INFO: Example: gunicorn --bind 0.0.0.0:{port} app:app")
+         log.info("Production environment detected. Please use a WSGI server like Gunicorn or Waitress to run this application.")
+         log.info("Example: gunicorn --bind 0.0.0.0:{port} app:app")
          # Running Flask dev server in production is insecure and inefficient
          # Forcing debug off if this block is somehow reached
          app.run(debug=False, host='0.0.0.0', port=port)
 
     else:
-         print(f"INFO: Starting Flask development server on http://0.0.0.0:{port} (Debug Mode ON)")
+         log.info(f"Starting Flask development server on http://0.0.0.0:{port} (Debug Mode ON)")
          app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
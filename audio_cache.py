@@ -0,0 +1,96 @@
+# LHTL/audio_cache.py
+"""
+Size-bounded on-disk cache of synthesized speech (MP3) for analysis results.
+
+Files are named after the analysis cache key, so the audio for a given analysis
+is synthesized once and then served as a static, immutable file by any worker.
+``stream_and_store`` lets the first request stream TTS bytes to the client while
+they are written to the cache; the file only becomes visible once complete.
+"""
+
+import os
+import logging
+import tempfile
+import threading
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """MP3 files under ``cache_dir``, evicted least-recently-used above ``max_bytes``."""
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.mp3"
+
+    def get_path(self, key: str) -> Path | None:
+        """Returns the cached file for key (marking it recently used), or None."""
+        path = self.path_for(key)
+        try:
+            os.utime(path) # mtime doubles as "last used" for LRU eviction
+        except OSError:
+            return None
+        return path
+
+    def stream_and_store(self, key: str, chunks):
+        """
+        Generator that yields each chunk of ``chunks`` while writing it to a temp file.
+        The temp file is renamed into the cache only if the whole stream completed.
+        """
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=path.name + '.', dir=path.parent)
+        completed = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    yield chunk
+            if os.path.getsize(tmp_path) == 0:
+                raise ValueError("TTS stream returned no audio data.")
+            os.replace(tmp_path, path)
+            completed = True
+        finally:
+            if not completed: # Client disconnected or upstream failed: never cache partial audio
+                Path(tmp_path).unlink(missing_ok=True)
+        self.enforce_limit()
+
+    def store(self, key: str, audio_bytes: bytes) -> Path:
+        """Stores complete audio bytes for key."""
+        for _ in self.stream_and_store(key, [audio_bytes]):
+            pass
+        return self.path_for(key)
+
+    def enforce_limit(self):
+        """Deletes least-recently-used files until the cache is below max_bytes."""
+        if not self._evict_lock.acquire(blocking=False):
+            return # Another thread is already evicting
+        try:
+            entries = []
+            total = 0
+            for path in self.cache_dir.glob('*/*.mp3'):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort() # Oldest (least recently used) first
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+            log.info(f"Audio cache trimmed to {total / 1024 / 1024:.1f} MB.")
+        finally:
+            self._evict_lock.release()
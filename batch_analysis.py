@@ -0,0 +1,146 @@
+# LHTL/batch_analysis.py
+"""
+Offline (re)analysis of the whole gallery.
+
+``run_batch`` runs an analysis callable over many works on a thread pool with a
+fixed concurrency and a requests-per-minute budget. Finished work ids are
+appended to a checkpoint file (one JSON line each, fsync'd), so an interrupted
+run picks up where it stopped when started again with the same checkpoint.
+The Flask CLI command ``flask --app app analyze-all`` wires it to the app's
+analysis pipeline; pointing OPENAI_BASE_URL at a local OpenAI-compatible fake
+server makes the whole run testable offline.
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from works_store import utc_now_iso
+
+
+class RateLimiter:
+    """Spaces calls evenly so no more than ``per_minute`` start in any minute (thread-safe)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until the next slot; returns the seconds waited."""
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return max(0.0, slot - now)
+
+
+class _TaskThrottle:
+    """One task's view of the shared RateLimiter; records how long the task was held back."""
+
+    def __init__(self, limiter: RateLimiter):
+        self._limiter = limiter
+        self.waited = 0.0
+
+    def acquire(self):
+        self.waited += self._limiter.acquire()
+
+
+def load_checkpoint(checkpoint_path: Path) -> set:
+    """Returns the ids of works already completed according to the checkpoint file."""
+    done = set()
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue # Torn last line of an interrupted run
+                if record.get("status") == "ok":
+                    done.add(record.get("work_id"))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def run_batch(works: list, analyze, checkpoint_path: Path, concurrency: int = 4, per_minute: float = 60,
+              log=print) -> dict:
+    """
+    Calls ``analyze(work, limiter)`` for every work not yet in the checkpoint.
+
+    ``analyze`` returns (ok: bool, detail: str) and must call ``limiter.acquire()``
+    right before each upstream API request (cache hits don't spend budget).
+    Returns run statistics (counts, wall time, throughput, latency percentiles).
+    Latencies exclude time spent waiting for the rate limiter.
+    """
+    checkpoint_path = Path(checkpoint_path)
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    done = load_checkpoint(checkpoint_path)
+    todo = [work for work in works if work.get("id") not in done]
+    log(f"INFO: {len(works)} works, {len(works) - len(todo)} already done, {len(todo)} to analyze "
+        f"(concurrency {concurrency}, {per_minute or 'unlimited'} requests/min).")
+
+    limiter = RateLimiter(per_minute)
+    checkpoint_lock = threading.Lock()
+    latencies = []
+    stats = {"total": len(works), "skipped": len(works) - len(todo), "succeeded": 0, "failed": 0}
+
+    def task(work):
+        throttle = _TaskThrottle(limiter)
+        started = time.perf_counter()
+        try:
+            ok, detail = analyze(work, throttle)
+        except Exception as e:
+            ok, detail = False, f"{type(e).__name__}: {e}"
+        return work, ok, detail, time.perf_counter() - started - throttle.waited
+
+    run_started = time.perf_counter()
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='batch-analysis') as executor:
+        futures = [executor.submit(task, work) for work in todo]
+        try:
+            for position, future in enumerate(as_completed(futures), start=1):
+                work, ok, detail, elapsed = future.result()
+                latencies.append(elapsed)
+                stats["succeeded" if ok else "failed"] += 1
+                with checkpoint_lock:
+                    checkpoint.write(json.dumps({"work_id": work["id"], "status": "ok" if ok else "failed",
+                                                "detail": detail, "at": utc_now_iso()}, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+                level = "INFO" if ok else "ERROR"
+                log(f"{level}: [{position}/{len(todo)}] work {work['id']}: {detail} ({elapsed * 1000:.0f} ms)")
+        except KeyboardInterrupt:
+            for future in futures:
+                future.cancel()
+            log("WARN: Interrupted; finished works are checkpointed, re-run to resume.")
+            raise
+
+    wall_seconds = time.perf_counter() - run_started
+    latencies.sort()
+    stats.update({
+        "wall_seconds": round(wall_seconds, 2),
+        "works_per_minute": round(len(latencies) / wall_seconds * 60, 1) if wall_seconds and latencies else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000),
+            "p90": round(percentile(latencies, 0.90) * 1000),
+            "p99": round(percentile(latencies, 0.99) * 1000),
+            "max": round(latencies[-1] * 1000) if latencies else 0,
+        },
+    })
+    return stats
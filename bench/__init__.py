@@ -0,0 +1,2 @@
+# LHTL/bench/__init__.py
+"""Load benchmark harness (python -m bench.run --help)."""
@@ -0,0 +1,134 @@
+# LHTL/bench/fake_openai.py
+"""
+Local stand-in for the OpenAI endpoints the app uses, with configurable latency.
+
+    POST /v1/chat/completions   (plain JSON or `stream: true` SSE chunks)
+    POST /v1/audio/speech       (fake MP3 bytes, streamed in chunks)
+
+Run standalone (python -m bench.fake_openai --port 18080) and point the app at it
+with OPENAI_BASE_URL=http://127.0.0.1:18080/v1 and any OPENAI_API_KEY.
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ANALYSIS_PARAGRAPHS = [
+    "## 整體回饋\n\n你的習慣計分卡記錄得很完整，看得出來你每天都有認真追蹤自己的行為。",
+    "## 優點\n\n漫畫把「提示、渴望、回應、獎賞」四個步驟畫得很清楚，角色的表情也很生動。",
+    "## 建議\n\n可以試著把新習慣和已經穩定的舊習慣綁在一起，例如刷完牙後立刻讀一頁書。",
+    "## 鼓勵\n\n持續記錄就是最好的開始，下週再回頭看看自己的進步吧！",
+]
+FAKE_MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413 # One silent MPEG frame
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real API
+    server_version = 'FakeOpenAI/1.0'
+
+    def log_message(self, format, *args):
+        pass # Quiet: the benchmark reports its own numbers
+
+    def _delay(self, seconds):
+        jitter = self.server.latency_jitter
+        time.sleep(max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter)))
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunked(self, content_type, chunks, chunk_delay=0.0):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            if chunk_delay:
+                time.sleep(chunk_delay)
+            self.wfile.write(f"{len(chunk):X}\r\n".encode('ascii') + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            request = {}
+        with self.server.counter_lock:
+            self.server.request_count += 1
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._send_json(503, {"error": {"message": "fake overload", "type": "server_error"}})
+            return
+
+        if self.path.endswith('/chat/completions'):
+            self._chat(request)
+        elif self.path.endswith('/audio/speech'):
+            self._delay(self.server.tts_latency)
+            frames = max(1, len(request.get("input", "")) // 4) # ~Proportional to the text length
+            self._send_chunked('audio/mpeg', [FAKE_MP3_FRAME * 16] * (frames // 16 + 1))
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def _chat(self, request):
+        text = "\n\n".join(ANALYSIS_PARAGRAPHS)
+        self._delay(self.server.chat_latency) # Time to first token
+        created = int(time.time())
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": 800, "completion_tokens": len(text), "total_tokens": 800 + len(text)},
+            })
+            return
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+        events = []
+        for piece in pieces:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": request.get("model", "fake"),
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            events.append(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+        events.append(b"data: [DONE]\n\n")
+        self._send_chunked('text/event-stream', events, chunk_delay=self.server.token_delay)
+
+
+def start_fake_openai(port: int = 0, chat_latency: float = 0.8, token_delay: float = 0.0, tts_latency: float = 0.3,
+                      latency_jitter: float = 0.2, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Starts the stub on a background thread; ``server.server_port`` holds the bound port."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.chat_latency = chat_latency
+    server.token_delay = token_delay
+    server.tts_latency = tts_latency
+    server.latency_jitter = latency_jitter
+    server.error_rate = error_rate
+    server.request_count = 0
+    server.counter_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--chat-latency', type=float, default=0.8, help='Seconds before the first token.')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between streamed chunks.')
+    parser.add_argument('--tts-latency', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered 503.')
+    args = parser.parse_args()
+    server = start_fake_openai(args.port, args.chat_latency, args.token_delay, args.tts_latency, error_rate=args.error_rate)
+    print(f"INFO: Fake OpenAI server on http://127.0.0.1:{server.server_port}/v1 (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
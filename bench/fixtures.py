@@ -0,0 +1,82 @@
+# LHTL/bench/fixtures.py
+"""
+Synthetic gallery fixtures: generated scorecard / comic images and a seeder that
+uploads N works through the app's real POST /upload endpoint.
+"""
+
+import io
+import json
+import uuid
+import random
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from PIL import Image, ImageDraw
+
+
+def make_image_bytes(seed: int, fmt: str = 'JPEG', size: tuple = (1600, 1200)) -> bytes:
+    """A deterministic, photo-sized image with enough detail to compress like a real scan."""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, tuple(rng.randrange(180, 256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(120):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(20, 400), y0 + rng.randrange(20, 300)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), outline=color, width=rng.randrange(1, 6))
+        else:
+            draw.line((x0, y0, x1, y1), fill=color, width=rng.randrange(1, 8))
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **({'quality': 88} if fmt == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def encode_multipart(fields: dict, files: dict) -> tuple[bytes, str]:
+    """multipart/form-data body for {name: value} fields and {name: (filename, bytes, mimetype)} files."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, (filename, data, mimetype) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {mimetype}\r\n\r\n'.encode('utf-8') + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('ascii'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def make_upload_body(seed: int, image_size: tuple = (1600, 1200)) -> tuple[bytes, str]:
+    """A complete /upload request body (form fields + two images) for work number ``seed``."""
+    return encode_multipart(
+        {
+            'author-name': f'測試學生 {seed}',
+            'current-habits': '每天早上運動三十分鐘，睡前閱讀。',
+            'reflection': f'這是第 {seed} 份作品的心得：我發現建立新習慣最難的是前兩週。',
+        },
+        {
+            'scorecard-image': (f'scorecard_{seed}.jpg', make_image_bytes(seed * 2, 'JPEG', image_size), 'image/jpeg'),
+            'comic-image': (f'comic_{seed}.png', make_image_bytes(seed * 2 + 1, 'PNG', image_size), 'image/png'),
+        },
+    )
+
+
+def seed_gallery(base_url: str, count: int, concurrency: int = 4, first_seed: int = 0) -> list:
+    """Uploads ``count`` synthetic works; returns the created work ids."""
+    target = urlsplit(base_url)
+
+    def upload(seed):
+        body, content_type = make_upload_body(seed)
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=60)
+        try:
+            conn.request('POST', '/upload', body=body, headers={'Content-Type': content_type})
+            response = conn.getresponse()
+            payload = json.loads(response.read() or b'{}')
+        finally:
+            conn.close()
+        if response.status != 201:
+            raise RuntimeError(f"Seeding work {seed} failed: HTTP {response.status} {payload}")
+        return payload["work_id"]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(upload, range(first_seed, first_seed + count)))
@@ -0,0 +1,139 @@
+# LHTL/bench/loadgen.py
+"""
+Closed-loop load generator: ``concurrency`` client threads, each with its own
+keep-alive connection, pick operations from a weighted mix for ``duration``
+seconds and record per-operation latencies.
+"""
+
+import json
+import time
+import base64
+import random
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from batch_analysis import percentile
+from bench.fixtures import make_image_bytes, make_upload_body
+
+# Weighted operation mixes (operation name -> relative weight)
+WORKLOAD_MIXES = {
+    "browse": {"works_list": 30, "works_page": 20, "work_detail": 10, "upload_file": 40},
+    "mixed": {"works_list": 20, "works_page": 15, "upload_file": 40, "upload": 5, "analyze": 15, "analyze_uncached": 5},
+    "upload": {"upload": 100},
+    "analyze": {"analyze": 50, "analyze_uncached": 50},
+}
+
+
+class BenchContext:
+    """Shared inputs for operations: seeded works, their file URLs and pre-built request bodies."""
+
+    def __init__(self, works: list, upload_bodies: int = 8):
+        self.works = works
+        self.work_ids = [w["id"] for w in works]
+        self.file_urls = [url for w in works for url in (w.get("scorecardThumbUrl"), w.get("comicThumbUrl"),
+                                                         w.get("scorecardImageUrl")) if url]
+        # Image encoding is expensive: build bodies once, outside the timed section
+        self.upload_bodies = [make_upload_body(100000 + i) for i in range(upload_bodies)]
+        small = lambda seed, fmt: f"data:image/{fmt.lower()};base64," + base64.b64encode(
+            make_image_bytes(seed, fmt, (512, 384))).decode('ascii')
+        self.legacy_images = (small(1, 'JPEG'), small(2, 'PNG'))
+
+
+def _request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    response.read() # Drain so the connection can be reused
+    return response.status
+
+
+def op_works_list(conn, ctx, rng):
+    return _request(conn, 'GET', '/works', headers={'Accept-Encoding': 'gzip, br'})
+
+def op_works_page(conn, ctx, rng):
+    return _request(conn, 'GET', '/works?limit=24&fields=id,author,scorecardThumbUrl,comicThumbUrl',
+                    headers={'Accept-Encoding': 'gzip, br'})
+
+def op_work_detail(conn, ctx, rng):
+    return _request(conn, 'GET', f"/works/{rng.choice(ctx.work_ids)}")
+
+def op_upload_file(conn, ctx, rng):
+    return _request(conn, 'GET', rng.choice(ctx.file_urls))
+
+def op_upload(conn, ctx, rng):
+    body, content_type = rng.choice(ctx.upload_bodies) # Same content: exercises dedup, not disk growth
+    return _request(conn, 'POST', '/upload', body=body, headers={'Content-Type': content_type})
+
+def op_analyze(conn, ctx, rng):
+    # Stored work; after its first analysis this is served from the analysis cache
+    return _request(conn, 'POST', f"/works/{rng.choice(ctx.work_ids)}/analyze",
+                    body=json.dumps({"generate_audio": False}), headers={'Content-Type': 'application/json'})
+
+def op_analyze_uncached(conn, ctx, rng):
+    # Unique reflection text -> cache miss -> a real (fake-upstream) chat call
+    payload = {"scorecard_base64": ctx.legacy_images[0], "comic_base64": ctx.legacy_images[1],
+               "author": "壓力測試", "habits": "運動", "reflection": f"bench-{rng.getrandbits(64):x}",
+               "generate_audio": False}
+    return _request(conn, 'POST', '/analyze', body=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                    headers={'Content-Type': 'application/json'})
+
+OPERATIONS = {name[3:]: func for name, func in globals().items() if name.startswith('op_')}
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / seconds, 2) if seconds else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def run_workload(base_url: str, mix: dict, ctx: BenchContext, duration: float, concurrency: int,
+                 seed: int = 1) -> dict:
+    """Runs the mix and returns {"total": summary, "operations": {name: summary}}."""
+    target = urlsplit(base_url)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = {name: {"latencies": [], "errors": 0} for name in names}
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(client_index):
+        rng = random.Random(seed * 1000 + client_index) # Reproducible operation sequence
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=120)
+        local = {name: ([], 0) for name in names}
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = OPERATIONS[name](conn, ctx, rng) < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                conn.close() # Reconnect on the next request
+            elapsed = time.perf_counter() - started
+            latencies, errors = local[name]
+            latencies.append(elapsed)
+            local[name] = (latencies, errors + (0 if ok else 1))
+        conn.close()
+        with results_lock:
+            for name, (latencies, errors) in local.items():
+                results[name]["latencies"].extend(latencies)
+                results[name]["errors"] += errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    all_latencies = [value for result in results.values() for value in result["latencies"]]
+    return {
+        "total": summarize(all_latencies, sum(r["errors"] for r in results.values()), seconds),
+        "operations": {name: summarize(r["latencies"], r["errors"], seconds) for name, r in results.items()},
+    }
@@ -0,0 +1,208 @@
+# LHTL/bench/run.py
+"""
+Reproducible load benchmark of the app under gunicorn (as in the Procfile).
+
+For every workers x threads combination the app is started from a throw-away
+copy of this checkout (so real uploads / caches are never touched), pointed at
+the local fake OpenAI server, seeded with synthetic works and driven with a
+weighted request mix. Throughput and p50/p95/p99 latencies are printed and
+saved as JSON; --baseline compares against an earlier run and exits 1 on
+regressions.
+
+    python -m bench.run --works 200 --workers 1,2,4 --threads 1,4 --mix mixed
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json --threshold 0.15
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+from datetime import datetime, timezone
+from pathlib import Path
+
+from bench.fake_openai import start_fake_openai
+from bench.fixtures import seed_gallery
+from bench.loadgen import WORKLOAD_MIXES, BenchContext, run_workload
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+APP_FILES = ('*.py', 'index.html', 'static') # What the sandbox copy of the app needs
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_sandbox() -> Path:
+    """Copies the app (code + static files, no data) into a temp directory."""
+    sandbox = Path(tempfile.mkdtemp(prefix='lhtl-bench-'))
+    for pattern in APP_FILES:
+        for path in REPO_DIR.glob(pattern):
+            if path.is_dir():
+                shutil.copytree(path, sandbox / path.name)
+            else:
+                shutil.copy2(path, sandbox / path.name)
+    return sandbox
+
+
+def http_get_json(port: int, path: str):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+
+def start_gunicorn(sandbox: Path, workers: int, threads: int, env: dict):
+    """Starts gunicorn like the Procfile does (plus -w / --threads) and waits until it answers."""
+    port = free_port()
+    log_file = open(sandbox / f"gunicorn-w{workers}-t{threads}.log", 'wb')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads), '--timeout', '120'],
+        cwd=sandbox, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode}; see {log_file.name}")
+        try:
+            if http_get_json(port, '/works?limit=1')[0] == 200:
+                return process, port, log_file
+        except (OSError, http.client.HTTPException, ValueError):
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not become ready within 60 s")
+
+
+def stop_gunicorn(process, log_file):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    log_file.close()
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns human-readable regressions (throughput drop or p95 growth beyond ``threshold``)."""
+    regressions = []
+    for config, current in results["runs"].items():
+        previous = baseline.get("runs", {}).get(config)
+        if not previous:
+            continue
+        for name, now in {"total": current["total"], **current["operations"]}.items():
+            before = previous["total"] if name == "total" else previous["operations"].get(name)
+            if not before or not before["requests"]:
+                continue
+            if now["rps"] < before["rps"] * (1 - threshold):
+                regressions.append(f"{config} {name}: throughput {before['rps']} -> {now['rps']} req/s")
+            if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append(f"{config} {name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms")
+            if now["errors"] > before["errors"]:
+                regressions.append(f"{config} {name}: errors {before['errors']} -> {now['errors']}")
+    return regressions
+
+
+def print_report(config: str, result: dict):
+    print(f"\n== {config} ==")
+    print(f"{'operation':<18}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, row in sorted(result["operations"].items()) + [("TOTAL", result["total"])]:
+        print(f"{name:<18}{row['requests']:>9}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+
+
+def parse_int_list(value: str) -> list:
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--works', type=int, default=100, help='Synthetic works to seed.')
+    parser.add_argument('--workers', type=parse_int_list, default=[1, 2], help='gunicorn worker counts, e.g. 1,2,4')
+    parser.add_argument('--threads', type=parse_int_list, default=[1, 4], help='gunicorn threads per worker, e.g. 1,4')
+    parser.add_argument('--mix', choices=sorted(WORKLOAD_MIXES), default='mixed')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per configuration.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client connections.')
+    parser.add_argument('--chat-latency', type=float, default=0.8, help='Fake upstream time to first token (s).')
+    parser.add_argument('--tts-latency', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=1, help='Random seed of the request sequence.')
+    parser.add_argument('--output', type=Path, default=None, help='Results JSON (default: bench/results/<timestamp>.json).')
+    parser.add_argument('--baseline', type=Path, default=None, help='Compare against this results file.')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed relative slowdown before flagging.')
+    parser.add_argument('--save-baseline', type=Path, default=None, help='Also write the results here.')
+    parser.add_argument('--keep-sandbox', action='store_true', help="Don't delete the temp app copy (logs, data).")
+    args = parser.parse_args()
+
+    fake = start_fake_openai(chat_latency=args.chat_latency, tts_latency=args.tts_latency)
+    env = {
+        **os.environ,
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_BASE_URL': f'http://127.0.0.1:{fake.server_port}/v1',
+        'AI_RATE_LIMIT_RPM': '0', # Measure the app, not the limiter
+        'PYTHONUNBUFFERED': '1',
+    }
+    sandbox = make_sandbox()
+    print(f"INFO: Sandbox {sandbox}; fake OpenAI on port {fake.server_port}; mix '{args.mix}' "
+          f"{WORKLOAD_MIXES[args.mix]}.")
+
+    results = {
+        "createdAt": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "settings": {key: (str(value) if isinstance(value, Path) else value) for key, value in vars(args).items()},
+        "runs": {},
+    }
+    ctx = None
+    try:
+        for workers in args.workers:
+            for threads in args.threads:
+                config = f"{args.mix} w{workers} t{threads}"
+                process, port, log_file = start_gunicorn(sandbox, workers, threads, env)
+                try:
+                    if ctx is None: # Seed once; later configurations reuse the same data
+                        started = time.perf_counter()
+                        seed_gallery(f'http://127.0.0.1:{port}', args.works)
+                        print(f"INFO: Seeded {args.works} works in {time.perf_counter() - started:.1f} s.")
+                        time.sleep(2) # Let background renditions finish
+                        ctx = BenchContext(http_get_json(port, '/works')[1])
+                    run_workload(f'http://127.0.0.1:{port}', WORKLOAD_MIXES[args.mix], ctx,
+                                 duration=min(3.0, args.duration), concurrency=args.concurrency, seed=args.seed) # Warm-up
+                    result = run_workload(f'http://127.0.0.1:{port}', WORKLOAD_MIXES[args.mix], ctx,
+                                          duration=args.duration, concurrency=args.concurrency, seed=args.seed)
+                finally:
+                    stop_gunicorn(process, log_file)
+                results["runs"][config] = result
+                print_report(config, result)
+    finally:
+        fake.shutdown()
+        if not args.keep_sandbox:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+    output = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    for path in filter(None, (output, args.save_baseline)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"INFO: Results written to {path}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.threshold)
+        if regressions:
+            print(f"\nWARN: {len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print(f"\nINFO: No regressions vs {args.baseline} (threshold {args.threshold:.0%}).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# LHTL/blob_store.py
+"""
+Content-addressed, deduplicating storage for uploaded images.
+
+An upload is streamed once to a temp file while its SHA-256 is computed; the
+caller verifies the temp file and then commits it under its digest::
+
+    blobs/ab/cd/abcd1234....jpg
+
+The two-level fan-out keeps every directory small. Identical images are stored
+only once: committing content that already exists just drops the temp file and
+bumps the blob's reference count. Reference counts live in a small WAL-mode
+SQLite database so several gunicorn workers can update them safely.
+
+Committed files go to a ``storage`` backend (see storage.py). With a shared
+backend (S3) the reference counts only cover this instance's uploads, so blobs
+are never deleted there: another instance may use the same content.
+"""
+
+import os
+import uuid
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+from works_store import utc_now_iso
+
+TEMP_SUBDIR = '.incoming' # Temp files live inside the local root so commits are atomic renames
+
+
+@dataclass
+class PendingBlob:
+    """An uploaded file that has been hashed into a temp file but not committed yet."""
+    temp_path: Path
+    digest: str
+    size: int
+
+
+class BlobStore:
+    """SHA-256 addressed files under ``subdir`` of ``storage`` with reference counting in ``index_path``."""
+
+    def __init__(self, storage, index_path: Path, subdir: str = 'blobs', chunk_size: int = 1024 * 1024):
+        self.storage = storage
+        self.subdir = subdir
+        self.root = storage.local_root / subdir
+        self.index_path = Path(index_path)
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+        (self.root / TEMP_SUBDIR).mkdir(parents=True, exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest     TEXT PRIMARY KEY,
+                path       TEXT NOT NULL,
+                size       INTEGER NOT NULL,
+                refcount   INTEGER NOT NULL,
+                created_at TEXT NOT NULL
+            );
+        """)
+
+    def _connect(self):
+        # One connection per thread (and per process: re-open after a gunicorn fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def relative_path(digest: str, extension: str) -> str:
+        """Sharded path of a blob, relative to the blob directory."""
+        return f"{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+    def ingest(self, stream) -> PendingBlob:
+        """Copies a binary stream into a temp file, hashing it on the way (single pass)."""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.root / TEMP_SUBDIR)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return PendingBlob(Path(tmp_path), hasher.hexdigest(), size)
+
+    def adopt(self, path: Path) -> PendingBlob:
+        """
+        Like ingest() for a file that is already on disk (a finished resumable upload):
+        the temp file is a hard link to it (a copy on another filesystem), so ``path``
+        itself is left alone whether the blob is committed or discarded.
+        """
+        tmp_path = self.root / TEMP_SUBDIR / f"{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            shutil.copyfile(path, tmp_path)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    hasher.update(chunk)
+                    size += len(chunk)
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return PendingBlob(tmp_path, hasher.hexdigest(), size)
+
+    def discard(self, pending: PendingBlob) -> None:
+        """Deletes an uncommitted temp file (e.g. the image failed verification)."""
+        pending.temp_path.unlink(missing_ok=True)
+
+    def commit(self, pending: PendingBlob, extension: str) -> tuple[str, bool]:
+        """
+        Moves a verified temp file into the store and takes a reference on it.
+        Returns (path relative to the blob directory, True if the content was new).
+        """
+        relative = self.relative_path(pending.digest, extension)
+        target = self.root / relative
+        if self.storage.shared:
+            return self._commit_shared(pending, relative, target)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE") # Serializes commit/release of the same digest across workers
+        try:
+            row = conn.execute("SELECT path FROM blobs WHERE digest = ?", (pending.digest,)).fetchone()
+            if row and self.storage.exists(f"{self.subdir}/{row[0]}"):
+                conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE digest = ?", (pending.digest,))
+                relative, created = row[0], False
+                pending.temp_path.unlink(missing_ok=True) # Duplicate: keep the existing copy
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(pending.temp_path, target)
+                # A row whose file went missing is repaired in place (its old references still count)
+                conn.execute(
+                    "INSERT INTO blobs (digest, path, size, refcount, created_at) VALUES (?, ?, ?, 1, ?) "
+                    "ON CONFLICT(digest) DO UPDATE SET path = excluded.path, refcount = refcount + 1",
+                    (pending.digest, relative, pending.size, utc_now_iso())
+                )
+                created = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            pending.temp_path.unlink(missing_ok=True)
+            raise
+        return relative, created
+
+    def _commit_shared(self, pending: PendingBlob, relative: str, target: Path) -> tuple[str, bool]:
+        # Uploads happen before (not inside) the index transaction: the key is the content
+        # hash, so concurrent uploads of the same image, from any instance, are harmless
+        key = f"{self.subdir}/{relative}"
+        try:
+            created = not self.storage.exists(key)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(pending.temp_path, target) # Kept as the local cached copy
+            if created:
+                self.storage.publish(key)
+        except Exception:
+            pending.temp_path.unlink(missing_ok=True)
+            raise
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO blobs (digest, path, size, refcount, created_at) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1",
+            (pending.digest, relative, pending.size, utc_now_iso())
+        )
+        return relative, created
+
+    def release(self, relative_path: str) -> bool:
+        """
+        Drops one reference to a blob; deletes the file when none are left (local storage only).
+        Returns True if deleted.
+        """
+        digest = Path(relative_path).name.split('.', 1)[0]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if not row:
+                conn.execute("ROLLBACK")
+                return False
+            if row[0] > 1:
+                conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,))
+                deleted = False
+            else:
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                deleted = not self.storage.shared
+                if deleted:
+                    self.storage.delete(f"{self.subdir}/{relative_path}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def refcount(self, digest: str) -> int:
+        row = self._connect().execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else 0
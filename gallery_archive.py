@@ -0,0 +1,155 @@
+# LHTL/gallery_archive.py
+"""
+Gallery backup / migration archives (ZIP)::
+
+    works.jsonl          one work record per line, oldest first (renditions left out:
+                         they are regenerated after an import)
+    uploads/<filename>   every image referenced by a work, under its stored filename
+    manifest.json        {"format": "lhtl-gallery", "version": 1, "createdAt", "works", "images", "missingImages"}
+
+``iter_gallery_zip`` produces the archive as a stream of chunks. zipfile writes into
+a sink that is drained after every chunk, so memory stays at about one read chunk
+however many gigabytes of images go out, and no temp archive is written. As the
+output can't seek, entries carry their sizes in data descriptors (ZIP64 where
+needed). Images are stored as they are (already compressed); metadata is deflated.
+
+``read_gallery_archive`` is the import side: it checks the manifest and yields the
+work records; their images are read straight from the archive by the caller.
+"""
+
+import io
+import os
+import json
+import time
+import logging
+import zipfile
+
+from works_store import REQUIRED_WORK_KEYS
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "lhtl-gallery"
+ARCHIVE_VERSION = 1
+WORKS_MEMBER = 'works.jsonl'
+MANIFEST_MEMBER = 'manifest.json'
+IMAGES_PREFIX = 'uploads/'
+IMAGE_KEYS = ("scorecardFilename", "comicFilename")
+EXCLUDED_WORK_FIELDS = ("renditions",) # Derived files that are not in the archive
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable file object that keeps what zipfile wrote until drained."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    @property
+    def pending(self) -> int:
+        return sum(map(len, self._chunks))
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def image_member(filename: str) -> str:
+    return IMAGES_PREFIX + filename
+
+
+def iter_gallery_zip(works: list, open_image, chunk_size: int = 1024 * 1024, stats: dict | None = None):
+    """
+    Generator of ZIP bytes for ``works`` (a consistent snapshot, oldest first).
+    ``open_image(filename)`` returns a binary file object of a stored image (OSError if it
+    is gone: the archive is still written, the image is counted in missingImages).
+    ``stats``, if given, is filled with the manifest counts.
+    """
+    stats = stats if stats is not None else {}
+    created_at = time.gmtime()
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        filenames = {} # Stored filename -> None (ordered set: each image once, even if shared)
+        with zf.open(zipfile.ZipInfo(WORKS_MEMBER, created_at[:6]), 'w') as dest:
+            for work in works:
+                record = {key: value for key, value in work.items() if key not in EXCLUDED_WORK_FIELDS}
+                dest.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+                filenames.update((work[key], None) for key in IMAGE_KEYS if work.get(key))
+                if sink.pending >= chunk_size:
+                    yield sink.drain()
+        yield sink.drain()
+
+        missing = 0
+        for filename in filenames:
+            try:
+                src = open_image(filename)
+            except OSError as e:
+                log.warning(f"Export: image {filename} is missing, skipped: {e}")
+                missing += 1
+                continue
+            with src:
+                info = zipfile.ZipInfo(image_member(filename), created_at[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                try:
+                    info.file_size = os.fstat(src.fileno()).st_size # Lets zipfile pick ZIP64 up front
+                except (OSError, AttributeError, io.UnsupportedOperation):
+                    pass
+                with zf.open(info, 'w', force_zip64=not info.file_size) as dest:
+                    for chunk in iter(lambda: src.read(chunk_size), b''):
+                        dest.write(chunk)
+                        yield sink.drain()
+            yield sink.drain()
+
+        stats.update(works=len(works), images=len(filenames) - missing, missingImages=missing)
+        manifest = {"format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION,
+                    "createdAt": time.strftime('%Y-%m-%dT%H:%M:%S+00:00', created_at), **stats}
+        zf.writestr(zipfile.ZipInfo(MANIFEST_MEMBER, created_at[:6]),
+                    json.dumps(manifest, ensure_ascii=False, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    yield sink.drain() # Central directory
+
+
+def read_gallery_archive(zf: zipfile.ZipFile):
+    """
+    Checks an archive written by iter_gallery_zip and returns (manifest, works iterator).
+    Works whose record is incomplete or whose images are not in the archive are logged and skipped.
+    Raises ValueError if this is not a gallery archive.
+    """
+    try:
+        manifest = json.loads(zf.read(MANIFEST_MEMBER))
+    except KeyError:
+        raise ValueError(f"Not a gallery archive: {MANIFEST_MEMBER} is missing")
+    if manifest.get("format") != ARCHIVE_FORMAT or manifest.get("version") != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive format: {manifest.get('format')!r} version {manifest.get('version')!r}")
+    members = set(zf.namelist())
+
+    def works():
+        with zf.open(WORKS_MEMBER) as f:
+            for line_number, line in enumerate(io.TextIOWrapper(f, encoding='utf-8'), 1):
+                if not line.strip():
+                    continue
+                try:
+                    work = json.loads(line)
+                except json.JSONDecodeError:
+                    log.warning(f"Import: skipping unreadable line {line_number} of {WORKS_MEMBER}")
+                    continue
+                if not (isinstance(work, dict) and all(key in work for key in REQUIRED_WORK_KEYS)
+                        and all(isinstance(work[key], str) and work[key] for key in ("id",) + IMAGE_KEYS)):
+                    log.warning(f"Import: skipping incomplete work on line {line_number}")
+                    continue
+                if not all(image_member(work[key]) in members for key in IMAGE_KEYS):
+                    log.warning(f"Import: skipping work {work['id']}: its images are not in the archive")
+                    continue
+                yield work
+
+    return manifest, works()
@@ -0,0 +1,92 @@
+# LHTL/gunicorn.conf.py
+"""gunicorn settings, picked up automatically by `gunicorn app:app` (see Procfile)."""
+
+import os
+import time
+import fcntl
+import shutil
+import tempfile
+
+# Prometheus multi-process mode: each worker writes its metrics to files in a directory
+# and /metrics aggregates them. Must be set before the app is imported.
+# Every master gets a fresh directory of its own below PROMETHEUS_MULTIPROC_DIR (default:
+# the app's cache/prometheus), so instances on one host and blue/green restarts never
+# count or delete each other's files. The master holds a lock in it for its lifetime
+# (inherited through --daemon), which tells live directories from abandoned ones.
+METRICS_LOCK_FILE = '.master.lock'
+METRICS_DIR_PREFIX = 'master-'
+
+
+def _own_metrics_dir():
+    held = os.getenv('LHTL_PROMETHEUS_LOCK') # "<fd>:<dir>" of the directory this process locked
+    base_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'prometheus')
+    if held:
+        fd, path = held.split(':', 1)
+        try:
+            if os.fstat(int(fd)).st_ino == os.stat(os.path.join(path, METRICS_LOCK_FILE)).st_ino:
+                return path # Config reloaded (SIGHUP): keep our directory
+        except (OSError, ValueError):
+            pass
+        base_dir = os.path.dirname(path) # Inherited from another master (USR2 re-exec): a sibling of its directory
+    os.makedirs(base_dir, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=METRICS_DIR_PREFIX, dir=base_dir)
+    fd = os.open(os.path.join(path, METRICS_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX) # Never closed: released when the master (and its workers) are gone
+    os.environ['LHTL_PROMETHEUS_LOCK'] = f"{fd}:{path}"
+    return path
+
+METRICS_DIR = _own_metrics_dir()
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = METRICS_DIR
+
+# GUNICORN_PRELOAD=1 (or --preload): import the app once in the master and fork workers
+# from it, so each (re)started worker is ready almost immediately and shares that memory
+preload_app = os.getenv('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    # Our directory is new; remove those of masters that are gone without cleaning up (killed, crashed)
+    base_dir = os.path.dirname(METRICS_DIR)
+    for name in os.listdir(base_dir):
+        path = os.path.join(base_dir, name)
+        if not name.startswith(METRICS_DIR_PREFIX) or path == METRICS_DIR:
+            continue
+        try:
+            fd = os.open(os.path.join(path, METRICS_LOCK_FILE), os.O_RDWR)
+        except OSError:
+            continue # Not (yet) a master's directory
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            continue # Its master is alive
+        finally:
+            os.close(fd)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def on_exit(server):
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        import app # Already imported by the master; do the deferred start-up work before forking
+        app.warm_up()
+
+
+def pre_fork(server, worker):
+    worker.lhtl_fork_started = time.monotonic() # Copied into the child by the fork
+
+
+def post_worker_init(worker):
+    boot_ms = (time.monotonic() - worker.lhtl_fork_started) * 1000
+    worker.log.info(f"Worker {worker.pid} ready {boot_ms:.0f} ms after fork"
+                    f"{' (preloaded app)' if worker.cfg.preload_app else ''}.")
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid) # Drop the dead worker's live gauges
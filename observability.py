@@ -0,0 +1,159 @@
+# LHTL/observability.py
+"""
+Logging, timing spans and metrics.
+
+* ``setup_logging``  - leveled logging (LOG_LEVEL) through a queue: request threads only
+                       enqueue records, a background thread does the actual writing
+* ``span(phase)``    - times one phase of a request; spans are sent back in the
+                       ``Server-Timing`` header and recorded in a histogram
+* metrics           - Prometheus counters / histograms (optional ``prometheus_client``).
+                       With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py) every
+                       gunicorn worker writes to shared files and /metrics aggregates them.
+
+Without prometheus_client installed the metric helpers are no-ops.
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram, CollectorRegistry, multiprocess
+except ImportError:
+    prometheus_client = None
+
+LOG_FORMAT = "%(levelname)s: %(message)s" # Same shape as the old "INFO: ..." prints
+QUIET_LOGGERS = ('PIL', 'httpx', 'httpcore', 'openai') # Library chatter stays at WARNING even with LOG_LEVEL=DEBUG
+
+
+# --- Logging ---
+class NonBlockingLogHandler(logging.handlers.QueueHandler):
+    """QueueHandler whose listener thread is (re)started lazily in each process (fork-safe)."""
+
+    def __init__(self, target: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's listener thread doesn't exist here: start a fresh one
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._ensure_listener()
+        self.queue.put_nowait(record)
+
+    def close(self):
+        if self._listener and self._pid == os.getpid():
+            self._listener.stop() # Drains what is still queued
+            self._listener = None
+        super().close()
+
+
+def setup_logging(level: str = 'INFO'):
+    """Routes all loggers through one non-blocking handler writing to stdout."""
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler = NonBlockingLogHandler(stream_handler)
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    atexit.register(handler.close)
+    return handler
+
+
+# --- Metrics ---
+_multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if prometheus_client:
+    if _multiproc_dir:
+        os.makedirs(_multiproc_dir, exist_ok=True)
+    _LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    HTTP_REQUESTS = Counter('lhtl_http_requests_total', 'HTTP requests handled.', ['method', 'endpoint', 'status'])
+    HTTP_LATENCY = Histogram('lhtl_http_request_duration_seconds', 'Time until the response (headers) was ready.',
+                             ['method', 'endpoint'], buckets=_LATENCY_BUCKETS)
+    PHASE_LATENCY = Histogram('lhtl_phase_duration_seconds', 'Duration of request phases (parse, chat, tts, ...).',
+                              ['phase'], buckets=_LATENCY_BUCKETS)
+    UPSTREAM_USAGE = Counter('lhtl_upstream_usage_total', 'Upstream AI usage (tokens, TTS characters).', ['model', 'type'])
+    CACHE_LOOKUPS = Counter('lhtl_cache_lookups_total', 'Cache lookups by result.', ['cache', 'result'])
+
+
+def metrics_available() -> bool:
+    return prometheus_client is not None
+
+def render_metrics() -> tuple[bytes, str]:
+    """Prometheus text exposition of all workers' metrics (or this process', single-process)."""
+    if _multiproc_dir:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+def observe_request(method: str, endpoint: str, status: int, seconds: float):
+    if prometheus_client:
+        HTTP_REQUESTS.labels(method, endpoint, str(status)).inc()
+        HTTP_LATENCY.labels(method, endpoint).observe(seconds)
+
+def count_cache(cache: str, result: str):
+    """Records one cache lookup (result: 'hit', 'miss', ...)."""
+    if prometheus_client:
+        CACHE_LOOKUPS.labels(cache, result).inc()
+
+def count_usage(model: str, usage_type: str, amount: int | float | None):
+    """Records upstream usage, e.g. ('gpt-4.1-mini', 'prompt_tokens', 812)."""
+    if prometheus_client and amount:
+        UPSTREAM_USAGE.labels(model, usage_type).inc(amount)
+
+def count_chat_usage(model: str, usage):
+    """Records the prompt / completion tokens of a chat response's ``usage`` object (if any)."""
+    if usage is not None:
+        count_usage(model, 'prompt_tokens', getattr(usage, 'prompt_tokens', None))
+        count_usage(model, 'completion_tokens', getattr(usage, 'completion_tokens', None))
+
+
+# --- Timing spans / Server-Timing ---
+def record_span(phase: str, seconds: float):
+    if prometheus_client:
+        PHASE_LATENCY.labels(phase).observe(seconds)
+    if has_request_context():
+        spans = g.setdefault('timing_spans', [])
+        spans.append((phase, seconds))
+
+@contextmanager
+def span(phase: str):
+    """Times the enclosed block as ``phase`` (Server-Timing entry + histogram sample)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(phase, time.perf_counter() - started)
+
+def server_timing_header(total_seconds: float | None = None) -> str:
+    """`Server-Timing` value for the spans recorded so far in this request."""
+    totals = {}
+    for phase, seconds in g.get('timing_spans', []):
+        totals[phase] = totals.get(phase, 0.0) + seconds # A phase can run more than once (two images, ...)
+    entries = [f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in totals.items()]
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
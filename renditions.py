@@ -0,0 +1,134 @@
+# LHTL/renditions.py
+"""
+Resized image renditions (derivatives) of uploaded scorecard / comic images.
+
+Each upload gets a small grid thumbnail, a modal-sized image and a model-input
+image (the resolution the vision model actually uses). They are written next to
+the originals under ``uploads/renditions/`` and recorded on the work entry as::
+
+    "renditions": {
+        "scorecard": {"thumb": {"filename": "...", "width": 480, "height": 360}, ...},
+        "comic":     {...}
+    }
+"""
+
+import io
+import os
+import tempfile
+from pathlib import Path
+
+# name -> longest edge in pixels, output format, encoder quality
+RENDITION_SPECS = {
+    "thumb": {"max_size": 480, "format": "WEBP", "quality": 75},   # Gallery grid cards
+    "modal": {"max_size": 1400, "format": "WEBP", "quality": 82},  # Work detail modal
+    "model": {"max_size": 1024, "format": "JPEG", "quality": 85},  # Vision model input
+}
+SRCSET_RENDITIONS = ("thumb", "modal") # Browser-facing renditions, smallest first
+RENDITIONS_SUBDIR = 'renditions'
+_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+def rendition_filename(original_filename: str, name: str) -> str:
+    """
+    Returns the rendition filename (relative to the upload folder) for an original image.
+    Sharded originals keep their fan-out: blobs/ab/cd/<sha>.jpg -> renditions/blobs/ab/cd/<sha>_thumb.webp
+    """
+    stem = Path(original_filename).with_suffix('').as_posix()
+    return f"{RENDITIONS_SUBDIR}/{stem}_{name}.{_EXTENSIONS[RENDITION_SPECS[name]['format']]}"
+
+
+def _save_atomically(img, target: Path, spec: dict):
+    """Encodes ``img`` to a temp file in the target directory and renames it into place."""
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=target.name + '.', dir=target.parent)
+    os.close(fd)
+    try:
+        save_kwargs = {"quality": spec["quality"]}
+        if spec["format"] == "WEBP":
+            save_kwargs["method"] = 4 # Encoder effort: good size/speed trade-off
+        else:
+            save_kwargs.update(optimize=True, progressive=True)
+        img.save(tmp_path, format=spec["format"], **save_kwargs)
+        os.replace(tmp_path, target)
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def generate_renditions(upload_folder: Path, original_filename: str) -> dict:
+    """
+    Generates all renditions for one original image.
+
+    Returns {name: {"filename", "width", "height"}}. Renditions that already exist on
+    disk are reused rather than re-encoded.
+    """
+    from PIL import Image, ImageOps # Imported on first use: keeps worker start-up fast
+
+    upload_folder = Path(upload_folder)
+    source_path = upload_folder / original_filename
+    (upload_folder / rendition_filename(original_filename, "thumb")).parent.mkdir(parents=True, exist_ok=True)
+    results = {}
+
+    with Image.open(source_path) as original:
+        # Let the JPEG decoder downscale while decoding (much faster for large photos)
+        largest = max(spec["max_size"] for spec in RENDITION_SPECS.values())
+        if original.format == 'JPEG':
+            original.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(original) # Respect phone camera orientation
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB') # GIF: first frame only
+
+        # Largest first, so each smaller rendition is resized from an already reduced image
+        for name, spec in sorted(RENDITION_SPECS.items(), key=lambda item: -item[1]["max_size"]):
+            filename = rendition_filename(original_filename, name)
+            target = upload_folder / filename
+            resized = img.copy()
+            resized.thumbnail((spec["max_size"], spec["max_size"]), Image.Resampling.LANCZOS)
+            if not target.exists():
+                out = resized
+                if spec["format"] == "JPEG" and out.mode != 'RGB':
+                    # JPEG has no alpha: flatten onto white
+                    background = Image.new('RGB', out.size, (255, 255, 255))
+                    background.paste(out, mask=out.getchannel('A'))
+                    out = background
+                _save_atomically(out, target, spec)
+            results[name] = {"filename": filename, "width": resized.width, "height": resized.height}
+            img = resized if resized.size != img.size else img
+
+    return results
+
+
+def downscale_to_jpeg(source_path: Path, max_size: int, quality: int = 85) -> bytes:
+    """
+    Returns ``source_path`` as JPEG bytes no larger than ``max_size`` on the longest edge.
+    JPEGs that are already small enough are returned as-is (no re-encode).
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as original:
+        if original.format == 'JPEG' and max(original.size) <= max_size:
+            with open(source_path, 'rb') as f:
+                return f.read()
+        if original.format == 'JPEG':
+            original.draft('RGB', (max_size, max_size))
+        img = ImageOps.exif_transpose(original)
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.getchannel('A'))
+            img = background
+        else:
+            img = img.convert('RGB')
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+        return buffer.getvalue()
+
+
+def build_srcset(renditions: dict, url_prefix: str = '/uploads/') -> str:
+    """Builds an HTML srcset string ("url 480w, url 1400w") from one image's renditions."""
+    parts = []
+    for name in SRCSET_RENDITIONS:
+        info = renditions.get(name)
+        if info:
+            parts.append(f"{url_prefix}{info['filename']} {info['width']}w")
+    return ", ".join(parts)
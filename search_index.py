@@ -0,0 +1,204 @@
+# LHTL/search_index.py
+"""
+Full-text search over works (author, current habits, reflection).
+
+Text is NFKC-normalized and lower-cased, then tokenized so Traditional Chinese
+works without a dictionary: every run of CJK characters becomes its overlapping
+character bigrams plus its last character (which makes single-character queries
+possible). Latin words and numbers stay whole words::
+
+    "王小明 喜歡跑步 run" -> 王小 小明 明 喜歡 歡跑 跑步 步 run
+
+A query is turned into the same bigrams, matched as a phrase, so "跑步習慣" only
+finds works containing that exact string. Single characters and Latin words match
+as prefixes.
+
+The index is an SQLite FTS5 table in its own WAL-mode file: shared by all gunicorn
+workers, ranked by BM25 (author > habits > reflection) in C, and updated
+document by document on upload / import. ``sync`` is the full reconcile for
+changes made elsewhere (migrations, other instances); it scans every work, so
+it runs at start-up and from maintenance commands, not per write.
+Queries matching more than RANK_MAX_MATCHES works (terms that nearly every
+reflection contains, like 習慣) are returned newest first instead: BM25 says little
+about such terms, and skipping it keeps those queries as fast as selective ones.
+"""
+
+import os
+import re
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = (5.0, 2.0, 1.0) # BM25 column weights: author, currentHabits, reflection
+MAX_QUERY_TERMS = 16 # Longer queries are truncated (each term is one FTS5 phrase)
+RANK_MAX_MATCHES = 2000 # Above this many matches, order by recency instead of BM25
+_CJK = r'\u3040-\u30ff\u3100-\u312f\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff' # Kana, Bopomofo, Han, Hangul
+_TERM_PATTERN = re.compile(rf'([{_CJK}]+)|([^\W_{_CJK}]+)') # CJK run | other word
+
+
+def _terms(text: str):
+    return _TERM_PATTERN.findall(unicodedata.normalize('NFKC', text or '').lower())
+
+def _bigrams(run: str) -> list:
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> list:
+    """Index tokens of ``text`` (see module docstring)."""
+    tokens = []
+    for cjk_run, word in _terms(text):
+        if cjk_run:
+            tokens.extend(_bigrams(cjk_run))
+            tokens.append(cjk_run[-1])
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def build_match_query(query: str) -> str | None:
+    """FTS5 MATCH expression requiring every query term (None if the query has no terms)."""
+    phrases = []
+    for cjk_run, word in _terms(query)[:MAX_QUERY_TERMS]:
+        if len(cjk_run) > 1:
+            phrases.append('"' + ' '.join(_bigrams(cjk_run)) + '"') # Consecutive bigrams = exact substring
+        else:
+            phrases.append(f'"{cjk_run or word}" *') # Tokens are word characters only: nothing to escape
+    return ' AND '.join(phrases) or None
+
+
+def work_fingerprint(work: dict) -> str:
+    """Changes whenever one of the searchable fields changes."""
+    text = '\x1f'.join(work.get(key) or '' for key in ('author', 'currentHabits', 'reflection'))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=12).hexdigest()
+
+
+class SearchIndex:
+    """FTS5 index of works, keyed by work id."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._connect().executescript(f"""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id      INTEGER PRIMARY KEY, -- rowid in works_fts; increases with the works' age order
+                work_id     TEXT NOT NULL UNIQUE,
+                fingerprint TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5(author, habits, reflection, tokenize='unicode61');
+            INSERT INTO works_fts (works_fts, rank) VALUES ('rank', 'bm25({", ".join(map(str, FIELD_WEIGHTS))})');
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+    def _connect(self):
+        # One connection per thread (and per process: re-open after a gunicorn fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write_transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _delete(conn, work_id: str):
+        row = conn.execute("SELECT doc_id FROM docs WHERE work_id = ?", (work_id,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM works_fts WHERE rowid = ?", (row[0],))
+            conn.execute("DELETE FROM docs WHERE doc_id = ?", (row[0],))
+
+    @staticmethod
+    def _upsert(conn, work: dict, fingerprint: str):
+        row = conn.execute("SELECT doc_id FROM docs WHERE work_id = ?", (work["id"],)).fetchone()
+        if row: # Re-index in place: keeps the doc_id (and so the work's recency position)
+            doc_id = row[0]
+            conn.execute("DELETE FROM works_fts WHERE rowid = ?", (doc_id,))
+            conn.execute("UPDATE docs SET fingerprint = ? WHERE doc_id = ?", (fingerprint, doc_id))
+        else:
+            doc_id = conn.execute("INSERT INTO docs (work_id, fingerprint) VALUES (?, ?)",
+                                  (work["id"], fingerprint)).lastrowid
+        conn.execute("INSERT INTO works_fts (rowid, author, habits, reflection) VALUES (?, ?, ?, ?)",
+                     (doc_id, *(' '.join(tokenize(work.get(key))) for key in ('author', 'currentHabits', 'reflection'))))
+
+    def index_work(self, work: dict):
+        """Adds (or re-indexes) one work."""
+        with self._write_transaction() as conn:
+            self._upsert(conn, work, work_fingerprint(work))
+
+    def index_works(self, works):
+        """Adds (or re-indexes) several works in one transaction (bulk imports)."""
+        with self._write_transaction() as conn:
+            for work in works:
+                self._upsert(conn, work, work_fingerprint(work))
+
+    def remove_work(self, work_id: str):
+        with self._write_transaction() as conn:
+            self._delete(conn, work_id)
+
+    def sync(self, works, generation: str, force: bool = False) -> int:
+        """
+        Brings the index in line with ``works`` (the full list at works store ``generation``,
+        oldest first).
+        Only new, changed and deleted works are touched; returns how many. Cheap no-op when
+        this generation was already synced (by any worker), unless ``force``.
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        if row and row[0] == generation and not force:
+            return 0
+        with self._write_transaction() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            if row and row[0] == generation and not force: # Another worker synced it while we waited for the lock
+                return 0
+            indexed = dict(conn.execute("SELECT work_id, fingerprint FROM docs"))
+            changed = 0
+            for work in works:
+                fingerprint = work_fingerprint(work)
+                if indexed.pop(work["id"], None) != fingerprint:
+                    self._upsert(conn, work, fingerprint)
+                    changed += 1
+            for work_id in indexed: # Still unmatched: no longer in the works store
+                self._delete(conn, work_id)
+            changed += len(indexed)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (generation,))
+        if changed:
+            log.info(f"Search index synced: {changed} works (re)indexed or removed.")
+        return changed
+
+    def search(self, query: str, limit: int, offset: int = 0) -> tuple[list, int]:
+        """Returns (work ids of the requested page, best match first; total number of matches)."""
+        match = build_match_query(query)
+        if not match:
+            return [], 0
+        conn = self._connect()
+        total = conn.execute("SELECT COUNT(*) FROM works_fts WHERE works_fts MATCH ?", (match,)).fetchone()[0]
+        if offset >= total:
+            return [], total
+        order = "works_fts.rowid DESC" if total > RANK_MAX_MATCHES else "works_fts.rank, works_fts.rowid DESC"
+        rows = conn.execute(f"""
+            SELECT d.work_id FROM works_fts JOIN docs d ON d.doc_id = works_fts.rowid
+            WHERE works_fts MATCH ? ORDER BY {order} LIMIT ? OFFSET ?
+        """, (match, limit, offset)).fetchall()
+        return [row[0] for row in rows], total
@@ -0,0 +1,143 @@
+# LHTL/single_flight.py
+"""
+Single-flight coalescing of identical expensive calls (analysis chat, TTS).
+
+When many clients ask for the same result at once (a whole class opening the same
+featured work), only the first caller - the leader - does the upstream work. The
+others wait for it and then read its result from the shared cache through the
+``lookup`` function they pass in:
+
+* threads of one worker wait on an Event,
+* other gunicorn workers find ``<lock_dir>/<key>.lock`` locked (fcntl) and poll
+  ``lookup`` until the result appears or the lock is released.
+
+If the leader fails (no result in the cache when it is done) the next waiter takes
+over. A waiter that sees no result within ``wait_timeout`` (hung leader) stops
+coordinating and does the work itself.
+"""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+
+try:
+    import fcntl # POSIX only; without it calls are coalesced within a worker only
+except ImportError: # pragma: no cover - Windows dev machines
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class Lease:
+    """Leadership of one key. release() (idempotent) lets the waiters read the result."""
+
+    def __init__(self, flights: 'SingleFlight', key: str, event: threading.Event | None, fd: int | None = None):
+        self._flights = flights
+        self._key = key
+        self._event = event
+        self._fd = fd
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._fd is not None:
+            self._flights._unlock_file(self._key, self._fd)
+        if self._event is not None:
+            self._flights._finish(self._key, self._event)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, within and across processes."""
+
+    def __init__(self, lock_dir: Path, wait_timeout: float = 120.0, poll_interval: float = 0.05):
+        self.lock_dir = Path(lock_dir)
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._flights = {} # key -> Event of the in-process leader
+        self._lock = threading.Lock()
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+
+    def acquire(self, key: str, lookup):
+        """
+        Returns (result, None) if a concurrent leader produced the result (read with
+        ``lookup()``), else (None, lease): the caller does the work, stores the result
+        where ``lookup`` finds it and then releases the lease - also when it failed.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                event = self._flights.get(key)
+                leading = event is None
+                if leading:
+                    event = self._flights[key] = threading.Event()
+            if not leading:
+                if not event.wait(max(0.0, deadline - time.monotonic())):
+                    log.warning(f"Gave up waiting for in-flight {key[:12]} after {self.wait_timeout:.0f} s.")
+                    return None, Lease(self, key, None) # Uncoordinated: runs alongside the stuck leader
+                result = lookup()
+                if result:
+                    return result, None
+                continue # The leader failed: the next waiter in takes over
+
+            try:
+                result, fd = self._lock_file(key, deadline, lookup)
+            except BaseException:
+                self._finish(key, event)
+                raise
+            if result:
+                self._finish(key, event)
+                return result, None
+            return None, Lease(self, key, event, fd)
+
+    def _finish(self, key, event):
+        with self._lock:
+            if self._flights.get(key) is event:
+                del self._flights[key]
+        event.set()
+
+    def _lock_path(self, key):
+        return self.lock_dir / f"{key}.lock"
+
+    def _lock_file(self, key, deadline, lookup):
+        """Becomes the leader across workers: returns (None, locked fd), or (result, None) / (None, None)."""
+        if fcntl is None:
+            return None, None
+        path = self._lock_path(key)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd) # Another worker leads: wait for its result (or its lock)
+                result = lookup()
+                if result:
+                    return result, None
+                if time.monotonic() >= deadline:
+                    log.warning(f"Gave up waiting for {key[:12]} in another worker after {self.wait_timeout:.0f} s.")
+                    return None, None
+                time.sleep(self.poll_interval)
+                continue
+            try:
+                current = os.stat(path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current: # The previous leader unlinked this file after we opened it: use the new one
+                os.close(fd)
+                continue
+            result = lookup() # The previous leader may have finished just before we got the lock
+            if result:
+                self._unlock_file(key, fd)
+                return result, None
+            return None, fd
+
+    def _unlock_file(self, key, fd):
+        # Unlinked while still locked, so lock files don't pile up (waiters re-check the inode)
+        try:
+            self._lock_path(key).unlink(missing_ok=True)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
@@ -0,0 +1,139 @@
+# LHTL/speech_pipeline.py
+"""
+Paragraph-level text-to-speech for streamed analyses.
+
+Instead of synthesizing the whole analysis after the chat call has finished,
+the Markdown text is cut into speakable segments (paragraphs, or sentences for
+long paragraphs) while it is still being generated. Each segment is sent to TTS
+on a bounded thread pool as soon as it is complete, and the resulting audio is
+handed back strictly in segment order, so the client can start playing the
+first paragraph while the model is still writing the rest.
+"""
+
+import re
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Sentence boundaries: CJK / ASCII terminal punctuation, optionally followed by closing quotes
+_SENTENCE_END_RE = re.compile(r'[。！？!?；;]+[」』"\')）]*|\.(?=\s)')
+_MARKDOWN_PATTERNS = (
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'),          # Images -> alt text
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),           # Links -> link text
+    (re.compile(r'^\s{0,3}#{1,6}\s*', re.MULTILINE), ''),    # Heading markers
+    (re.compile(r'^\s*>\s?', re.MULTILINE), ''),              # Blockquotes
+    (re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+', re.MULTILINE), ''), # List markers
+    (re.compile(r'^\s*(?:[-*_]\s*){3,}$', re.MULTILINE), ''), # Horizontal rules
+    (re.compile(r'[*_~`|]+'), ''),                            # Emphasis, code, table pipes
+)
+
+
+def markdown_to_speech_text(markdown_text: str) -> str:
+    """Strips Markdown syntax so TTS doesn't read out '#', '*' or URLs."""
+    text = markdown_text
+    for pattern, replacement in _MARKDOWN_PATTERNS:
+        text = pattern.sub(replacement, text)
+    lines = [line.strip() for line in text.splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+class SpeechSegmenter:
+    """
+    Incrementally splits streamed Markdown into speakable segments.
+
+    ``feed(delta)`` returns the segments completed by that delta; ``flush()`` returns
+    whatever is left once the text is complete. Paragraphs shorter than ``min_chars``
+    (typically headings) are merged into the following one, and paragraphs longer than
+    ``max_chars`` are cut at the last sentence boundary so TTS calls stay short.
+    """
+
+    def __init__(self, min_chars: int = 40, max_chars: int = 400):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = '' # Text of the paragraph still being generated
+        self._pending = '' # Completed paragraphs too short to send on their own
+
+    def _take(self, text: str) -> list:
+        self._pending = f"{self._pending}\n{text}" if self._pending else text
+        speech = markdown_to_speech_text(self._pending)
+        if len(speech) < self.min_chars:
+            return []
+        self._pending = ''
+        return [speech]
+
+    def feed(self, delta: str) -> list:
+        self._buffer += delta
+        segments = []
+        while True:
+            paragraph, separator, rest = self._buffer.partition('\n\n')
+            if not separator:
+                break
+            self._buffer = rest
+            if paragraph.strip():
+                segments.extend(self._take(paragraph))
+        # A very long paragraph: cut it at the last complete sentence
+        while len(self._buffer) > self.max_chars:
+            cut = None
+            for match in _SENTENCE_END_RE.finditer(self._buffer, 0, self.max_chars):
+                cut = match.end()
+            if cut is None:
+                break # No sentence boundary yet; wait for more text (or the paragraph end)
+            head, self._buffer = self._buffer[:cut], self._buffer[cut:].lstrip()
+            segments.extend(self._take(head))
+        return segments
+
+    def flush(self) -> list:
+        remaining = f"{self._pending}\n{self._buffer}" if self._pending else self._buffer
+        self._pending = self._buffer = ''
+        speech = markdown_to_speech_text(remaining)
+        return [speech] if speech else []
+
+
+def split_speech_segments(markdown_text: str, min_chars: int = 40, max_chars: int = 400) -> list:
+    """Segments a complete text the same way a stream of it would be segmented."""
+    segmenter = SpeechSegmenter(min_chars, max_chars)
+    return segmenter.feed(markdown_text) + segmenter.flush()
+
+
+class SpeechPipeline:
+    """
+    Dispatches per-segment TTS jobs to ``executor`` and yields their results in order.
+
+    ``synthesize(text)`` runs on the executor and returns a value describing the
+    segment's audio (e.g. a cache key). Results come back as
+    ``(index, value, error)`` tuples, ``error`` being None on success.
+    """
+
+    def __init__(self, executor, synthesize):
+        self._executor = executor
+        self._synthesize = synthesize
+        self._futures = []
+        self._next_index = 0 # First segment not yet handed back
+
+    def submit(self, text: str) -> int:
+        self._futures.append(self._executor.submit(self._synthesize, text))
+        return len(self._futures) - 1
+
+    def _result(self, index, timeout=None):
+        try:
+            return index, self._futures[index].result(timeout=timeout), None
+        except FutureTimeoutError as e:
+            self._futures[index].cancel()
+            return index, None, e
+        except Exception as e:
+            return index, None, e
+
+    def ready(self):
+        """Yields finished segments in order, stopping at the first one still in progress."""
+        while self._next_index < len(self._futures) and self._futures[self._next_index].done():
+            yield self._result(self._next_index)
+            self._next_index += 1
+
+    def drain(self, timeout: float | None = None):
+        """Yields all remaining segments in order, waiting up to ``timeout`` seconds for each."""
+        while self._next_index < len(self._futures):
+            yield self._result(self._next_index, timeout)
+            self._next_index += 1
+
+    def cancel(self):
+        """Cancels segments that haven't started (e.g. the client went away)."""
+        for future in self._futures[self._next_index:]:
+            future.cancel()
@@ -23,8 +23,12 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- State ---
     let isChatMinimized = false;
     let currentWorkDataForChat = null; // Holds data of the work currently shown in modal
-    let currentAudioBlobUrl = null;
+    let currentAudioBlobUrl = null; // Blob URL (inline audio) or /audio/<id>.mp3 URL
     let isAnalyzing = false; // Prevent multiple simultaneous requests
+    let audioSegmentUrls = []; // Per-paragraph audio from the SSE stream, by segment index (null = failed)
+    let currentSegmentIndex = -1; // Segment loaded in the player (-1: not playing segments)
+    let awaitingNextSegment = false; // Player finished a segment before the next one arrived
+    let audioSegmentsComplete = false; // Stream ended: no more segments will arrive
 
     // --- Initialization ---
     function initializeChatWidget() {
@@ -125,32 +129,22 @@ document.addEventListener('DOMContentLoaded', () => {
             return;
         }
 
-        // Ensure Base64 image data is present (expected to be set by gallery.js)
-        if (!currentWorkDataForChat.scorecardBase64 || !currentWorkDataForChat.comicBase64) {
-             console.error("Base64 image data is missing from currentWorkDataForChat.");
-             displayError("錯誤: 缺少圖片資料，無法分析。請嘗試重新點開作品。");
-             return; // Cannot proceed without image data
-        }
-
         console.log(`[Chat AI] Requesting analysis for work ID: ${currentWorkDataForChat.id}`);
         isAnalyzing = true; // Set flag
         resetChatAnalysisState(true); // Reset UI and show loading indicator
 
+        // The server loads (and downscales) the stored images itself; only the id is sent
         const requestData = {
-            scorecard_base64: currentWorkDataForChat.scorecardBase64,
-            comic_base64: currentWorkDataForChat.comicBase64,
-            author: currentWorkDataForChat.author,
-            habits: currentWorkDataForChat.currentHabits,
-            reflection: currentWorkDataForChat.reflection,
             generate_audio: true // Always request audio (backend handles generation)
         };
 
         try {
-            const response = await fetch('/analyze', { // Hit the revised backend endpoint
+            const response = await fetch(`/works/${encodeURIComponent(currentWorkDataForChat.id)}/analyze`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'Accept': 'application/json' // We expect JSON back now
+                    // Prefer a Server-Sent Events stream (tokens as they are generated), JSON otherwise
+                    'Accept': 'text/event-stream, application/json;q=0.9'
                 },
                 body: JSON.stringify(requestData)
             });
@@ -168,15 +162,29 @@ document.addEventListener('DOMContentLoaded', () => {
                  throw new Error(errorMsg); // Throw error to be caught below
             }
 
-             // --- Process Successful JSON Response ---
-             const result = await response.json();
-             console.log("[Chat AI] Received JSON response:", result);
+             // --- Process Successful Response (SSE stream or plain JSON) ---
+             let result;
+             if (response.headers.get('content-type')?.includes('text/event-stream')) {
+                 result = await readAnalysisStream(response);
+                 console.log("[Chat AI] Stream completed:", result);
+             } else {
+                 result = await response.json();
+                 console.log("[Chat AI] Received JSON response:", result);
+             }
 
              if (result.success && result.analysis) {
                 renderAnalysisResult(result.analysis); // Display the analysis text
 
-                // Handle Audio Data (if present)
-                if (result.audio_data_base64) {
+                // Handle Audio (streamed from /audio/<analysis_id>.mp3; the player starts as bytes arrive)
+                audioSegmentsComplete = true;
+                if (hasAudioSegments()) {
+                     // Paragraph audio already arrived (and may be playing); the full-length audio_url isn't needed
+                     console.log(`[Chat AI] Audio delivered as ${audioSegmentUrls.length} segments.`);
+                     if (awaitingNextSegment) playAudioSegment(currentSegmentIndex + 1); // Skip trailing failed segments
+                } else if (result.audio_url) {
+                     console.log("[Chat AI] Received audio URL:", result.audio_url);
+                     setChatAudioSource(result.audio_url);
+                } else if (result.audio_data_base64) {
                      console.log("[Chat AI] Received Base64 audio data.");
                      try {
                         // Convert Base64 to Blob
@@ -184,30 +192,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         if (!audioBlob || audioBlob.size < 100) { // Check if blob creation failed or is tiny
                              throw new Error("無法處理收到的語音資料 (Blob 無效或過小)。");
                         }
-
-                        // Revoke previous Blob URL if exists to free memory
-                        if (currentAudioBlobUrl) {
-                            URL.revokeObjectURL(currentAudioBlobUrl);
-                            console.log("[Chat Audio] Revoked previous Blob URL.");
-                        }
-
-                        // Create new Blob URL and set player source
-                        currentAudioBlobUrl = URL.createObjectURL(audioBlob);
-                        chatAudioPlayer.src = currentAudioBlobUrl;
-                        chatReadAloudBtn.disabled = false; // Enable play button
-                        console.log("[Chat AI] Audio ready:", currentAudioBlobUrl.slice(5, 30) + "...");
-
-                        // Check checkbox and attempt to autoplay if checked
-                        if (chatAutoplayCheckbox && chatAutoplayCheckbox.checked) {
-                            console.log("[Chat AI] Autoplay checkbox is checked, attempting to play...");
-                            // Use a small delay to allow the player src to be fully processed
-                            setTimeout(playChatAnalysisAudio, 100); // 100ms delay
-                        } else {
-                             console.log("[Chat AI] Autoplay checkbox not checked.");
-                             // Ensure buttons are in correct initial state (Play enabled, Stop hidden)
-                             chatReadAloudBtn.disabled = false;
-                             chatStopReadingBtn.classList.add('hidden');
-                        }
+                        setChatAudioSource(URL.createObjectURL(audioBlob));
                      } catch(audioError) {
                          console.error("Error processing Base64 audio:", audioError);
                          displayError("處理語音資料時出錯: " + audioError.message);
@@ -248,6 +233,138 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Helper to Read an SSE Analysis Stream ---
+    // Renders tokens as they arrive; resolves with the final `done` payload (same shape as the JSON response).
+    async function readAnalysisStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let streamedText = '';
+        let renderScheduled = false;
+
+        const scheduleRender = () => {
+            if (renderScheduled) return;
+            renderScheduled = true;
+            requestAnimationFrame(() => { // At most one Markdown render per frame
+                renderScheduled = false;
+                renderAnalysisResult(streamedText);
+            });
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let separatorIndex;
+            while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, separatorIndex);
+                buffer = buffer.slice(separatorIndex + 2);
+
+                let eventName = 'message';
+                let dataText = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+                });
+                if (!dataText) continue; // Comment / keep-alive line
+
+                const payload = JSON.parse(dataText);
+                if (eventName === 'token') {
+                    if (!streamedText && chatLoading) chatLoading.classList.add('hidden'); // First token: hide spinner
+                    streamedText += payload.text || '';
+                    scheduleRender();
+                } else if (eventName === 'audio') {
+                    queueAudioSegment(payload);
+                } else if (eventName === 'done') {
+                    return payload;
+                } else if (eventName === 'error') {
+                    throw new Error(payload.error || '分析過程中發生錯誤。');
+                }
+            }
+        }
+        throw new Error('分析串流意外中斷，請稍後再試。');
+    }
+
+    // --- Paragraph Audio Segments (streamed analyses) ---
+    // Each `audio` event carries one paragraph's MP3 URL; segments are played back to back in index order.
+    function hasAudioSegments() {
+        return audioSegmentUrls.some(Boolean);
+    }
+
+    function queueAudioSegment(payload) {
+        if (payload.error) console.warn(`[Chat Audio] Segment ${payload.index} failed:`, payload.error);
+        audioSegmentUrls[payload.index] = payload.url || null;
+        if (!payload.url) {
+            if (awaitingNextSegment && payload.index === currentSegmentIndex + 1) currentSegmentIndex = payload.index;
+            return;
+        }
+        if (chatAudioPlayer.paused) chatReadAloudBtn.disabled = false; // Something to play now
+
+        if (awaitingNextSegment && payload.index === currentSegmentIndex + 1) {
+            playAudioSegment(payload.index); // Player was waiting for exactly this segment
+        } else if (currentSegmentIndex === -1 && payload.index === audioSegmentUrls.findIndex(Boolean)
+                   && chatAutoplayCheckbox && chatAutoplayCheckbox.checked) {
+            console.log("[Chat Audio] First segment ready, autoplaying...");
+            playAudioSegment(payload.index);
+        }
+    }
+
+    function playAudioSegment(index) {
+        // Skip segments whose synthesis failed
+        while (index < audioSegmentUrls.length && audioSegmentUrls[index] === null) index++;
+        const url = audioSegmentUrls[index];
+        if (!url) {
+            // Next segment not there yet: wait for it unless the stream is over
+            awaitingNextSegment = !audioSegmentsComplete;
+            currentSegmentIndex = awaitingNextSegment ? index - 1 : -1;
+            return;
+        }
+        awaitingNextSegment = false;
+        currentSegmentIndex = index;
+        chatAudioPlayer.src = url;
+        chatAudioPlayer.play().catch(error => {
+            console.error("[Chat Audio] Segment playback failed:", error);
+            displayError(`無法自動播放語音: ${error.name}. 請點擊朗讀按鈕。`, 'warning');
+            currentSegmentIndex = -1;
+            chatReadAloudBtn.disabled = false;
+        });
+    }
+
+    function resetAudioSegments() {
+        audioSegmentUrls = [];
+        currentSegmentIndex = -1;
+        awaitingNextSegment = false;
+        audioSegmentsComplete = false;
+    }
+
+    // --- Helper to Load Audio (URL or Blob URL) into the Player ---
+    function setChatAudioSource(audioUrl) {
+        // Revoke previous Blob URL if exists to free memory
+        if (currentAudioBlobUrl && currentAudioBlobUrl.startsWith('blob:')) {
+            URL.revokeObjectURL(currentAudioBlobUrl);
+            console.log("[Chat Audio] Revoked previous Blob URL.");
+        }
+
+        currentAudioBlobUrl = audioUrl;
+        chatAudioPlayer.src = currentAudioBlobUrl;
+        chatReadAloudBtn.disabled = false; // Enable play button
+        console.log("[Chat AI] Audio ready:", currentAudioBlobUrl.slice(0, 40) + "...");
+
+        // Check checkbox and attempt to autoplay if checked
+        if (chatAutoplayCheckbox && chatAutoplayCheckbox.checked) {
+            console.log("[Chat AI] Autoplay checkbox is checked, attempting to play...");
+            // Use a small delay to allow the player src to be fully processed
+            setTimeout(playChatAnalysisAudio, 100); // 100ms delay
+        } else {
+            console.log("[Chat AI] Autoplay checkbox not checked.");
+            // Ensure buttons are in correct initial state (Play enabled, Stop hidden)
+            chatReadAloudBtn.disabled = false;
+            chatStopReadingBtn.classList.add('hidden');
+        }
+    }
+
     // --- Helper to Display Errors ---
     function displayError(message, type = 'error') {
         if (!chatError) return;
@@ -307,6 +424,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Audio Playback Logic ---
     function playChatAnalysisAudio() {
+        if (hasAudioSegments()) {
+            playAudioSegment(0); // (Re)start the paragraph playlist from the top
+            return;
+        }
         if (!currentAudioBlobUrl || !chatAudioPlayer || !chatReadAloudBtn) {
              console.warn("Cannot play audio: No Blob URL or required elements.");
              return;
@@ -338,6 +459,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     function stopChatAnalysisAudio() {
+        currentSegmentIndex = -1; // Don't advance to the next segment
+        awaitingNextSegment = false;
         if (chatAudioPlayer && !chatAudioPlayer.paused) {
             chatAudioPlayer.pause();
             chatAudioPlayer.currentTime = 0; // Reset position
@@ -362,13 +485,14 @@ document.addEventListener('DOMContentLoaded', () => {
         chatAudioPlayer.addEventListener('pause', () => { // Catches pause() AND natural end
             console.log("[Chat Audio] Event: pause/ended");
             // Enable play button only if there's valid audio loaded
-            if(chatReadAloudBtn) chatReadAloudBtn.disabled = !currentAudioBlobUrl;
+            if(chatReadAloudBtn) chatReadAloudBtn.disabled = !currentAudioBlobUrl && !hasAudioSegments();
             if(chatStopReadingBtn) chatStopReadingBtn.classList.add('hidden'); // Hide stop
         });
 
-        // 'ended' event implicitly triggers 'pause', so handling pause is usually sufficient.
-        // If specific 'ended' logic is needed (like analytics), add it here:
-        // chatAudioPlayer.addEventListener('ended', () => { console.log("[Chat Audio] Event: ended"); });
+        // 'ended' event implicitly triggers 'pause'; it is only needed to advance the segment playlist
+        chatAudioPlayer.addEventListener('ended', () => {
+            if (currentSegmentIndex !== -1) playAudioSegment(currentSegmentIndex + 1);
+        });
 
         chatAudioPlayer.addEventListener('error', (e) => {
             console.error("[Chat Audio] Player error event:", e);
@@ -381,6 +505,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
      function disableAudioControls() {
+         resetAudioSegments();
          if (chatReadAloudBtn) chatReadAloudBtn.disabled = true;
          if (chatStopReadingBtn) chatStopReadingBtn.classList.add('hidden');
          if (chatAudioPlayer) {
@@ -388,9 +513,9 @@ document.addEventListener('DOMContentLoaded', () => {
              chatAudioPlayer.removeAttribute('src'); // Remove source URL
              chatAudioPlayer.load(); // Reset internal state
          }
-         // Revoke Blob URL to free memory
+         // Revoke Blob URL to free memory (plain /audio URLs need no cleanup)
          if (currentAudioBlobUrl) {
-            URL.revokeObjectURL(currentAudioBlobUrl);
+            if (currentAudioBlobUrl.startsWith('blob:')) URL.revokeObjectURL(currentAudioBlobUrl);
             currentAudioBlobUrl = null;
             console.log("[Chat Audio] Blob URL revoked and controls disabled.");
         } else {
@@ -4,6 +4,8 @@
 const MAX_DESC_LENGTH_HABITS = 500;
 const MAX_DESC_LENGTH_REFLECTION = 1000;
 const MAX_AUTHOR_LENGTH = 50;
+const GALLERY_PAGE_SIZE = 24; // Works fetched per /works page
+const GALLERY_CARD_FIELDS = 'id,author,currentHabits,scorecardImageUrl,comicImageUrl,scorecardThumbUrl,scorecardSrcset'; // Fields needed to render a card
 
 // --- DOM Element References (Assigned in main.js) ---
 // Make sure these are assigned correctly in main.js
@@ -15,6 +17,7 @@ const MAX_AUTHOR_LENGTH = 50;
 // --- State ---
 var currentWorksData = []; // Holds the master list of work data from server
 var currentWorkIdInModal = null;
+var nextWorksCursor = null; // Cursor for the next /works page (null when all pages are loaded)
 
 // --- Modal Functions ---
 async function openWorkModal(workId) {
@@ -28,6 +31,19 @@ async function openWorkModal(workId) {
     console.log("Opening modal for work:", workData.id);
     currentWorkIdInModal = workId; // Track which work is open
 
+    // The grid only fetched card fields; load the full work (reflection etc.) on first open
+    if (typeof workData.reflection === 'undefined') {
+        try {
+            const response = await fetch(`/works/${encodeURIComponent(workId)}`);
+            if (!response.ok) {
+                throw new Error(`伺服器錯誤 (${response.status})`);
+            }
+            Object.assign(workData, await response.json());
+        } catch (error) {
+            console.error("Failed to load full work details for modal:", error);
+        }
+    }
+
     // Populate modal text content using helper for safety
     const setText = (el, text, fallback = '(未提供)') => {
         if (el) {
@@ -42,10 +58,17 @@ async function openWorkModal(workId) {
 
 
     // Set images and handle potential errors
-    const setImage = (el, url, alt) => {
+    const setImage = (el, url, alt, srcset = '') => {
         if(el){
             const safeUrl = escapeHTML(url || ''); // Sanitize URL just in case
             const safeAlt = escapeHTML(alt || '圖片');
+            // Resized renditions for display; the lightbox still opens the original
+            if (srcset) {
+                el.srcset = srcset;
+                el.sizes = '(min-width: 768px) 45vw, 90vw';
+            } else {
+                el.removeAttribute('srcset');
+            }
             el.src = safeUrl; // Set source
             el.alt = safeAlt;
             el.dataset.originalSrc = safeUrl; // Store clean URL for lightbox
@@ -74,47 +97,12 @@ async function openWorkModal(workId) {
              console.warn(`Modal image element not found for "${alt}".`);
         }
     };
-    setImage(modalScorecardImage, workData.scorecardImageUrl, '習慣計分卡');
-    setImage(modalComicImage, workData.comicImageUrl, '六格漫畫');
-
-    // --- PRE-FETCH/ENCODE IMAGES for Chat Widget ---
-    // Only attempt if the URLs seem valid
-    if (workData.scorecardImageUrl && workData.comicImageUrl) {
-        try {
-            // Fetch only if Base64 data isn't already attached (e.g., from previous opening)
-            if (!workData.scorecardBase64 || !workData.comicBase64) {
-                console.log("Pre-fetching/encoding images for chat widget...");
-                // Use utility function (ensure it's defined below or globally)
-                const [scBase64, cmBase64] = await Promise.all([
-                    fetchImageAsBase64(workData.scorecardImageUrl),
-                    fetchImageAsBase64(workData.comicImageUrl)
-                ]);
-                // Store ONLY if fetch/encode succeeded
-                if (scBase64) workData.scorecardBase64 = scBase64;
-                if (cmBase64) workData.comicBase64 = cmBase64;
-
-                if (!scBase64 || !cmBase64) {
-                    console.warn("Failed to pre-fetch/encode one or both images for chat. Analysis might fail.");
-                } else {
-                    console.log("Images pre-fetched and encoded successfully.");
-                }
-            } else {
-                console.log("Using previously fetched Base64 image data for chat.");
-            }
-        } catch(e) {
-            console.error("Error during image pre-fetching/encoding for chat:", e);
-            // Ensure potentially partial data is cleared
-            delete workData.scorecardBase64;
-            delete workData.comicBase64;
-        }
-    } else {
-        console.warn("Missing image URLs in workData, cannot pre-fetch for chat.", workData);
-    }
-    // --- End Pre-fetch ---
+    setImage(modalScorecardImage, workData.scorecardImageUrl, '習慣計分卡', workData.scorecardSrcset);
+    setImage(modalComicImage, workData.comicImageUrl, '六格漫畫', workData.comicSrcset);
 
     // --- Inform the Chat Widget ---
     if (typeof window.setWorkDataForChat === 'function') {
-        // Pass the potentially updated workData (with base64)
+        // Images are loaded server-side by /works/<id>/analyze, so only the work data is needed
         window.setWorkDataForChat(workData);
     } else {
         console.warn("setWorkDataForChat function (from chatWidget.js) not found.");
@@ -178,6 +166,112 @@ function closeLightbox() {
 }
 
 // --- Gallery Loading ---
+async function fetchWorksPage(cursor = null) {
+    const params = new URLSearchParams({ limit: GALLERY_PAGE_SIZE, fields: GALLERY_CARD_FIELDS });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`/works?${params.toString()}`);
+    if (!response.ok) {
+        throw new Error(`伺服器錯誤 (${response.status}): ${response.statusText}`);
+    }
+    const page = await response.json();
+    if (!page || !Array.isArray(page.works)) {
+        throw new Error("從伺服器收到的資料格式不正確 (缺少作品陣列)。");
+    }
+    return page;
+}
+
+function renderWorkCard(work) {
+    // Validate individual work object more thoroughly
+    if (!work || typeof work !== 'object' || !work.id || !work.scorecardImageUrl || !work.author || !work.currentHabits || !work.comicImageUrl) {
+        console.warn("Skipping work with invalid or incomplete data:", work);
+        return false; // Skip this work
+    }
+
+    const card = document.createElement('div');
+    card.className = 'work-card fade-in';
+    card.setAttribute('role', 'button');
+    card.tabIndex = 0;
+    card.dataset.workId = work.id;
+
+    // Sanitize content before displaying
+    const author = escapeHTML(work.author);
+    const habitsRaw = work.currentHabits;
+    const habitsPreview = escapeHTML(habitsRaw.length > 80 ? habitsRaw.substring(0, 80) + '...' : habitsRaw);
+    const imageUrl = escapeHTML(work.scorecardThumbUrl || work.scorecardImageUrl); // Preview image URL (thumbnail if available)
+    const srcsetAttr = work.scorecardSrcset ? `srcset="${escapeHTML(work.scorecardSrcset)}" sizes="(min-width: 1024px) 25vw, (min-width: 640px) 50vw, 100vw"` : '';
+
+    // Use template literals for cleaner HTML structure
+    // Added padding within the card content area
+    card.innerHTML = `
+        <img src="${imageUrl}" ${srcsetAttr} alt="預覽 - ${author}" loading="lazy" decoding="async" style="background-color: #eee;" onerror="this.onerror=null; this.src='/static/placeholder.png'; this.alt='預覽圖載入失敗'; console.warn('Failed to load preview: ${imageUrl}')">
+        <div class="p-4 flex-grow flex flex-col">
+             <h5 class="text-base font-semibold text-gray-800 mb-1 truncate" title="${author}">${author}</h5>
+             <p class="description-preview text-sm text-gray-600" title="${escapeHTML(habitsRaw)}">${habitsPreview || '(無習慣描述)'}</p>
+        </div>
+    `;
+    // Add error handling directly to img tag for simplicity here
+
+    // Add event listeners
+    card.addEventListener('click', () => openWorkModal(work.id));
+    card.addEventListener('keydown', (event) => {
+        if (event.key === 'Enter' || event.key === ' ') {
+            event.preventDefault();
+            openWorkModal(work.id);
+        }
+    });
+
+    workGalleryElement.appendChild(card);
+    return true;
+}
+
+function renderWorksPage(works) {
+    let renderedCount = 0;
+    works.forEach(work => {
+        if (renderWorkCard(work)) renderedCount++;
+    });
+    console.log(`Successfully rendered ${renderedCount} out of ${works.length} works.`);
+}
+
+function updateLoadMoreButton() {
+    let loadMoreButton = document.getElementById('gallery-load-more');
+    if (!nextWorksCursor) {
+        if (loadMoreButton) loadMoreButton.remove();
+        return;
+    }
+    if (!loadMoreButton) {
+        loadMoreButton = document.createElement('button');
+        loadMoreButton.id = 'gallery-load-more';
+        loadMoreButton.type = 'button';
+        loadMoreButton.className = 'col-span-full mx-auto my-4 px-6 py-2 rounded-full bg-white border border-gray-300 text-gray-700 hover:bg-gray-50';
+        loadMoreButton.textContent = '載入更多作品';
+        loadMoreButton.addEventListener('click', loadMoreWorks);
+    }
+    workGalleryElement.appendChild(loadMoreButton); // (Re)attach after the last card
+}
+
+async function loadMoreWorks() {
+    const loadMoreButton = document.getElementById('gallery-load-more');
+    if (!nextWorksCursor || !workGalleryElement) return;
+    if (loadMoreButton) {
+        loadMoreButton.disabled = true;
+        loadMoreButton.textContent = '載入中...';
+    }
+    try {
+        const page = await fetchWorksPage(nextWorksCursor);
+        currentWorksData.push(...page.works);
+        nextWorksCursor = page.nextCursor || null;
+        renderWorksPage(page.works);
+    } catch (error) {
+        console.error("載入更多作品時發生錯誤:", error);
+    } finally {
+        if (loadMoreButton) {
+            loadMoreButton.disabled = false;
+            loadMoreButton.textContent = '載入更多作品';
+        }
+        updateLoadMoreButton();
+    }
+}
+
 async function loadAndRenderWorks() {
     if (!workGalleryElement) {
         console.error("Gallery element (#work-gallery) missing. Cannot render works.");
@@ -185,19 +279,15 @@ async function loadAndRenderWorks() {
     }
     console.log("Fetching works...");
     workGalleryElement.innerHTML = `<p id="gallery-placeholder" class="tc t-g-500 csp p-6 col-span-full">正在載入作品...</p>`; // Use col-span-full for grid layout
+    nextWorksCursor = null;
 
     try {
-        const response = await fetch('/works');
-        if (!response.ok) {
-            throw new Error(`伺服器錯誤 (${response.status}): ${response.statusText}`);
-        }
-        const works = await response.json();
-
-        if (!Array.isArray(works)) {
-            throw new Error("從伺服器收到的資料格式不正確 (非陣列)。");
-        }
+        // Only the first (newest) page is fetched up front; more pages load on demand
+        const page = await fetchWorksPage();
+        const works = page.works;
 
         currentWorksData = works; // Store fetched data
+        nextWorksCursor = page.nextCursor || null;
         workGalleryElement.innerHTML = ''; // Clear loading message
 
         if (works.length === 0) {
@@ -208,51 +298,9 @@ async function loadAndRenderWorks() {
             return;
         }
 
-        console.log(`Rendering ${works.length} works...`);
-        let renderedCount = 0;
-        works.forEach(work => {
-             // Validate individual work object more thoroughly
-             if (!work || typeof work !== 'object' || !work.id || !work.scorecardImageUrl || !work.author || !work.currentHabits || !work.reflection || !work.comicImageUrl) {
-                 console.warn("Skipping work with invalid or incomplete data:", work);
-                 return; // Skip this work
-             }
-
-             const card = document.createElement('div');
-             card.className = 'work-card fade-in';
-             card.setAttribute('role', 'button');
-             card.tabIndex = 0;
-             card.dataset.workId = work.id;
-
-             // Sanitize content before displaying
-             const author = escapeHTML(work.author);
-             const habitsRaw = work.currentHabits;
-             const habitsPreview = escapeHTML(habitsRaw.length > 80 ? habitsRaw.substring(0, 80) + '...' : habitsRaw);
-             const imageUrl = escapeHTML(work.scorecardImageUrl); // Preview image URL
-
-             // Use template literals for cleaner HTML structure
-             // Added padding within the card content area
-             card.innerHTML = `
-                 <img src="${imageUrl}" alt="預覽 - ${author}" loading="lazy" style="background-color: #eee;" onerror="this.onerror=null; this.src='/static/placeholder.png'; this.alt='預覽圖載入失敗'; console.warn('Failed to load preview: ${imageUrl}')">
-                 <div class="p-4 flex-grow flex flex-col">
-                      <h5 class="text-base font-semibold text-gray-800 mb-1 truncate" title="${author}">${author}</h5>
-                      <p class="description-preview text-sm text-gray-600" title="${escapeHTML(habitsRaw)}">${habitsPreview || '(無習慣描述)'}</p>
-                 </div>
-             `;
-             // Add error handling directly to img tag for simplicity here
-
-             // Add event listeners
-             card.addEventListener('click', () => openWorkModal(work.id));
-             card.addEventListener('keydown', (event) => {
-                 if (event.key === 'Enter' || event.key === ' ') {
-                     event.preventDefault();
-                     openWorkModal(work.id);
-                 }
-             });
-
-             workGalleryElement.appendChild(card);
-             renderedCount++;
-        });
-        console.log(`Successfully rendered ${renderedCount} out of ${works.length} works.`);
+        console.log(`Rendering ${works.length} of ${page.total} works...`);
+        renderWorksPage(works);
+        updateLoadMoreButton();
 
         // Update slideshow after rendering gallery
         if (typeof initializeSlideshow === 'function') initializeSlideshow();
@@ -263,6 +311,7 @@ async function loadAndRenderWorks() {
             workGalleryElement.innerHTML = `<p id="gallery-placeholder" class="tc t-r-600 csp p-6 col-span-full">載入作品時遇到問題，請稍後再試。 (${escapeHTML(error.message)})</p>`;
         }
         currentWorksData = []; // Clear data on error
+        nextWorksCursor = null;
         if (typeof initializeSlideshow === 'function') initializeSlideshow(); // Update slideshow with empty data
     }
 }
@@ -380,51 +429,6 @@ async function handleWorkUpload(event) {
     }
 }
 
-// --- Utility: Fetch Image and Convert to Base64 ---
-// Essential for pre-fetching in openWorkModal for the chat widget
-async function fetchImageAsBase64(imageUrl) {
-    if (!imageUrl || typeof imageUrl !== 'string') {
-        console.warn("fetchImageAsBase64: Invalid imageUrl provided:", imageUrl);
-        return null;
-    }
-    console.log(`Workspaceing image as Base64: ${imageUrl}`); // Log which image is being fetched
-    try {
-        const response = await fetch(imageUrl);
-        if (!response.ok) {
-            throw new Error(`HTTP error ${response.status} fetching image: ${response.url}`);
-        }
-        const blob = await response.blob();
-        // Optional: Check blob type more strictly if needed
-        if (!blob.type.startsWith('image/')) {
-             console.warn(`Workspaceed resource is not an image type: ${blob.type} for URL: ${imageUrl}`);
-             // Decide whether to proceed or return null
-             // return null; // Stricter approach
-        }
-
-        return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.onloadend = () => {
-                // result contains the Data URL (e.g., data:image/png;base64,...)
-                // Basic check if result looks like a data URL
-                if (typeof reader.result === 'string' && reader.result.startsWith('data:')) {
-                     resolve(reader.result);
-                } else {
-                     console.error("FileReader did not return a valid Data URL:", reader.result);
-                     reject(new Error("Failed to read blob as valid Data URL."));
-                }
-            };
-            reader.onerror = (error) => {
-                 console.error("FileReader error:", error);
-                 reject(new Error("Error reading fetched image blob."));
-            };
-            reader.readAsDataURL(blob); // Start reading the blob
-        });
-    } catch (error) {
-        console.error(`Error fetching or converting image ${imageUrl} to Base64:`, error);
-        return null; // Indicate failure
-    }
-}
-
 // --- Utility: Escape HTML ---
 // Ensure this utility is available
 function escapeHTML(str) {
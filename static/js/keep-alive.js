@@ -6,7 +6,7 @@
  */
 function keepAwake() {
     // console.log("Sending keep-alive ping..."); // Keep this log minimal
-    fetch('/') // Fetch the root URL or a dedicated '/health' endpoint if you have one
+    fetch('/healthz', { cache: 'no-store' }) // Cheap readiness endpoint: wakes the server without rendering the page
         .then(response => {
             if (!response.ok) {
                  // Log unexpected statuses, but don't make it alarming for users
@@ -13,7 +13,7 @@ let isCatFast = false;
 let catFastTimeoutId = null;
 let slideshowTimeoutId = null;
 let currentSlideIndex = 0;
-let slideshowImageUrls = []; // Populated by initializeSlideshow using gallery data
+let slideshowImages = []; // { url, srcset } per slide, populated by initializeSlideshow using gallery data
 
 // --- DOM Element References (assigned in main.js) ---
 // These are expected to be assigned by main.js after DOMContentLoaded
@@ -121,7 +121,7 @@ function populateSlideshow() {
     }
     const placeholder = document.getElementById('slideshow-placeholder');
 
-    if (!slideshowImageUrls || slideshowImageUrls.length === 0) {
+    if (!slideshowImages || slideshowImages.length === 0) {
         console.warn("No images for slideshow.");
         if (placeholder) { // Show placeholder if no images
             if (!heroSlideshowElement.contains(placeholder)) heroSlideshowElement.appendChild(placeholder);
@@ -136,8 +136,8 @@ function populateSlideshow() {
     // Hide placeholder if we have images
     if (placeholder) placeholder.style.display = 'none';
 
-    console.log(`Populating slideshow with ${slideshowImageUrls.length} images.`);
-    slideshowImageUrls.forEach((imageUrl, index) => {
+    console.log(`Populating slideshow with ${slideshowImages.length} images.`);
+    slideshowImages.forEach(({ url: imageUrl, srcset }, index) => {
         if (!imageUrl || typeof imageUrl !== 'string') return; // Skip invalid entries
 
         const slideDiv = document.createElement('div');
@@ -147,6 +147,10 @@ function populateSlideshow() {
         const img = document.createElement('img');
         const safeImageUrl = typeof escapeHTML === 'function' ? escapeHTML(imageUrl) : imageUrl; // Use util if available
         img.src = safeImageUrl;
+        if (srcset) { // Renditions: the browser picks thumb or modal size for the slide width
+            img.srcset = srcset;
+            img.sizes = '100vw';
+        }
         img.alt = `習慣養成分享 ${index + 1}`;
         img.loading = (index === 0) ? 'eager' : 'lazy'; // Load first image immediately
         // Use util error handler if available
@@ -214,16 +218,19 @@ function initializeSlideshow() {
 
     console.log("Initializing slideshow using gallery data...");
     try {
-        // Get scorecard URLs from the first 5 works, filtering for valid strings
-        slideshowImageUrls = currentWorksData
+        // Scorecard images of the first 5 works: renditions when they exist, else the original
+        slideshowImages = currentWorksData
                                 .slice(0, 5) // Limit to 5 slides
-                                .map(work => work?.scorecardImageUrl) // Safely get URL
-                                .filter(url => typeof url === 'string' && url.length > 0); // Ensure it's a non-empty string
+                                .map(work => ({
+                                    url: work?.scorecardThumbUrl || work?.scorecardImageUrl, // Safely get URL
+                                    srcset: work?.scorecardSrcset || ''
+                                }))
+                                .filter(({ url }) => typeof url === 'string' && url.length > 0); // Ensure it's a non-empty string
 
         populateSlideshow(); // Build the slides
     } catch (error) {
         console.error("Error during slideshow initialization:", error);
-        slideshowImageUrls = []; // Clear on error
+        slideshowImages = []; // Clear on error
         populateSlideshow(); // Show placeholder
     }
 }
@@ -0,0 +1,138 @@
+# LHTL/static_assets.py
+"""
+Fingerprinted, precompressed static assets.
+
+``build_static_assets`` copies every file under ``static/`` to the build directory
+as ``<name>.<content hash>.<ext>`` and, for textual types, writes ``.gz`` / ``.br``
+siblings compressed at maximum level. References to ``/static/<path>`` inside
+CSS / JS (and index.html, see ``render_page``) are rewritten to the fingerprinted
+``/assets/...`` URL, so every asset URL can be cached forever: a changed file gets
+a new URL.
+
+Build output is content-addressed, so existing files are skipped: only the first
+gunicorn worker after a change (or the `flask build-assets` deploy step) pays for
+the compression.
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import tempfile
+from pathlib import Path
+
+try:
+    import brotli # Optional: adds .br variants
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+ASSET_URL_PREFIX = '/assets/'
+FINGERPRINT_LENGTH = 12 # Hex chars of the content SHA-256 kept in the filename
+TEXT_SUFFIXES = {'.css', '.js', '.html'} # References to /static/... inside these are rewritten
+COMPRESSIBLE_SUFFIXES = TEXT_SUFFIXES | {'.ttf', '.otf', '.svg', '.json', '.txt', '.map'}
+MIN_COMPRESS_GAIN = 0.9 # Keep a compressed variant only if it is at most 90% of the original
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'} # Content-encoding -> build file suffix
+STATIC_REF_PATTERN = re.compile(r"""(?<=['"(])/static/([^'"()?#\s]+)""")
+
+
+def content_fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def fingerprint_path(relative_path: str, fingerprint: str) -> str:
+    """('js/main.js', '3f2a9c1b7d4e') -> 'js/main.3f2a9c1b7d4e.js'."""
+    path = Path(relative_path)
+    return path.with_name(f"{path.stem}.{fingerprint}{path.suffix}").as_posix()
+
+
+def rewrite_static_refs(text: str, manifest: dict) -> str:
+    """Replaces quoted /static/<path> references of known assets with their fingerprinted URLs."""
+    def replace(match):
+        entry = manifest.get(match.group(1))
+        return ASSET_URL_PREFIX + entry["path"] if entry else match.group(0)
+    return STATIC_REF_PATTERN.sub(replace, text)
+
+
+def compressed_variants(data: bytes) -> dict:
+    """{content-encoding: bytes} for the encodings that actually make ``data`` smaller."""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)} # mtime=0: reproducible bytes
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) <= len(data) * MIN_COMPRESS_GAIN}
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path) # Concurrent builders write identical bytes; last one wins
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def build_static_assets(static_dir: Path, build_dir: Path) -> dict:
+    """
+    Builds (or reuses) the fingerprinted files and returns the manifest:
+    {"js/main.js": {"path": "js/main.3f2a9c1b7d4e.js", "mimetype": "text/javascript",
+                    "etag": "3f2a9c1b7d4e", "encodings": ["gzip", "br"]}, ...}
+    """
+    static_dir, build_dir = Path(static_dir), Path(build_dir)
+    files = sorted(p for p in static_dir.rglob('*') if p.is_file() and not p.name.startswith('.'))
+    # Binary files first, so CSS / JS referencing images and fonts can be rewritten to their final URLs
+    files.sort(key=lambda p: p.suffix.lower() in TEXT_SUFFIXES)
+    manifest = {}
+    built = 0
+    for source in files:
+        relative_path = source.relative_to(static_dir).as_posix()
+        data = source.read_bytes()
+        if source.suffix.lower() in TEXT_SUFFIXES:
+            data = rewrite_static_refs(data.decode('utf-8'), manifest).encode('utf-8')
+        fingerprint = content_fingerprint(data)
+        target_path = fingerprint_path(relative_path, fingerprint)
+        target = build_dir / target_path
+        encodings = []
+        if not target.exists():
+            built += 1
+            if source.suffix.lower() in COMPRESSIBLE_SUFFIXES:
+                for encoding, body in compressed_variants(data).items():
+                    _write_atomic(target.with_name(target.name + ENCODING_SUFFIXES[encoding]), body)
+            _write_atomic(target, data) # Written last: its presence marks the build of this file complete
+        for encoding, suffix in ENCODING_SUFFIXES.items():
+            if target.with_name(target.name + suffix).exists():
+                encodings.append(encoding)
+        manifest[relative_path] = {
+            "path": target_path,
+            "mimetype": mimetypes.guess_type(source.name)[0] or 'application/octet-stream',
+            "etag": fingerprint,
+            "encodings": encodings,
+        }
+    if built:
+        log.info(f"Built {built} of {len(manifest)} static assets into {build_dir}.")
+    return manifest
+
+
+def encoded_path(build_dir: Path, asset: dict, encoding: str | None) -> Path:
+    """Build file holding ``asset`` in the given content-encoding (None = identity)."""
+    path = Path(build_dir) / asset["path"]
+    return path.with_name(path.name + ENCODING_SUFFIXES[encoding]) if encoding else path
+
+
+def render_page(page_path: Path, manifest: dict) -> dict:
+    """
+    Loads an HTML page with asset references rewritten, for serving from memory:
+    {"body": bytes, "etag": str, "encoded": {content-encoding: bytes}, "mtime_ns": int}
+    """
+    body = rewrite_static_refs(Path(page_path).read_text(encoding='utf-8'), manifest).encode('utf-8')
+    return {
+        "body": body,
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "encoded": compressed_variants(body),
+        "mtime_ns": Path(page_path).stat().st_mtime_ns,
+    }
@@ -0,0 +1,231 @@
+# LHTL/storage.py
+"""
+Where uploaded images (and, for the object backend, the works metadata) live.
+
+* ``LocalStorage`` - files under a local directory (the default: ``uploads/``).
+                     Only one app instance can use it.
+* ``S3Storage``    - objects in an S3-compatible bucket (AWS S3, MinIO, R2, ...),
+                     shared by any number of instances. Needs the optional ``boto3``.
+
+Both expose the objects as local files for the code that processes images
+(renditions, the vision model input): ``S3Storage`` keeps a read-through copy
+under ``local_root``. Stored images are content-addressed, so a cached copy is
+never stale and the cache directory can be deleted at any time.
+
+Browsers read S3 objects directly: ``read_url`` returns a presigned GET URL (or a
+URL under S3_PUBLIC_URL for a public bucket / CDN) that /uploads redirects to.
+"""
+
+import os
+import logging
+import mimetypes
+import tempfile
+from pathlib import Path
+from urllib.parse import quote
+
+log = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable" # Stored upload keys never change content
+_MISSING_CODES = {'404', 'NoSuchKey', 'NotFound'}
+_PRECONDITION_CODES = {'412', 'PreconditionFailed', 'ConditionalRequestConflict'}
+
+
+class PreconditionFailed(Exception):
+    """A conditional write lost: the object changed (or exists) since it was read."""
+
+
+class LocalStorage:
+    """Objects are plain files under ``root``; keys are paths relative to it."""
+
+    name = "local"
+    shared = False # Other app instances can't see these files
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.local_root = self.root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def publish(self, key: str, content_type: str | None = None) -> None:
+        """Makes the file written at ``local_root/key`` available to every instance (here: nothing to do)."""
+
+    def exists(self, key: str) -> bool:
+        return (self.root / key).is_file()
+
+    def delete(self, key: str) -> None:
+        (self.root / key).unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> Path:
+        """Local file holding the object. Raises FileNotFoundError if there is none."""
+        path = self.root / key
+        if not path.is_file():
+            raise FileNotFoundError(key)
+        return path
+
+    def read_url(self, key: str) -> str | None:
+        """Direct URL for browsers, or None: the app serves the file itself."""
+        return None
+
+
+class S3Storage:
+    """Objects under ``prefix`` in an S3-compatible bucket, with a local read-through copy."""
+
+    name = "s3"
+    shared = True
+
+    def __init__(self, client_factory, bucket: str, prefix: str = '', local_root: Path | None = None,
+                 url_expires_seconds: int = 3600, public_base_url: str | None = None):
+        self.client_factory = client_factory
+        self._client = None
+        self._client_pid = None
+        self.bucket = bucket
+        self.prefix = prefix
+        self.local_root = Path(local_root) if local_root else None
+        self.url_expires_seconds = url_expires_seconds
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        # Browsers may cache the redirect to a presigned URL for half its lifetime
+        self.read_url_max_age = 365 * 24 * 3600 if self.public_base_url else url_expires_seconds // 2
+        if self.local_root:
+            self.local_root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def client(self):
+        # One client per process: connection pools must not be shared across a gunicorn fork
+        if self._client_pid != os.getpid():
+            self._client = self.client_factory()
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _error_code(error) -> str:
+        return str(error.response.get('Error', {}).get('Code', ''))
+
+    # --- Files (images) ---
+    def publish(self, key: str, content_type: str | None = None) -> None:
+        """Uploads the file written at ``local_root/key`` (it stays there as the cached copy)."""
+        self.client.upload_file(
+            str(self.local_root / key), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type or mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                       "CacheControl": IMMUTABLE_CACHE_CONTROL})
+
+    def exists(self, key: str) -> bool:
+        return self.head_etag(key) is not None
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        if self.local_root:
+            (self.local_root / key).unlink(missing_ok=True)
+
+    def local_path(self, key: str) -> Path:
+        """Cached local copy of the object, downloaded on first use. Raises FileNotFoundError if missing."""
+        from botocore.exceptions import ClientError # boto3 is imported on first use (see s3_client_factory)
+
+        path = self.local_root / key
+        if path.is_file():
+            return path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix='.' + path.name + '.', dir=path.parent)
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), tmp_path)
+            os.replace(tmp_path, path) # Concurrent downloads of the same key write identical bytes
+        except ClientError as e:
+            Path(tmp_path).unlink(missing_ok=True)
+            if self._error_code(e) in _MISSING_CODES:
+                raise FileNotFoundError(key) from e
+            raise
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return path
+
+    def read_url(self, key: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url}/{quote(self._key(key))}"
+        # Signed locally (no request to the store)
+        return self.client.generate_presigned_url(
+            'get_object', Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=self.url_expires_seconds)
+
+    # --- Small objects (metadata) ---
+    def head_etag(self, key: str) -> str | None:
+        """ETag of the object, or None if it doesn't exist."""
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ETag"]
+        except ClientError as e:
+            if self._error_code(e) in _MISSING_CODES:
+                return None
+            raise
+
+    def get_bytes(self, key: str) -> tuple[bytes, str]:
+        """Returns (content, ETag). Raises FileNotFoundError if missing."""
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._error_code(e) in _MISSING_CODES:
+                raise FileNotFoundError(key) from e
+            raise
+        return response["Body"].read(), response["ETag"]
+
+    def put_bytes(self, key: str, data: bytes, content_type: str = 'application/json',
+                  if_match: str | None = None, if_none_match: bool = False) -> str:
+        """
+        Writes an object and returns its new ETag. ``if_match`` (an ETag) / ``if_none_match``
+        make the write conditional; a lost race raises PreconditionFailed.
+        """
+        from botocore.exceptions import ClientError
+
+        kwargs = {"Bucket": self.bucket, "Key": self._key(key), "Body": data, "ContentType": content_type}
+        if if_match:
+            kwargs["IfMatch"] = if_match
+        if if_none_match:
+            kwargs["IfNoneMatch"] = '*'
+        try:
+            return self.client.put_object(**kwargs)["ETag"]
+        except ClientError as e:
+            if self._error_code(e) in _PRECONDITION_CODES:
+                raise PreconditionFailed(key) from e
+            raise
+
+    def list_etags(self, prefix: str = '') -> dict:
+        """{key (without this storage's prefix): ETag} of all objects under ``prefix``."""
+        etags = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get("Contents", []):
+                etags[item["Key"][len(self.prefix):]] = item["ETag"]
+        return etags
+
+
+# --- Factory ---
+def s3_client_factory(endpoint_url: str | None = None, region: str | None = None, max_pool_connections: int = 20):
+    """Returns a function creating boto3 S3 clients; credentials come from the usual AWS_* variables / files."""
+    # Optional, and imported only here: boto3 takes a few hundred ms to import, which
+    # workers of the (default) local backend shouldn't pay
+    try:
+        import boto3
+        from botocore.config import Config as BotoConfig
+    except ImportError:
+        raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+    config = BotoConfig(signature_version='s3v4', max_pool_connections=max_pool_connections,
+                        retries={"max_attempts": 4, "mode": "standard"})
+    return lambda: boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None, config=config)
+
+
+def open_storage(backend: str, upload_folder: Path, cache_folder: Path, bucket: str | None = None, prefix: str = '',
+                 endpoint_url: str | None = None, region: str | None = None, **s3_options):
+    """Creates the configured upload storage ('local' or 's3'; S3 objects go under ``<prefix>uploads/``)."""
+    backend = (backend or 'local').strip().lower()
+    if backend == 'local':
+        return LocalStorage(upload_folder)
+    if backend == 's3':
+        if not bucket:
+            raise ValueError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Storage(s3_client_factory(endpoint_url, region), bucket, prefix + 'uploads/',
+                         local_root=Path(cache_folder) / 'uploads', **s3_options)
+    raise ValueError(f"Unknown storage backend: {backend!r} (expected 'local' or 's3')")
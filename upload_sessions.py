@@ -0,0 +1,211 @@
+# LHTL/upload_sessions.py
+"""
+Resumable, chunked uploads of a work's images (scorecard + comic).
+
+A session is a directory ``<root>/<session id>/`` holding ``session.json`` (the work's
+text fields and the announced image sizes) and one ``<part>.part`` file per image.
+Chunks are appended straight to the part file; the current offset is simply the
+file size, so after a dropped connection the client asks for the offset and
+continues from there. Bytes of a half-received chunk are kept.
+
+Each append holds an fcntl lock on the part file, so two workers can't interleave
+writes to the same image. The image is only verified and stored when the session
+is finalized (see /upload/sessions in app.py); finalized sessions keep their
+record (not the parts) so a retried finalize answers with the same work.
+
+Sessions untouched for ``ttl_seconds`` are deleted by ``purge_expired``.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl # POSIX only; without it concurrent appends to one part are not guarded
+except ImportError: # pragma: no cover - Windows dev machines
+    fcntl = None
+
+from works_store import utc_now_iso
+
+log = logging.getLogger(__name__)
+
+SESSION_FILE = 'session.json'
+FINALIZE_LOCK_FILE = '.finalize.lock'
+_SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+class UploadSessionNotFound(Exception):
+    """Unknown, expired or malformed session id / part name."""
+
+
+class UploadConflict(Exception):
+    """The chunk doesn't start at the current offset, or another request is writing the part."""
+
+    def __init__(self, message: str, offset: int | None = None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadTooLarge(Exception):
+    """More bytes than the size announced when the session was created."""
+
+
+class UploadSessionStore:
+    """File-backed upload sessions under ``root`` (shared by all gunicorn workers)."""
+
+    def __init__(self, root: Path, parts: tuple = ("scorecard", "comic"), ttl_seconds: int = 24 * 3600,
+                 chunk_size: int = 256 * 1024):
+        self.root = Path(root)
+        self.parts = parts
+        self.ttl_seconds = ttl_seconds
+        self.chunk_size = chunk_size
+        self._last_purge = 0.0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _session_dir(self, session_id: str) -> Path:
+        if not isinstance(session_id, str) or not _SESSION_ID_PATTERN.fullmatch(session_id):
+            raise UploadSessionNotFound(session_id)
+        return self.root / session_id
+
+    def part_path(self, session_id: str, part: str) -> Path:
+        if part not in self.parts:
+            raise UploadSessionNotFound(f"{session_id}/{part}")
+        return self._session_dir(session_id) / f"{part}.part"
+
+    def _write_record(self, session_dir: Path, record: dict):
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix='.session.', dir=session_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, session_dir / SESSION_FILE)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def create(self, fields: dict, sizes: dict) -> dict:
+        """Starts a session for images of the given byte sizes ({part: size}); returns its record."""
+        self.purge_expired()
+        session_id = uuid.uuid4().hex
+        session_dir = self.root / session_id
+        session_dir.mkdir()
+        record = {"id": session_id, "createdAt": utc_now_iso(), "fields": fields,
+                  "sizes": {part: int(sizes[part]) for part in self.parts}, "workId": None}
+        for part in self.parts:
+            (session_dir / f"{part}.part").touch()
+        self._write_record(session_dir, record)
+        return record
+
+    def get(self, session_id: str) -> dict:
+        """The session record plus the current offset of every part ({"offsets": {part: bytes}})."""
+        session_dir = self._session_dir(session_id)
+        try:
+            with open(session_dir / SESSION_FILE, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            raise UploadSessionNotFound(session_id)
+        offsets = {}
+        for part in self.parts:
+            try:
+                offsets[part] = (session_dir / f"{part}.part").stat().st_size
+            except FileNotFoundError: # Finalized: the parts are in the blob store now
+                offsets[part] = record["sizes"][part]
+        record["offsets"] = offsets
+        record["complete"] = offsets == record["sizes"]
+        return record
+
+    def append(self, session_id: str, part: str, offset: int, stream) -> int:
+        """
+        Appends the bytes of ``stream`` to a part, which must currently be ``offset`` bytes
+        long. Returns the new offset. If the stream breaks off, what arrived is kept.
+        """
+        path = self.part_path(session_id, part)
+        record = self.get(session_id)
+        if record["workId"]:
+            raise UploadConflict("Session is already finalized", offset=record["sizes"][part])
+        with open(path, 'r+b') as f:
+            if fcntl:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadConflict(f"Another request is uploading {part}")
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadConflict(f"Offset {offset} != current offset {current}", offset=current)
+            remaining = record["sizes"][part] - current
+            f.seek(current)
+            written = 0
+            try:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b''):
+                    if written + len(chunk) > remaining:
+                        f.truncate(current) # Reject the whole chunk
+                        raise UploadTooLarge(f"{part} is larger than the announced {record['sizes'][part]} bytes")
+                    f.write(chunk)
+                    written += len(chunk)
+            finally:
+                f.flush()
+        return current + written
+
+    @contextmanager
+    def finalizing(self, session_id: str):
+        """
+        Yields the session record (as get()) while holding the session's finalize lock:
+        a concurrent finalize of the same session (double click, retry) gets UploadConflict.
+        """
+        session_dir = self._session_dir(session_id)
+        try:
+            fd = os.open(session_dir / FINALIZE_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(session_id)
+        try:
+            if fcntl:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise UploadConflict("Session is being finalized")
+            yield self.get(session_id)
+        finally:
+            os.close(fd)
+
+    def mark_finalized(self, session_id: str, work_id: str):
+        """Records the created work and drops the part files (a retried finalize returns the work)."""
+        session_dir = self._session_dir(session_id)
+        record = self.get(session_id)
+        record.pop("offsets")
+        record.pop("complete")
+        record.update(workId=work_id, finalizedAt=utc_now_iso())
+        self._write_record(session_dir, record)
+        for part in self.parts:
+            (session_dir / f"{part}.part").unlink(missing_ok=True)
+
+    def delete(self, session_id: str):
+        """Deletes a session and what was received. Raises UploadSessionNotFound if there is none."""
+        session_dir = self._session_dir(session_id)
+        if not (session_dir / SESSION_FILE).is_file():
+            raise UploadSessionNotFound(session_id)
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+    def purge_expired(self, force: bool = False) -> int:
+        """Deletes sessions with no activity for ttl_seconds (at most once a minute unless forced)."""
+        now = time.time()
+        if not force and now - self._last_purge < 60:
+            return 0
+        self._last_purge = now
+        purged = 0
+        for session_dir in self.root.iterdir():
+            try:
+                last_activity = max(p.stat().st_mtime for p in (session_dir, *session_dir.iterdir()))
+            except (OSError, ValueError):
+                continue
+            if now - last_activity > self.ttl_seconds:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                purged += 1
+        if purged:
+            log.info(f"Purged {purged} abandoned upload sessions.")
+        return purged
@@ -0,0 +1,532 @@
+# LHTL/works_store.py
+"""
+Storage backends for the works metadata (author, texts, image filenames).
+
+Three interchangeable backends are provided:
+
+* ``SQLiteWorksStore``    - one row per work in a WAL-mode SQLite database.
+                            Inserts are O(1) transactions, readers never block writers.
+* ``JsonLinesWorksStore`` - append-only JSON-lines log. Each upload appends one line;
+                            the log is compacted periodically (superseded / broken lines dropped).
+* ``ObjectWorksStore``    - one JSON object per work in an S3-compatible bucket
+                            (storage.S3Storage), shared by several app instances.
+
+All are safe to use from several gunicorn workers at once and replace the old
+"load whole works_data.json, append, rewrite whole file" approach.
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import fcntl # POSIX only; used for cross-process locking of the JSON-lines log
+except ImportError: # pragma: no cover - Windows dev machines
+    fcntl = None
+
+from storage import PreconditionFailed
+
+log = logging.getLogger(__name__)
+
+
+REQUIRED_WORK_KEYS = ("id", "author", "currentHabits", "reflection", "scorecardFilename", "comicFilename")
+
+
+def utc_now_iso():
+    """Returns the current UTC time as an ISO-8601 string (used for createdAt)."""
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class WorksStore:
+    """Interface shared by all works metadata backends."""
+
+    name = "base"
+
+    def add_work(self, entry: dict) -> None:
+        """Appends a single work entry. Must be O(1) with respect to the number of works."""
+        raise NotImplementedError
+
+    def update_work(self, work_id: str, fields: dict) -> bool:
+        """Merges ``fields`` into an existing work entry. Returns False if the work doesn't exist."""
+        raise NotImplementedError
+
+    def get_work(self, work_id: str) -> dict | None:
+        """Returns the work entry with the given id, or None."""
+        raise NotImplementedError
+
+    def list_works(self) -> list[dict]:
+        """Returns all work entries in upload order (oldest first)."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Returns the number of stored works."""
+        raise NotImplementedError
+
+    def generation(self) -> str:
+        """
+        Returns an opaque token that changes whenever the stored data changes
+        (in this process or any other worker). Must be cheap to call.
+        """
+        raise NotImplementedError
+
+    def import_works(self, entries: list[dict]) -> list[str]:
+        """Bulk-inserts entries (skipping ids that already exist). Returns the ids inserted."""
+        inserted = []
+        for entry in entries:
+            if self.get_work(entry["id"]) is None:
+                self.add_work(entry)
+                inserted.append(entry["id"])
+        return inserted
+
+
+# --- SQLite backend ---
+class SQLiteWorksStore(WorksStore):
+    """Works store backed by a SQLite database in WAL mode."""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connect(self):
+        # One connection per thread (and per process: re-open after a gunicorn fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None) # autocommit; explicit BEGIN below
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer and vice versa
+        conn.execute("PRAGMA synchronous=NORMAL") # Durable enough with WAL, much faster than FULL
+        conn.execute("PRAGMA busy_timeout=30000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write_transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE") # Take the write lock up front to avoid upgrade deadlocks
+        try:
+            yield conn
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS works (
+                seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+                id         TEXT NOT NULL UNIQUE,
+                created_at TEXT NOT NULL,
+                data       TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+        """)
+
+    @staticmethod
+    def _row_to_work(row):
+        work = json.loads(row["data"])
+        if row["created_at"]:
+            work.setdefault("createdAt", row["created_at"])
+        return work
+
+    def add_work(self, entry):
+        with self._write_transaction() as conn:
+            conn.execute(
+                "INSERT INTO works (id, created_at, data) VALUES (?, ?, ?)",
+                (entry["id"], entry.get("createdAt") or utc_now_iso(), json.dumps(entry, ensure_ascii=False))
+            )
+
+    def update_work(self, work_id, fields):
+        with self._write_transaction() as conn:
+            row = conn.execute("SELECT data FROM works WHERE id = ?", (work_id,)).fetchone()
+            if row is None:
+                return False
+            work = json.loads(row["data"])
+            work.update(fields)
+            conn.execute("UPDATE works SET data = ? WHERE id = ?", (json.dumps(work, ensure_ascii=False), work_id))
+        return True
+
+    def import_works(self, entries):
+        inserted = []
+        with self._write_transaction() as conn:
+            for entry in entries:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO works (id, created_at, data) VALUES (?, ?, ?)",
+                    (entry["id"], entry.get("createdAt") or "", json.dumps(entry, ensure_ascii=False))
+                )
+                if cur.rowcount:
+                    inserted.append(entry["id"])
+        return inserted
+
+    def get_work(self, work_id):
+        row = self._connect().execute("SELECT created_at, data FROM works WHERE id = ?", (work_id,)).fetchone()
+        return self._row_to_work(row) if row else None
+
+    def list_works(self):
+        rows = self._connect().execute("SELECT created_at, data FROM works ORDER BY seq").fetchall()
+        return [self._row_to_work(row) for row in rows]
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM works").fetchone()[0]
+
+    def generation(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return f"sqlite-{row[0] if row else 0}"
+
+
+# --- JSON-lines backend ---
+class JsonLinesWorksStore(WorksStore):
+    """
+    Append-only JSON-lines works store.
+
+    Every write appends one complete work object as a single line. A later line with
+    the same id supersedes an earlier one. Once the log holds more than
+    ``compact_ratio`` times as many lines as live works, it is rewritten (compacted).
+    """
+
+    name = "jsonl"
+
+    def __init__(self, log_path: Path, compact_min_lines: int = 200, compact_ratio: float = 1.5):
+        self.log_path = Path(log_path)
+        self.lock_path = self.log_path.with_name(self.log_path.name + '.lock')
+        self.compact_min_lines = compact_min_lines
+        self.compact_ratio = compact_ratio
+        self._appends_since_check = 0 # Only re-scan the log for compaction every compact_min_lines appends
+        self.log_path.touch(exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive=True):
+        """Cross-process lock around the log (no-op where fcntl is unavailable)."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a+') as lock_f:
+            fcntl.flock(lock_f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_f, fcntl.LOCK_UN)
+
+    def _read_log(self):
+        """Returns (works_by_id in first-seen order, total_line_count)."""
+        works = {}
+        line_count = 0
+        try:
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    line_count += 1
+                    try:
+                        work = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn trailing line from a crash; dropped on next compaction
+                        log.warning(f"Skipping corrupt line in {self.log_path.name}")
+                        continue
+                    if isinstance(work, dict) and work.get("id"):
+                        works[work["id"]] = work
+        except FileNotFoundError:
+            pass
+        return works, line_count
+
+    def _append_lines(self, entries):
+        payload = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries).encode('utf-8')
+        # O_APPEND + a single write() keeps each batch contiguous in the log
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def add_work(self, entry):
+        entry = dict(entry)
+        entry.setdefault("createdAt", utc_now_iso())
+        with self._locked():
+            self._append_lines([entry])
+        self._maybe_compact()
+
+    def update_work(self, work_id, fields):
+        # Append the merged record; it supersedes the earlier line on read / compaction
+        with self._locked():
+            work = self._read_log()[0].get(work_id)
+            if work is None:
+                return False
+            work.update(fields)
+            self._append_lines([work])
+        self._maybe_compact()
+        return True
+
+    def import_works(self, entries):
+        with self._locked():
+            existing, _ = self._read_log()
+            new_entries = []
+            for entry in entries: # First copy of an id wins, like INSERT OR IGNORE
+                if entry["id"] not in existing:
+                    existing[entry["id"]] = entry
+                    new_entries.append(entry)
+            if new_entries:
+                self._append_lines(new_entries)
+        return [e["id"] for e in new_entries]
+
+    def get_work(self, work_id):
+        return self._read_log()[0].get(work_id)
+
+    def list_works(self):
+        return list(self._read_log()[0].values())
+
+    def count(self):
+        return len(self._read_log()[0])
+
+    def generation(self):
+        try:
+            st = self.log_path.stat()
+        except FileNotFoundError:
+            return "jsonl-missing"
+        # Compaction replaces the file (new inode); appends change size/mtime
+        return f"jsonl-{st.st_ino}-{st.st_size}-{st.st_mtime_ns}"
+
+    def _maybe_compact(self):
+        self._appends_since_check += 1
+        if self._appends_since_check < self.compact_min_lines:
+            return
+        self._appends_since_check = 0
+        works, line_count = self._read_log()
+        if line_count < self.compact_min_lines or line_count <= len(works) * self.compact_ratio:
+            return
+        self.compact()
+
+    def compact(self):
+        """Rewrites the log keeping only the latest record of each work."""
+        with self._locked():
+            works, line_count = self._read_log()
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=self.log_path.name + '.', dir=self.log_path.parent)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    for work in works.values():
+                        f.write(json.dumps(work, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.log_path)
+            except Exception:
+                Path(tmp_path).unlink(missing_ok=True)
+                raise
+        log.info(f"Compacted {self.log_path.name}: {line_count} lines -> {len(works)} works.")
+
+
+# --- Object store backend ---
+class ObjectWorksStore(WorksStore):
+    """
+    One JSON object per work (``items/<id>.json``) in a shared object store.
+
+    Updates are read-modify-write cycles guarded by the object's ETag (conditional
+    PUT), so two instances updating the same work (renditions, analysis) don't lose
+    each other's fields. Every write also replaces a tiny marker object;
+    ``generation`` is the marker's ETag, re-checked at most every ``generation_ttl``
+    seconds, so other instances' writes show up after at most that delay.
+    ``list_works`` keeps the parsed works per process and only downloads the objects
+    whose ETag changed since its last listing.
+
+    Objects have no insertion order, so works are listed by createdAt. Imported works
+    without one (legacy works_data.json entries) get ``IMPORT_ORDER_FIELD``, a sort key
+    kept in the object only, so they stay in their file order like in the other backends.
+    """
+
+    name = "s3"
+    ITEMS_PREFIX = 'items/'
+    IMPORT_ORDER_FIELD = '_importOrder'
+    GENERATION_KEY = 'generation'
+    MAX_UPDATE_ATTEMPTS = 5
+
+    def __init__(self, storage, generation_ttl: float = 2.0, fetch_workers: int = 8):
+        self.storage = storage
+        self.generation_ttl = generation_ttl
+        self.fetch_workers = fetch_workers
+        self._generation = None
+        self._generation_checked = 0.0
+        self._listing_lock = threading.Lock()
+        self._listed = {} # key -> (ETag, work) as of the last list_works()
+
+    def _item_key(self, work_id: str) -> str | None:
+        if not isinstance(work_id, str) or not work_id or '/' in work_id:
+            return None
+        return f"{self.ITEMS_PREFIX}{work_id}.json"
+
+    @staticmethod
+    def _dump(work: dict) -> bytes:
+        return json.dumps(work, ensure_ascii=False).encode('utf-8')
+
+    def _bump_generation(self):
+        etag = self.storage.put_bytes(self.GENERATION_KEY, uuid.uuid4().hex.encode('ascii'), content_type='text/plain')
+        self._generation, self._generation_checked = etag, time.monotonic() # Own writes are visible at once
+
+    def add_work(self, entry):
+        entry = dict(entry)
+        entry.setdefault("createdAt", utc_now_iso())
+        self.storage.put_bytes(self._item_key(entry["id"]), self._dump(entry), if_none_match=True)
+        self._bump_generation()
+
+    def update_work(self, work_id, fields):
+        key = self._item_key(work_id)
+        if key is None:
+            return False
+        for _ in range(self.MAX_UPDATE_ATTEMPTS):
+            try:
+                data, etag = self.storage.get_bytes(key)
+            except FileNotFoundError:
+                return False
+            work = json.loads(data)
+            work.update(fields)
+            try:
+                self.storage.put_bytes(key, self._dump(work), if_match=etag)
+                break
+            except PreconditionFailed: # Updated elsewhere since we read it: merge into the newer copy
+                continue
+        else:
+            raise PreconditionFailed(f"Work {work_id} kept changing; update not applied")
+        self._bump_generation()
+        return True
+
+    def import_works(self, entries):
+        batch = f"{time.time_ns():020d}" # Later imports sort after earlier ones
+        entries = [entry if entry.get("createdAt") else {**entry, self.IMPORT_ORDER_FIELD: f"{batch}-{index:09d}"}
+                   for index, entry in enumerate(entries)]
+
+        def insert(entry):
+            try:
+                self.storage.put_bytes(self._item_key(entry["id"]), self._dump(entry), if_none_match=True)
+                return True
+            except PreconditionFailed: # Already stored
+                return False
+        with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+            inserted = [entry["id"] for entry, stored in zip(entries, executor.map(insert, entries)) if stored]
+        if inserted:
+            self._bump_generation()
+        return inserted
+
+    def get_work(self, work_id):
+        key = self._item_key(work_id)
+        if key is None:
+            return None
+        try:
+            work = json.loads(self.storage.get_bytes(key)[0])
+        except FileNotFoundError:
+            return None
+        work.pop(self.IMPORT_ORDER_FIELD, None)
+        return work
+
+    def _fetch(self, key):
+        try:
+            return json.loads(self.storage.get_bytes(key)[0])
+        except FileNotFoundError: # Deleted between listing and download
+            return None
+        except json.JSONDecodeError:
+            log.warning(f"Skipping corrupt works object {key}")
+            return None
+
+    def list_works(self):
+        etags = self.storage.list_etags(self.ITEMS_PREFIX)
+        with self._listing_lock:
+            changed = [key for key, etag in etags.items() if self._listed.get(key, (None,))[0] != etag]
+            if changed:
+                with ThreadPoolExecutor(max_workers=self.fetch_workers) as executor:
+                    fetched = dict(zip(changed, executor.map(self._fetch, changed)))
+            else:
+                fetched = {}
+            self._listed = {key: (etag, fetched[key] if key in fetched else self._listed[key][1])
+                            for key, etag in etags.items()}
+            works = [dict(work) for _, work in self._listed.values() if isinstance(work, dict) and work.get("id")]
+        # Upload order, oldest first (legacy works without createdAt first, in their file order)
+        works.sort(key=lambda w: (w.get("createdAt") or '', w.get(self.IMPORT_ORDER_FIELD) or '', w["id"]))
+        for work in works:
+            work.pop(self.IMPORT_ORDER_FIELD, None)
+        return works
+
+    def count(self):
+        return len(self.storage.list_etags(self.ITEMS_PREFIX))
+
+    def generation(self):
+        now = time.monotonic()
+        if self._generation is None or now - self._generation_checked >= self.generation_ttl:
+            self._generation = self.storage.head_etag(self.GENERATION_KEY) or 'empty'
+            self._generation_checked = now
+        return f"s3-{self._generation}"
+
+
+# --- Factory & migration ---
+def open_works_store(backend: str, base_dir: Path, object_storage=None) -> WorksStore:
+    """Creates the configured works store ('sqlite', 'jsonl' or 's3', the latter in ``object_storage``)."""
+    backend = (backend or 'sqlite').strip().lower()
+    if backend == 'sqlite':
+        return SQLiteWorksStore(Path(base_dir) / 'works.sqlite3')
+    if backend == 'jsonl':
+        return JsonLinesWorksStore(Path(base_dir) / 'works_data.jsonl')
+    if backend == 's3':
+        if object_storage is None:
+            raise ValueError("The 's3' works store requires STORAGE_BACKEND=s3")
+        return ObjectWorksStore(object_storage)
+    raise ValueError(f"Unknown works store backend: {backend!r} (expected 'sqlite', 'jsonl' or 's3')")
+
+
+def migrate_legacy_json(store: WorksStore, legacy_file: Path) -> int:
+    """
+    One-shot migration of the old works_data.json list into ``store``.
+
+    Entries whose id already exists are skipped, so running this from several
+    workers at once (or twice) is harmless. On success the legacy file is renamed
+    to ``works_data.json.migrated`` so it is not imported again.
+    """
+    legacy_file = Path(legacy_file)
+    if not legacy_file.exists():
+        return 0
+    try:
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            raw = f.read()
+        data = json.loads(raw) if raw.strip() else []
+    except FileNotFoundError: # Another worker migrated it in the meantime
+        return 0
+    except json.JSONDecodeError as e:
+        log.error(f"Cannot migrate {legacy_file.name}: JSON Decode Error - {e}. Leaving it in place.")
+        return 0
+    if not isinstance(data, list):
+        log.error(f"Cannot migrate {legacy_file.name}: data is not a list. Leaving it in place.")
+        return 0
+
+    valid_entries = [e for e in data if isinstance(e, dict) and all(k in e for k in REQUIRED_WORK_KEYS)]
+    skipped = len(data) - len(valid_entries)
+    inserted = len(store.import_works(valid_entries))
+    try:
+        legacy_file.rename(legacy_file.with_name(legacy_file.name + '.migrated'))
+    except FileNotFoundError:
+        pass
+    log.info(f"Migrated {inserted} works from {legacy_file.name} into the {store.name} store"
+             f"{f' (skipped {skipped} invalid entries)' if skipped else ''}.")
+    return inserted
+
+
+if __name__ == '__main__':
+    # Manual one-shot migration: python works_store.py [sqlite|jsonl]
+    import sys
+    _base_dir = Path(__file__).resolve().parent
+    _store = open_works_store(sys.argv[1] if len(sys.argv) > 1 else os.getenv('WORKS_STORE_BACKEND', 'sqlite'), _base_dir)
+    migrate_legacy_json(_store, _base_dir / 'works_data.json')
+    print(f"INFO: {_store.name} store now holds {_store.count()} works.")